@@ -0,0 +1,33 @@
+import gzip
+import io
+import os
+import shutil
+from typing import BinaryIO
+
+# Compression level of the XML's stored in the database, from 1 (fastest) to 9 (smallest).
+XML_COMPRESSION_LEVEL = int(os.environ.get("XML_COMPRESSION_LEVEL", 6))
+
+
+def compress_file(f: BinaryIO) -> bytes:
+    """
+    Compresses a file chunk by chunk, such that it doesn't have to be read in memory first.
+    """
+
+    with io.BytesIO() as buffer:
+        with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=XML_COMPRESSION_LEVEL, mtime=0) as f_gzip:
+            shutil.copyfileobj(f, f_gzip)
+
+        return buffer.getvalue()
+
+
+def open_decompressed(data: bytes) -> BinaryIO:
+    """
+    Returns:
+        File that is decompressed while it is read, e.g. by a XML parser.
+    """
+
+    return gzip.GzipFile(fileobj=io.BytesIO(data), mode='rb')
+
+
+def decompress(data: bytes) -> bytes:
+    return gzip.decompress(data)
@@ -1,6 +1,8 @@
 import datetime
+from typing import List
 
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, exists, or_
+from sqlalchemy.orm import Session, aliased
 
 from . import models, schemas
 
@@ -13,27 +15,297 @@ def get_xml_by_etranslation_id(db: Session, etranslation_id: str):
     return db.query(models.XMLTrans).filter(models.XMLTrans.etranslation_id == etranslation_id).first()
 
 
+def get_xml_by_content_hash(db: Session, content_hash: str):
+    """
+    Returns:
+        The most recent submission with the same content hash, that didn't fail.
+    """
+    return db.query(models.XMLTrans).filter(models.XMLTrans.content_hash == content_hash,
+                                            models.XMLTrans.state != models.JOB_FAILED) \
+        .order_by(models.XMLTrans.id.desc()).first()
+
+
 def get_xmls_trans(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.XMLTrans).offset(skip).limit(limit).all()
 
 
 def create_xml_trans(db: Session,
                      xml_trans: schemas.XMLTransCreate):
-    db_xml_trans = models.XMLTrans(etranslation_id=xml_trans.etranslation_id,
-                                   xml_content=xml_trans.xml_content,
-                                   filename=xml_trans.filename,
-                                   source=xml_trans.source,
-                                   target=xml_trans.target,
-                                   use_tm=xml_trans.use_tm,
-                                   created=datetime.datetime.now(),
-                                   xml_document_id=xml_trans.xml_document_id
-                                   )
+    db_xml_trans = _get_db_xml_trans(xml_trans)
     db.add(db_xml_trans)
     db.commit()
     db.refresh(db_xml_trans)
     return db_xml_trans
 
 
+def create_xml_trans_list(db: Session,
+                          xml_trans_list: List[schemas.XMLTransCreate]):
+    """
+    In a single transaction, such that they are picked up together by the job workers.
+    """
+    db_xml_trans_list = list(map(_get_db_xml_trans, xml_trans_list))
+    db.add_all(db_xml_trans_list)
+    db.commit()
+    for db_xml_trans in db_xml_trans_list:
+        db.refresh(db_xml_trans)
+    return db_xml_trans_list
+
+
+def _get_db_xml_trans(xml_trans: schemas.XMLTransCreate) -> models.XMLTrans:
+    return models.XMLTrans(etranslation_id=xml_trans.etranslation_id,
+                           xml_content=xml_trans.xml_content,
+                           filename=xml_trans.filename,
+                           source=xml_trans.source,
+                           target=xml_trans.target,
+                           use_tm=xml_trans.use_tm,
+                           created=datetime.datetime.now(),
+                           xml_document_id=xml_trans.xml_document_id,
+                           xml_group_id=xml_trans.xml_group_id,
+                           xml_batch_id=xml_trans.xml_batch_id,
+                           content_hash=xml_trans.content_hash
+                           )
+
+
+def update_xml_trans_translated(db: Session,
+                                db_xml_trans: models.XMLTrans,
+                                xml_trans_content: bytes):
+    db_xml_trans.xml_trans_content = xml_trans_content
+    db_xml_trans.is_translated = True
+    db_xml_trans.finished = datetime.datetime.now()
+    db_xml_trans.state = models.JOB_ASSEMBLED
+    db.commit()
+    db.refresh(db_xml_trans)
+    return db_xml_trans
+
+
+def get_xml_trans_jobs_due(db: Session, state: str, limit: int = 1, xml_batch_id: int = None):
+    """
+    Jobs in the given state that can be picked up by a worker, oldest first.
+    """
+    now = datetime.datetime.now()
+    query = db.query(models.XMLTrans) \
+        .filter(models.XMLTrans.state == state,
+                or_(models.XMLTrans.due.is_(None), models.XMLTrans.due <= now))
+    if xml_batch_id is not None:
+        query = query.filter(models.XMLTrans.xml_batch_id == xml_batch_id)
+    return query.order_by(models.XMLTrans.id).limit(limit).all()
+
+
+def get_xml_groups_assembled(db: Session, limit: int = 1):
+    """
+    Groups of which the translation to every target language is assembled, and can be picked up by a worker.
+    """
+    now = datetime.datetime.now()
+    other = aliased(models.XMLTrans)
+    return db.query(models.XMLTransGroup) \
+        .filter(exists().where(and_(models.XMLTrans.xml_group_id == models.XMLTransGroup.id,
+                                    models.XMLTrans.state == models.JOB_ASSEMBLED,
+                                    or_(models.XMLTrans.due.is_(None), models.XMLTrans.due <= now))),
+                ~exists().where(and_(other.xml_group_id == models.XMLTransGroup.id,
+                                     other.state != models.JOB_ASSEMBLED))) \
+        .order_by(models.XMLTransGroup.id).limit(limit).all()
+
+
+def claim_xml_trans_jobs(db: Session,
+                         db_xml_trans_list: List[models.XMLTrans],
+                         lease: float) -> bool:
+    """
+    Atomically claims the jobs for a worker, until the lease (in seconds) expires.
+
+    Returns:
+        False if any of the jobs was claimed by another worker or changed state in the meantime.
+    """
+    now = datetime.datetime.now()
+    n = 0
+    for state in {db_xml_trans.state for db_xml_trans in db_xml_trans_list}:
+        ids = [db_xml_trans.id for db_xml_trans in db_xml_trans_list if db_xml_trans.state == state]
+        n += db.query(models.XMLTrans) \
+            .filter(models.XMLTrans.id.in_(ids),
+                    models.XMLTrans.state == state,
+                    or_(models.XMLTrans.due.is_(None), models.XMLTrans.due <= now)) \
+            .update({models.XMLTrans.due: now + datetime.timedelta(seconds=lease)}, synchronize_session=False)
+    if n != len(db_xml_trans_list):
+        # All or nothing.
+        db.rollback()
+        return False
+    db.commit()
+    for db_xml_trans in db_xml_trans_list:
+        db.refresh(db_xml_trans)
+    return True
+
+
+def update_xml_trans_jobs_state(db: Session,
+                                db_xml_trans_list: List[models.XMLTrans],
+                                state: str,
+                                delay: float = None):
+    """
+    Moves the jobs to the next state, or reschedules them after delay (in seconds) to retry the same state,
+    e.g. to poll a translation that isn't finished yet.
+    Both are a successful attempt, only consecutive failed attempts are counted, see fail_xml_trans_jobs.
+    """
+    due = None if delay is None else datetime.datetime.now() + datetime.timedelta(seconds=delay)
+    for db_xml_trans in db_xml_trans_list:
+        db_xml_trans.attempts = 0
+        db_xml_trans.state = state
+        db_xml_trans.due = due
+    db.commit()
+    return db_xml_trans_list
+
+
+def fail_xml_trans_jobs(db: Session,
+                        db_xml_trans_list: List[models.XMLTrans],
+                        error: str,
+                        max_attempts: int,
+                        retry_delay: float):
+    """
+    The jobs are retried after retry_delay (in seconds) times the amount of attempts,
+    until they failed max_attempts times.
+    """
+    for db_xml_trans in db_xml_trans_list:
+        db_xml_trans.attempts = (db_xml_trans.attempts or 0) + 1
+        db_xml_trans.error = error
+        if db_xml_trans.attempts >= max_attempts:
+            db_xml_trans.state = models.JOB_FAILED
+            db_xml_trans.due = None
+        else:
+            db_xml_trans.due = datetime.datetime.now() + \
+                               datetime.timedelta(seconds=retry_delay * db_xml_trans.attempts)
+    db.commit()
+    return db_xml_trans_list
+
+
+def create_xml_trans_chunks(db: Session,
+                            chunks: List[schemas.XMLTransChunkCreate],
+                            xml_id: int):
+    now = datetime.datetime.now()
+    db_chunks = [models.XMLTransChunk(**chunk.dict(), xml_id=xml_id,
+                                      created=None if chunk.etranslation_id is None else now)
+                 for chunk in chunks]
+    db.add_all(db_chunks)
+    db.commit()
+    return db_chunks
+
+
+def delete_xml_trans_chunks(db: Session,
+                            db_xml_trans: models.XMLTrans):
+    db.query(models.XMLTransChunk).filter(models.XMLTransChunk.xml_id == db_xml_trans.id) \
+        .delete(synchronize_session=False)
+    db.commit()
+    db.expire(db_xml_trans, ['chunks'])
+
+
+def update_xml_trans_chunks_etranslation_id(db: Session,
+                                            db_chunks: List[models.XMLTransChunk],
+                                            etranslation_id: str):
+    """
+    Saves the id of the eTranslation document the chunks were submitted in, as soon as it is accepted.
+    """
+    now = datetime.datetime.now()
+    for db_chunk in db_chunks:
+        db_chunk.etranslation_id = etranslation_id
+        db_chunk.created = now
+    db.commit()
+    return db_chunks
+
+
+def update_xml_trans_chunks_translation(db: Session,
+                                        etranslation_id: str,
+                                        translation: List[str]):
+    """
+    Sets the translation of every chunk that is part of the eTranslation document.
+    """
+    db_chunks = db.query(models.XMLTransChunk).filter(models.XMLTransChunk.etranslation_id == etranslation_id).all()
+    for db_chunk in db_chunks:
+        translation_chunk = translation[db_chunk.offset:db_chunk.offset + db_chunk.n]
+        # Pad missing lines, such that the following chunks stay aligned.
+        db_chunk.translation = translation_chunk + [''] * (db_chunk.n - len(translation_chunk))
+    db.commit()
+    return db_chunks
+
+
+def get_xml_batch_by_content_hashes(db: Session, content_hashes: List[str]):
+    """
+    Returns:
+        The most recent batch of which the pages have the same content hashes, none of which failed.
+    """
+    return _get_by_content_hashes(db, models.XMLTransBatch, models.XMLTrans.xml_batch_id, content_hashes)
+
+
+def get_xml_group_by_content_hashes(db: Session, content_hashes: List[str]):
+    """
+    Returns:
+        The most recent group of which the translations have the same content hashes, none of which failed.
+    """
+    return _get_by_content_hashes(db, models.XMLTransGroup, models.XMLTrans.xml_group_id, content_hashes)
+
+
+def _get_by_content_hashes(db: Session, model, foreign_key, content_hashes: List[str]):
+    """
+    A job belongs to a single group or batch, so only an identical submission as a whole is looked up.
+    """
+    if not content_hashes:
+        return None
+
+    content_hashes = sorted(content_hashes)
+    candidates = db.query(foreign_key).filter(models.XMLTrans.content_hash == content_hashes[0],
+                                              models.XMLTrans.state != models.JOB_FAILED,
+                                              foreign_key.isnot(None)) \
+        .distinct().order_by(foreign_key.desc())
+
+    for (candidate_id,) in candidates:
+        jobs = db.query(models.XMLTrans.content_hash, models.XMLTrans.state).filter(foreign_key == candidate_id).all()
+        if sorted(content_hash for content_hash, _ in jobs) == content_hashes \
+                and all(state != models.JOB_FAILED for _, state in jobs):
+            return db.query(model).filter(model.id == candidate_id).first()
+
+    return None
+
+
+def get_xml_batch(db: Session, batch_id: str):
+    return db.query(models.XMLTransBatch).filter(models.XMLTransBatch.batch_id == batch_id).first()
+
+
+def create_xml_batch(db: Session,
+                     xml_batch: schemas.XMLTransBatchCreate):
+    db_xml_batch = models.XMLTransBatch(batch_id=xml_batch.batch_id,
+                                        source=xml_batch.source,
+                                        target=xml_batch.target,
+                                        created=datetime.datetime.now()
+                                        )
+    db.add(db_xml_batch)
+    db.commit()
+    db.refresh(db_xml_batch)
+    return db_xml_batch
+
+
+def get_xml_group(db: Session, group_id: str):
+    return db.query(models.XMLTransGroup).filter(models.XMLTransGroup.group_id == group_id).first()
+
+
+def create_xml_group(db: Session,
+                     xml_group: schemas.XMLTransGroupCreate):
+    db_xml_group = models.XMLTransGroup(group_id=xml_group.group_id,
+                                        filename=xml_group.filename,
+                                        source=xml_group.source,
+                                        created=datetime.datetime.now()
+                                        )
+    db.add(db_xml_group)
+    db.commit()
+    db.refresh(db_xml_group)
+    return db_xml_group
+
+
+def update_xml_group_translated(db: Session,
+                                db_xml_group: models.XMLTransGroup,
+                                xml_trans_content: bytes):
+    db_xml_group.xml_trans_content = xml_trans_content
+    db_xml_group.is_translated = True
+    db_xml_group.finished = datetime.datetime.now()
+    db.commit()
+    db.refresh(db_xml_group)
+    return db_xml_group
+
+
 def get_document(db: Session, document_id: str):
     return db.query(models.XMLDocument).filter(models.XMLDocument.id == document_id).first()
 
@@ -43,16 +315,44 @@ def get_documents(db: Session, skip: int = 0, limit: int = 100):
 
 
 def create_xml_document(db: Session, xml_document: schemas.XMLDocumentCreate):
-    db_xml_document = models.XMLDocument(
-        source=xml_document.source,
-        target=xml_document.target
-    )
+    db_xml_document = _get_db_xml_document(xml_document)
+    db.add(db_xml_document)
+    db.commit()
+    db.refresh(db_xml_document)
+    return db_xml_document
+
+
+def create_xml_document_with_lines(db: Session,
+                                   xml_document: schemas.XMLDocumentCreate,
+                                   lines: List[schemas.XMLDocumentLineCreate],
+                                   db_xml_trans_list: List[models.XMLTrans] = ()):
+    """
+    In a single transaction: the document, its lines and the link from the translation jobs to the document,
+    such that a job is never linked to a document with missing lines.
+    """
+    db_xml_document = _get_db_xml_document(xml_document)
     db.add(db_xml_document)
+    # Assigns the id of the document.
+    db.flush()
+
+    _insert_xml_document_lines(db, lines, db_xml_document.id)
+
+    for db_xml_trans in db_xml_trans_list:
+        db_xml_trans.xml_document_id = db_xml_document.id
+
     db.commit()
     db.refresh(db_xml_document)
     return db_xml_document
 
 
+def _get_db_xml_document(xml_document: schemas.XMLDocumentCreate) -> models.XMLDocument:
+    return models.XMLDocument(
+        source=xml_document.source,
+        target=xml_document.target,
+        mt_index=xml_document.mt_index
+    )
+
+
 def get_lines(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.XMLDocumentLine).offset(skip).limit(limit).all()
 
@@ -65,3 +365,18 @@ def create_xml_document_line(db: Session, line: schemas.XMLDocumentLineCreate, d
     db.commit()
     db.refresh(db_xml_document_line)
     return db_xml_document_line
+
+
+def create_xml_document_lines(db: Session, lines: List[schemas.XMLDocumentLineCreate], document_id: int):
+    """
+    Batch variant of create_xml_document_line, in a single transaction.
+    The lines aren't loaded back, get them from the relationship of the document.
+    """
+    _insert_xml_document_lines(db, lines, document_id)
+    db.commit()
+
+
+def _insert_xml_document_lines(db: Session, lines: List[schemas.XMLDocumentLineCreate], document_id: int):
+    # A single executemany, without a SELECT of every inserted row.
+    db.bulk_insert_mappings(models.XMLDocumentLine,
+                            [dict(line.dict(), document_id=document_id) for line in lines])
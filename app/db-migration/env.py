@@ -1,7 +1,6 @@
 from logging.config import fileConfig
 
 from alembic import context
-from sqlalchemy import create_engine
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -14,7 +13,7 @@ fileConfig(config.config_file_name)
 # add your model's MetaData object here
 # for 'autogenerate' support
 from app.models import *  # This helps alembic autogeneration
-from app.database import SQLALCHEMY_DATABASE_URL
+from app.database import SQLALCHEMY_DATABASE_URL, create_db_engine
 
 target_metadata = Base.metadata
 
@@ -25,8 +24,8 @@ target_metadata = Base.metadata
 # ... etc.
 
 def get_url():
+    # From the environment, see app.database.
     return SQLALCHEMY_DATABASE_URL
-    # return os.getenv("SQLALCHEMY_DATABASE_URL", "sqlite:///./sql_app.db")
 
 
 def run_migrations_offline():
@@ -67,7 +66,7 @@ def run_migrations_online():
     #     prefix="sqlalchemy.",
     #     poolclass=pool.NullPool,
     # )
-    connectable = create_engine(get_url())
+    connectable = create_db_engine(get_url())
 
     with connectable.connect() as connection:
         context.configure(
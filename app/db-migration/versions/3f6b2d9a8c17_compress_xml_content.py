@@ -0,0 +1,65 @@
+"""Compress XML content
+
+Revision ID: 3f6b2d9a8c17
+Revises: 9b4f1c2e6d80
+Create Date: 2026-10-18 15:12:40.271853
+
+"""
+import gzip
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6b2d9a8c17'
+down_revision = '9b4f1c2e6d80'
+branch_labels = None
+depends_on = None
+
+xml = sa.table('xml',
+               sa.column('id', sa.Integer),
+               sa.column('xml_content', sa.String),
+               sa.column('xml_content_compressed', sa.LargeBinary))
+
+
+def upgrade():
+    with op.batch_alter_table('xml') as batch_op:
+        batch_op.add_column(sa.Column('xml_content_compressed', sa.LargeBinary(), nullable=True))
+
+    # Row by row, such that only a single XML is in memory at a time.
+    conn = op.get_bind()
+    for id_, in conn.execute(sa.select([xml.c.id])).fetchall():
+        xml_content = conn.execute(sa.select([xml.c.xml_content]).where(xml.c.id == id_)).scalar()
+        if xml_content is None:
+            continue
+
+        if isinstance(xml_content, str):
+            xml_content = xml_content.encode('utf-8')
+
+        conn.execute(xml.update().where(xml.c.id == id_).values(
+            xml_content_compressed=gzip.compress(xml_content, compresslevel=6)))
+
+    with op.batch_alter_table('xml') as batch_op:
+        batch_op.drop_column('xml_content')
+        batch_op.alter_column('xml_content_compressed', new_column_name='xml_content')
+
+
+def downgrade():
+    with op.batch_alter_table('xml') as batch_op:
+        batch_op.alter_column('xml_content', new_column_name='xml_content_compressed')
+
+    with op.batch_alter_table('xml') as batch_op:
+        batch_op.add_column(sa.Column('xml_content', sa.String(), nullable=True))
+
+    conn = op.get_bind()
+    for id_, in conn.execute(sa.select([xml.c.id])).fetchall():
+        xml_content = conn.execute(sa.select([xml.c.xml_content_compressed]).where(xml.c.id == id_)).scalar()
+        if xml_content is None:
+            continue
+
+        conn.execute(xml.update().where(xml.c.id == id_).values(
+            xml_content=gzip.decompress(xml_content).decode('utf-8')))
+
+    with op.batch_alter_table('xml') as batch_op:
+        batch_op.drop_column('xml_content_compressed')
@@ -0,0 +1,121 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from prometheus_client import Gauge
+
+from .profiling import PROFILING_ENABLED, profiled
+
+# Threads for the CPU bound XML work: parsing, validation, sentence splitting, reconstruction and serialisation.
+CPU_WORKERS = int(os.environ.get("CPU_WORKERS", os.cpu_count() or 1))
+# Maximum amount of tasks waiting for a thread. Further callers wait on the event loop until there is place.
+CPU_QUEUE_SIZE = int(os.environ.get("CPU_QUEUE_SIZE", 64))
+
+
+class BoundedExecutor:
+    """
+    Runs blocking functions in a dedicated thread pool, apart from the default threadpool of the database calls,
+    such that they neither block the event loop nor starve the other requests.
+
+    At most max_workers tasks run at a time and max_queue tasks wait for a thread.
+    Callers beyond that are suspended (backpressure), instead of piling up work in the pool.
+    """
+
+    def __init__(self,
+                 max_workers: int = CPU_WORKERS,
+                 max_queue: int = CPU_QUEUE_SIZE,
+                 queue_depth_gauge: Gauge = None):
+        """
+        max_workers: amount of threads
+        max_queue: maximum amount of tasks waiting for a thread
+        queue_depth_gauge: set to the queue depth whenever it changes
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.queue_depth_gauge = queue_depth_gauge
+
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='cpu')
+
+        self._lock = threading.Lock()
+        self._running = 0
+        self._queued = 0
+        self._waiting = 0
+
+        # Bound to the event loop, see _get_slots.
+        self._slots = None
+        self._loop = None
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Awaits func(*args, **kwargs) in a thread of the pool.
+        """
+
+        if PROFILING_ENABLED:
+            func = profiled(func)
+
+        slots = self._get_slots()
+
+        with self._lock:
+            self._waiting += 1
+            self._set_gauge()
+        try:
+            await slots.acquire()
+        finally:
+            with self._lock:
+                self._waiting -= 1
+                self._queued += 1
+                self._set_gauge()
+
+        try:
+
+            return await asyncio.get_event_loop().run_in_executor(self._executor,
+                                                                  functools.partial(self._call, func, *args, **kwargs))
+        finally:
+            slots.release()
+
+    def _call(self, func, *args, **kwargs):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._set_gauge()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_event_loop()
+        if self._loop is not loop:
+            self._slots = asyncio.Semaphore(self.max_workers + self.max_queue)
+            self._loop = loop
+
+        return self._slots
+
+    def _set_gauge(self):
+        """
+        Set explicitly, instead of with Gauge.set_function, which isn't exported in prometheus multiprocess mode.
+        Called with the lock held.
+        """
+
+        if self.queue_depth_gauge is not None:
+            self.queue_depth_gauge.set(self._queued + self._waiting)
+
+    def queue_depth(self) -> int:
+        """
+        Amount of tasks that wait for a thread, in the queue of the pool or for place in it.
+        """
+
+        with self._lock:
+            return self._queued + self._waiting
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'workers': self.max_workers,
+                    'max_queue': self.max_queue,
+                    'running': self._running,
+                    'queued': self._queued,
+                    'waiting': self._waiting,
+                    'queue_depth': self._queued + self._waiting}
@@ -1,31 +1,95 @@
+import asyncio
+import datetime
+import hashlib
 import io
+import logging
 import os
-import tempfile
-from itertools import cycle
-from time import sleep
-from typing import List, Optional
-
-from fastapi import Depends, FastAPI, File, Header, Response, UploadFile
+import random
+import re
+import time
+import zipfile
+from typing import BinaryIO, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from fastapi import Depends, FastAPI, File, Header, Request, Response, UploadFile
 from fastapi.responses import JSONResponse
+from lxml import etree
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from starlette.responses import StreamingResponse
 from xml_orm.orm import XLIFFPageXML
 
-from tm.tm_connector import MouseTmConnector
-from translation.connector.cef_etranslation import ETranslationConnector
-from translation.translate_xml import SentenceParser
-from . import crud, models, schemas
+from tm.tm_cache import AsyncCachedTmConnector
+from tm.tm_connector import AsyncMouseTmConnector
+from translation.connector.cef_etranslation import AsyncETranslationConnector, document_to_text_lines, \
+    text_lines_to_document
+from translation.page_stream import PageText, spool_file
+from translation.segment_cache import SegmentCache
+from translation.translate_xml import SentenceParser, normalize_segment
+from . import crud, models, profiling, schemas
+from .compression import compress_file, open_decompressed
 from .database import engine, SessionLocal
+from .executor import BoundedExecutor
+from .metrics import CPU_QUEUE_DEPTH, STAGE_ERRORS, get_langpair, get_metrics, observe_stage, time_stage
 from .models import XMLDocument
+from .profiling import PROFILE_HEADER, PROFILE_ID_HEADER, PROFILING_ENABLED
 from .schemas import XMLDocumentCreate, XMLDocumentLineCreate, XMLTransOut
 
 CEF_LOGIN = os.environ.get("CEF_LOGIN")
 CEF_PASSW = os.environ.get("CEF_PASSW")
 
+# Polling of the blocking endpoint: exponential backoff between the min and max delay (in seconds),
+# until the deadline (in seconds) when the client doesn't supply one.
+BLOCKING_POLL_MIN = float(os.environ.get("BLOCKING_POLL_MIN", 0.5))
+BLOCKING_POLL_MAX = float(os.environ.get("BLOCKING_POLL_MAX", 10))
+BLOCKING_DEADLINE = float(os.environ.get("BLOCKING_DEADLINE", 600))
+# Maximum size in bytes of a document sent to eTranslation. Larger XML's are split in chunks that are translated
+# in parallel, while the XML's of a batch are packed together up to this size.
+MT_DOCUMENT_SIZE = int(os.environ.get("MT_DOCUMENT_SIZE", 100000))
+# Background workers that process the translation jobs, see _job_worker.
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 4))
+# Delay in seconds between polls of eTranslation for a submitted job, and between looks for work of an idle worker.
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 2))
+JOB_IDLE_INTERVAL = float(os.environ.get("JOB_IDLE_INTERVAL", 1))
+# Maximum amount of submitted jobs that are polled together, such that shared eTranslation documents are only
+# retrieved once.
+JOB_POLL_SIZE = int(os.environ.get("JOB_POLL_SIZE", 50))
+# A job claimed by a worker is picked up again after the lease in seconds, in case the worker died.
+JOB_LEASE = float(os.environ.get("JOB_LEASE", 600))
+# A job that raised an error is retried after a linear backoff in seconds, until it failed the maximum attempts.
+JOB_RETRY_DELAY = float(os.environ.get("JOB_RETRY_DELAY", 10))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+# A submitted job fails when eTranslation didn't finish its documents within this time in seconds.
+JOB_MAX_MT_WAIT = float(os.environ.get("JOB_MAX_MT_WAIT", 24 * 3600))
+
 models.Base.metadata.create_all(bind=engine)
 
+# Shared connectors, such that keep-alive connections are reused between requests.
+ETRANSLATION_CONNECTOR = AsyncETranslationConnector(CEF_LOGIN, CEF_PASSW)
+# Lookups are cached, see tm.tm_cache for the configuration.
+MOUSE_CONNECTOR = AsyncCachedTmConnector(AsyncMouseTmConnector())
+
+# Previously machine translated segments, see translation.segment_cache for the configuration.
+MT_CACHE = SegmentCache()
+
+# CPU bound XML work is run apart from the event loop and the database calls, see app.executor for the configuration.
+CPU_EXECUTOR = BoundedExecutor(queue_depth_gauge=CPU_QUEUE_DEPTH)
+
 app = FastAPI()
 
+logger = logging.getLogger(__name__)
+
+
+class InvalidXMLError(ValueError):
+    """
+    An uploaded file is not a well-formed XML.
+    """
+
+# Created on startup, within the event loop of the app.
+_job_worker_tasks = []
+_job_wakeup: Optional[asyncio.Event] = None
+_job_claim_lock: Optional[asyncio.Lock] = None
+
 
 # Dependency
 def get_db():
@@ -43,6 +107,31 @@ if b:
     db.drop_all()
 
 
+@app.exception_handler(InvalidXMLError)
+async def invalid_xml_handler(request: Request, exc: InvalidXMLError):
+    return JSONResponse({'message': str(exc)}, status_code=422)
+
+
+@app.on_event("startup")
+async def startup():
+    global _job_wakeup, _job_claim_lock
+
+    _job_wakeup = asyncio.Event()
+    _job_claim_lock = asyncio.Lock()
+    _job_worker_tasks.extend(asyncio.ensure_future(_job_worker()) for _ in range(JOB_WORKERS))
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    for task in _job_worker_tasks:
+        task.cancel()
+    await asyncio.gather(*_job_worker_tasks, return_exceptions=True)
+    _job_worker_tasks.clear()
+
+    await ETRANSLATION_CONNECTOR.aclose()
+    await MOUSE_CONNECTOR.aclose()
+
+
 @app.get("/")
 async def root():
     return {"message": "FASTAPI for the microservice: translation of layout XML."}
@@ -53,30 +142,49 @@ async def translate_page_xml(file: UploadFile = File(...),
                              source: str = Header(...),
                              target: str = Header(...),
                              use_tm: Optional[bool] = Header(False),
+                             deadline: Optional[float] = Header(None),
+                             force: Optional[bool] = Header(False),
                              db: Session = Depends(get_db),
                              ) -> Response:
     """
+    Waits for the translation job without blocking the event loop.
+    The job is polled with an exponential backoff (with jitter).
 
     Args:
         file: XML in Page or XLIFF-Page format.
+        deadline: Maximum time in seconds to wait for the translation.
+        force: Translate again, even if the same XML was submitted before with the same parameters.
 
     Returns:
-        The XML expanded with a translation
+        The XML expanded with a translation,
+        or a 504 with the id to retrieve the translation later if it isn't finished before the deadline.
     """
 
-    xml = XLIFFPageXML.from_page(file.file, source_lang=source)
+    loop = asyncio.get_event_loop()
+    t_deadline = loop.time() + (BLOCKING_DEADLINE if deadline is None else deadline)
 
-    db_xml_trans = _submit_page_xml_translation(xml, source, target,
-                                                filename=file.filename,
-                                                use_tm=use_tm,
-                                                db=db)
+    db_xml_trans = await _submit_page_xml_translation(file, source, target,
+                                                      use_tm=use_tm,
+                                                      force=force,
+                                                      db=db)
 
+    delay = BLOCKING_POLL_MIN
     while True:
-        r = _read_page_xml_translation(db_xml_trans.etranslation_id, target=target, use_tm=use_tm, db=db)
-        if r.status_code < 300:
+        # A new transaction, to see the progress of the job workers.
+        await run_in_threadpool(db.rollback)
+
+        r = await _read_page_xml_translation(db_xml_trans.etranslation_id, db=db)
+        if r.status_code != 423:
             return r
-        else:
-            sleep(1)  # Time in seconds
+
+        t_remaining = t_deadline - loop.time()
+        if t_remaining <= 0:
+            content = {'message': 'translation not finished before the deadline.',
+                       'id': db_xml_trans.etranslation_id}
+            return JSONResponse(content, status_code=504)
+
+        await asyncio.sleep(min(t_remaining, random.uniform(0.5, 1.) * delay))
+        delay = min(2 * delay, BLOCKING_POLL_MAX)
 
 
 @app.post("/translate/xml", response_model=XMLTransOut)
@@ -84,23 +192,24 @@ async def submit_page_xml_translation(file: UploadFile = File(...),
                                       source: str = Header(...),
                                       target: str = Header(...),
                                       use_tm: Optional[bool] = Header(False),
+                                      force: Optional[bool] = Header(False),
                                       db: Session = Depends(get_db)
                                       ):
-    """ Async
+    """ Async, the translation job is queued and processed by the job workers.
 
     Args:
         file: XML in Page or XLIFF-Page format.
+        force: Translate again, even if the same XML was submitted before with the same parameters.
 
     Returns:
-        The id to check if the XML is finished translating
+        The id to check if the XML is finished translating,
+        the id of the earlier submission if the same XML was submitted before with the same parameters.
     """
 
-    xml = XLIFFPageXML.from_page(file.file, source_lang=source)
-
-    db_xml_trans = _submit_page_xml_translation(xml, source=source, target=target,
-                                                filename=file.filename,
-                                                use_tm=use_tm,
-                                                db=db)
+    db_xml_trans = await _submit_page_xml_translation(file, source=source, target=target,
+                                                      use_tm=use_tm,
+                                                      force=force,
+                                                      db=db)
 
     return XMLTransOut(id=db_xml_trans.etranslation_id)  # db_xml_trans # Response({'id': id_doc})
 
@@ -115,16 +224,153 @@ async def read_page_xml_translation(xml_id: str,
         file: XML in Page or XLIFF-Page format.
 
     Returns:
-        The XML expanded with a translation
+        The XML expanded with a translation,
+        a 423 with the state of the job if not finished yet, or a 500 with the error if the job failed.
+    """
+
+    return await _read_page_xml_translation(xml_id, db=db)
+
+
+@app.post("/translate/xml/multi", response_model=XMLTransOut)
+async def submit_page_xml_translations(file: UploadFile = File(...),
+                                       source: str = Header(...),
+                                       targets: str = Header(...),
+                                       use_tm: Optional[bool] = Header(False),
+                                       force: Optional[bool] = Header(False),
+                                       db: Session = Depends(get_db)
+                                       ):
+    """ Async, to multiple target languages at once.
+    A translation job is queued per target language, the XML is only stored once.
+
+    Args:
+        file: XML in Page or XLIFF-Page format.
+        targets: Comma separated target languages, e.g. "en,fr,de".
+        force: Translate again, even if the same XML was submitted before with the same parameters.
+
+    Returns:
+        The id to check if the XML is finished translating to every target language,
+        the id of the earlier submission if the same XML was submitted before with the same parameters.
+    """
+
+    targets = list(dict.fromkeys(filter(None, map(str.strip, targets.split(',')))))
+    if not targets:
+        return JSONResponse({'message': 'no target language given.'}, status_code=422)
+
+    db_xml_group = await _submit_page_xml_translations(file, source=source, targets=targets,
+                                                       use_tm=use_tm,
+                                                       force=force,
+                                                       db=db)
+
+    return XMLTransOut(id=db_xml_group.group_id)
+
+
+@app.get("/translate/xml/multi/{group_id}")
+async def read_page_xml_translations(group_id: str,
+                                     split: bool = False,
+                                     db: Session = Depends(get_db),
+                                     ) -> Response:
+    """ Retrieve the xml translated to multiple target languages
+
+    Args:
+        group_id: id returned when submitting the XML.
+        split: Return a zip with a XML per target language, instead of a single multilingual XML.
+
+    Returns:
+        The XML expanded with a translation per target language.
+    """
+
+    return await _read_page_xml_translations(group_id, split=split, db=db)
+
+
+@app.post("/translate/xml/batch", response_model=schemas.XMLTransBatchOut)
+async def submit_page_xml_batch(files: List[UploadFile] = File(...),
+                                source: str = Header(...),
+                                target: str = Header(...),
+                                use_tm: Optional[bool] = Header(False),
+                                force: Optional[bool] = Header(False),
+                                db: Session = Depends(get_db)
+                                ):
+    """ Async, multiple XML's at once, e.g. all pages of a newspaper issue.
+    The lines to translate are packed in as few eTranslation documents as possible.
+
+    Args:
+        files: XML's in Page or XLIFF-Page format, or zip files with XML's.
+        force: Translate again, even if the same XML's were submitted before with the same parameters.
+
+    Returns:
+        The id to check the status of the batch, and the id per XML to retrieve its translation,
+        those of the earlier batch if the same XML's were submitted before with the same parameters.
+    """
+
+    pages = await CPU_EXECUTOR.run(_read_page_xml_files, files)
+
+    db_xml_batch = await _submit_page_xml_batch(pages, source=source, target=target,
+                                                use_tm=use_tm,
+                                                force=force,
+                                                db=db)
+
+    return await run_in_threadpool(_get_xml_batch_out, db_xml_batch)
+
+
+@app.get("/translate/xml/batch/{batch_id}", response_model=schemas.XMLTransBatchOut)
+async def read_page_xml_batch(batch_id: str,
+                              db: Session = Depends(get_db),
+                              ):
+    """ Status of a batch. The XML's that finished translating can be retrieved with their id.
+
+    Args:
+        batch_id: id returned when submitting the batch.
+
+    Returns:
+        The id and whether it is translated, per XML.
+    """
+
+    return await _read_page_xml_batch(batch_id, db=db)
+
+
+@app.get("/translate/xml/batch/{batch_id}/zip")
+async def read_page_xml_batch_zip(batch_id: str,
+                                  db: Session = Depends(get_db),
+                                  ) -> Response:
+    """ Retrieve all translated XML's of a batch.
+
+    Args:
+        batch_id: id returned when submitting the batch.
+
+    Returns:
+        Zip with the translated XML's.
     """
 
-    db_xml_trans = crud.get_xml_by_etranslation_id(db=db,
-                                                   etranslation_id=xml_id)
+    r = await _read_page_xml_batch(batch_id, db=db)
+    if not isinstance(r, schemas.XMLTransBatchOut):
+        return r
+
+    if not all(page.is_translated for page in r.pages):
+        content = {'message': 'translation not finished.'}
+        return JSONResponse(content, status_code=423)
+
+    db_xml_batch = await run_in_threadpool(crud.get_xml_batch, db=db, batch_id=batch_id)
+    data = await CPU_EXECUTOR.run(_zip_files, {_get_trans_filename(db_xml_trans.filename): db_xml_trans.xml_trans_content
+                                               for db_xml_trans in db_xml_batch.pages})
 
-    return _read_page_xml_translation(db_xml_trans.etranslation_id,
-                                      target=db_xml_trans.target,
-                                      use_tm=db_xml_trans.use_tm,
-                                      db=db)
+    return _zip_response(data, f'{batch_id}_trans.zip')
+
+
+@app.get("/translate/xml/{xml_id}/stats", response_model=schemas.XMLTransStats)
+def read_page_xml_translation_stats(xml_id: str,
+                                    db: Session = Depends(get_db),
+                                    ):
+    """
+    Amount of lines and characters sent to MT, after removing the TM matches, cached and repeated lines.
+    """
+
+    db_xml_trans = crud.get_xml_by_etranslation_id(db, etranslation_id=xml_id)
+    db_xml_document = None if db_xml_trans is None else crud.get_document(db, document_id=db_xml_trans.xml_document_id)
+
+    if db_xml_document is None:
+        return JSONResponse({'message': 'no document found for this translation.'}, status_code=404)
+
+    return _get_mt_stats(db_xml_document)
 
 
 @app.get("/translate/xmls/", response_model=List[schemas.XMLTrans])
@@ -136,96 +382,1028 @@ def read_trans_xmls(skip: int = 0, limit: int = 100, db: Session = Depends(get_d
     return users
 
 
-def _submit_page_xml_translation(xml, source, target, filename, use_tm, db):
-    # ORM of XML
-    # convert file to XLIFF Page.
+@app.get("/tm/cache")
+def read_tm_cache_stats():
+    """
+    Returns the hit, miss and eviction counters of the TM lookup cache.
+    """
+    return MOUSE_CONNECTOR.cache.stats()
 
-    # Make sure the XML is valid.
-    try:
-        xml.validate()
-    except:
-        xml.auto_fix()
-        # If it can't be fixed, probably not safe to continue
-        xml.validate()
 
-    # translation
-    connector = ETranslationConnector(CEF_LOGIN, CEF_PASSW)
+@app.get("/executor")
+def read_executor_stats():
+    """
+    Returns the amount of running and queued tasks of the executor of the CPU bound XML work.
+    The queue depth counts the tasks waiting for a thread.
+    """
+    return CPU_EXECUTOR.stats()
 
-    # First send trans requests, then request the response.
 
-    # Get sentences from the textlines
-    parser = SentenceParser(xml)
-    lines_text = parser.get_sentences()
+@app.get("/metrics")
+def read_metrics():
+    """
+    Returns the metrics in the Prometheus text format:
+    the time spent per stage of the translation pipeline, by language pair and document size,
+    and the requests, bytes and errors of the calls to eTranslation and Mouse.
+    """
+    data, content_type = get_metrics()
+    return Response(data, headers={'Content-Type': content_type})
 
-    if use_tm:
-        # Create a XML Document object that holds 100% TM matches
-        db_xml_document = _parse_text_page_xml(lines_text, source, target, db)
-        lines_text = []
-        for document_line in db_xml_document.lines:
-            # if there's a 100% TM match, don't send the source text to MT, append empty line
-            if document_line.full_match:
-                lines_text.append('')
-            else:
-                lines_text.append(document_line.text)
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        tmp_file = os.path.join(tmp_dir, 'tmp_text_lines.txt')
-        s_tmp = ''.join(text_i + '\n' for text_i in lines_text)
-        with open(tmp_file, 'w') as f:
-            f.write(s_tmp)
-        # send to MT
-        id_doc = connector.trans_doc(source, target, tmp_file)
-
-    xml_trans = schemas.XMLTransCreate(etranslation_id=id_doc,
-                                       xml_content=xml.to_bstring(),
-                                       filename=filename,
-                                       source=source,
-                                       target=target,
-                                       use_tm=use_tm,
-                                       xml_document_id=db_xml_document.id if use_tm else -1)
-
-    db_xml_trans = crud.create_xml_trans(db=db,
-                                         xml_trans=xml_trans,
-                                         )
+
+if PROFILING_ENABLED:
+    @app.middleware("http")
+    async def profile_request(request: Request, call_next):
+        """
+        Profiles a request of /translate/xml or /translate/xml/{id} with the profile header,
+        and the translation job it submitted, see app.profiling.
+        The id of the profile is returned in the profile id header.
+        """
+
+        if request.headers.get(PROFILE_HEADER, '').lower() not in ('1', 'true') or not _is_profiled_path(request):
+            return await call_next(request)
+
+        profile = profiling.Profile(f'{request.method} {request.url.path}')
+        with profile.record('request'):
+            response = await call_next(request)
+        await run_in_threadpool(profile.save)
+
+        response.headers[PROFILE_ID_HEADER] = profile.id
+        return response
+
+
+@app.get("/admin/profiles")
+def read_profiles():
+    """
+    Returns the saved profiles, most recent first.
+    Only available when profiling is enabled with PROFILING_ENABLED.
+    """
+    if not PROFILING_ENABLED:
+        return JSONResponse({'message': 'profiling is disabled.'}, status_code=404)
+
+    return profiling.list_profiles()
+
+
+@app.get("/admin/profiles/{profile_id}")
+def read_profile(profile_id: str):
+    """
+    Returns the report of the profile: the wall time and top allocations per section, and the top functions.
+    """
+    return _profile_response(profile_id, 'txt', 'text/plain')
+
+
+@app.get("/admin/profiles/{profile_id}/prof")
+def read_profile_stats(profile_id: str):
+    """
+    Returns the cProfile stats of the profile, to load with pstats or a viewer like snakeviz.
+    """
+    return _profile_response(profile_id, 'prof', 'application/octet-stream')
+
+
+async def _submit_page_xml_translation(file: UploadFile, source, target, use_tm, force, db):
+    """
+    Identical submissions, the same XML with the same parameters, are only translated once.
+    """
+
+    file_hash = await CPU_EXECUTOR.run(_hash_file, file.file)
+    content_hash = _get_content_hash(file_hash, source, target, use_tm)
+
+    if not force:
+        db_xml_trans = await run_in_threadpool(crud.get_xml_by_content_hash, db=db, content_hash=content_hash)
+        if db_xml_trans is not None:
+            return db_xml_trans
+
+    xml_content = await CPU_EXECUTOR.run(_read_page_xml, file.file, file.filename)
+
+    xml_trans = _get_xml_trans_create(xml_content, source, target,
+                                      filename=file.filename,
+                                      use_tm=use_tm,
+                                      content_hash=content_hash)
+    db_xml_trans = await run_in_threadpool(crud.create_xml_trans, db=db, xml_trans=xml_trans)
+    profiling.attach_job(db_xml_trans.id)
+
+    _wake_job_workers()
 
     return db_xml_trans
 
 
-def _read_page_xml_translation(xml_id, target, use_tm, db) -> Response:
-    # translation
-    connector = ETranslationConnector(CEF_LOGIN, CEF_PASSW)
+async def _submit_page_xml_translations(file: UploadFile, source, targets, use_tm, force, db):
+    """
+    A translation job per target language.
+    Identical submissions, the same XML with the same parameters, are only translated once.
+    """
 
-    r = connector.trans_doc_id(xml_id)
-    db_xml_trans = crud.get_xml_by_etranslation_id(db=db,
-                                                   etranslation_id=xml_id)
+    file_hash = await CPU_EXECUTOR.run(_hash_file, file.file)
+    content_hashes = [_get_content_hash(file_hash, source, target, use_tm) for target in targets]
 
-    with io.BytesIO(db_xml_trans.xml_content.encode('utf-8')) as f:
-        xml_orm = XLIFFPageXML(f)
+    if not force:
+        db_xml_group = await run_in_threadpool(crud.get_xml_group_by_content_hashes, db=db,
+                                               content_hashes=content_hashes)
+        if db_xml_group is not None:
+            return db_xml_group
 
-    if use_tm:
-        db_xml_document = crud.get_document(db=db, document_id=db_xml_trans.xml_document_id)
+    xml_content = await CPU_EXECUTOR.run(_read_page_xml, file.file, file.filename)
 
-    if r:
-        l_trans_sent = list(map(str.strip, r.get('content').decode('UTF-8').splitlines()))
-        if use_tm:
-            l_trans_sent = _update_trans_text_lines_with_matches(l_trans_sent, db_xml_document)
+    xml_group = schemas.XMLTransGroupCreate(group_id=uuid4().hex,
+                                            filename=file.filename,
+                                            source=source)
+    db_xml_group = await run_in_threadpool(crud.create_xml_group, db=db, xml_group=xml_group)
 
-        # Get sentences from the textlines
-        parser = SentenceParser(xml_orm)
-        region_lines_new = parser.reconstruct_lines(l_trans_sent)
-        l_trans_text = [line for region in region_lines_new for line in region]
+    await run_in_threadpool(crud.create_xml_trans_list,
+                            db=db,
+                            xml_trans_list=[_get_xml_trans_create(xml_content, source, target,
+                                                                  filename=file.filename,
+                                                                  use_tm=use_tm,
+                                                                  content_hash=content_hash,
+                                                                  xml_group_id=db_xml_group.id)
+                                            for target, content_hash in zip(targets, content_hashes)])
 
-    else:
-        content = {'message': 'translation not finished.'}
+    _wake_job_workers()
+
+    return db_xml_group
+
+
+async def _submit_page_xml_batch(pages, source, target, use_tm, force, db):
+    """
+    A translation job per XML.
+    The job workers pack the lines to translate of all XML's in as few eTranslation documents as possible.
+    Identical batches, the same XML's with the same parameters, are only translated once.
+    """
+
+    content_hashes = [_get_content_hash(file_hash, source, target, use_tm) for _, file_hash, _ in pages]
+
+    if not force:
+        db_xml_batch = await run_in_threadpool(crud.get_xml_batch_by_content_hashes, db=db,
+                                               content_hashes=content_hashes)
+        if db_xml_batch is not None:
+            return db_xml_batch
+
+    xml_batch = schemas.XMLTransBatchCreate(batch_id=uuid4().hex,
+                                            source=source,
+                                            target=target)
+    db_xml_batch = await run_in_threadpool(crud.create_xml_batch, db=db, xml_batch=xml_batch)
+
+    await run_in_threadpool(crud.create_xml_trans_list,
+                            db=db,
+                            xml_trans_list=[_get_xml_trans_create(xml_content, source, target,
+                                                                  filename=filename,
+                                                                  use_tm=use_tm,
+                                                                  content_hash=content_hash,
+                                                                  xml_batch_id=db_xml_batch.id)
+                                            for (filename, _, xml_content), content_hash in zip(pages,
+                                                                                                content_hashes)])
+
+    _wake_job_workers()
+
+    return db_xml_batch
+
+
+def _get_xml_trans_create(xml_content, source, target, filename, use_tm, content_hash,
+                          xml_group_id=None, xml_batch_id=None) -> schemas.XMLTransCreate:
+    return schemas.XMLTransCreate(etranslation_id=uuid4().hex,
+                                  xml_content=xml_content,
+                                  filename=filename,
+                                  source=source,
+                                  target=target,
+                                  use_tm=use_tm,
+                                  content_hash=content_hash,
+                                  xml_group_id=xml_group_id,
+                                  xml_batch_id=xml_batch_id)
+
+
+def _wake_job_workers():
+    if _job_wakeup is not None:
+        _job_wakeup.set()
+
+
+async def _job_worker():
+    """
+    Background worker that moves the translation jobs through their states, see app.models:
+    queued -> segmented -> submitted -> translated -> assembled -> done, or failed.
+    The state is kept in the database, such that jobs are resumed after a restart.
+    """
+
+    while True:
+        db = SessionLocal()
+        try:
+            busy = await _run_next_job(db)
+        except Exception:
+            logger.exception('Job worker failed to claim a job.')
+            busy = False
+        finally:
+            db.close()
+
+        if not busy:
+            try:
+                await asyncio.wait_for(_job_wakeup.wait(), JOB_IDLE_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            _job_wakeup.clear()
+
+
+async def _run_next_job(db) -> bool:
+    """
+    Returns:
+        False if no job was due.
+    """
+
+    # Claiming is serialised within the app, the claim itself is atomic in the database.
+    async with _job_claim_lock:
+        claimed = await run_in_threadpool(_claim_next_jobs, db)
+
+    if claimed is None:
+        return False
+
+    stage, jobs = claimed
+    with profiling.profile_jobs(jobs, stage.__name__.strip('_')):
+        try:
+            await stage(jobs, db)
+        except Exception as e:
+            await _fail_stage(jobs, e, stage.__name__.strip('_'), db)
+
+    return True
+
+
+def _claim_next_jobs(db):
+    """
+    Jobs in later states go first, such that started jobs are finished before new ones are started.
+
+    Returns:
+        The stage to run and the jobs to run it on, None if no job is due.
+    """
+
+    for db_xml_group in crud.get_xml_groups_assembled(db):
+        if crud.claim_xml_trans_jobs(db, db_xml_group.translations, JOB_LEASE):
+            return _finish_job_group, db_xml_group.translations
+
+    for db_xml_trans in crud.get_xml_trans_jobs_due(db, models.JOB_TRANSLATED):
+        if crud.claim_xml_trans_jobs(db, [db_xml_trans], JOB_LEASE):
+            return _assemble_jobs, [db_xml_trans]
+
+    jobs = crud.get_xml_trans_jobs_due(db, models.JOB_SUBMITTED, limit=JOB_POLL_SIZE)
+    if jobs and crud.claim_xml_trans_jobs(db, jobs, JOB_LEASE):
+        return _poll_jobs, jobs
+
+    for state, stage in [(models.JOB_SEGMENTED, _submit_jobs),
+                         (models.JOB_QUEUED, _segment_jobs)]:
+        for db_xml_trans in crud.get_xml_trans_jobs_due(db, state):
+            # The XML's of a batch are segmented and submitted together.
+            if db_xml_trans.xml_batch_id is None:
+                jobs = [db_xml_trans]
+            else:
+                jobs = crud.get_xml_trans_jobs_due(db, state, limit=None, xml_batch_id=db_xml_trans.xml_batch_id)
+
+            if crud.claim_xml_trans_jobs(db, jobs, JOB_LEASE):
+                return stage, jobs
+
+    return None
+
+
+def _fail_jobs(jobs, e: Exception, db):
+    db.rollback()
+    crud.fail_xml_trans_jobs(db, jobs, repr(e), max_attempts=JOB_MAX_ATTEMPTS, retry_delay=JOB_RETRY_DELAY)
+
+
+async def _fail_stage(jobs, e: Exception, stage: str, db):
+    """
+    A stage can also fail some of the claimed jobs, e.g. a malformed XML of a batch, such that the others continue.
+    """
+
+    logger.error('Translation job failed.', exc_info=e)
+    STAGE_ERRORS.labels(stage).inc()
+    await run_in_threadpool(_fail_jobs, jobs, e, db)
+
+
+async def _segment_jobs(jobs, db):
+    """
+    queued -> segmented: the sentences are extracted from the XML,
+    and those with a 100% TM match or a cached translation are looked up.
+    """
+
+    jobs_segmented = []
+    for db_xml_trans in jobs:
+        if db_xml_trans.xml_document_id is not None:
+            # Segmented in an earlier attempt of the stage.
+            jobs_segmented.append(db_xml_trans)
+            continue
+
+        try:
+            region_sentences = await CPU_EXECUTOR.run(_get_xml_trans_region_sentences, db_xml_trans)
+            lines_text = [sentence for sentences in region_sentences for sentence in sentences]
+
+            # Create a XML Document object that holds 100% TM matches and previously machine translated segments
+            await _parse_text_page_xml(lines_text, db_xml_trans.source, db_xml_trans.target, db,
+                                       use_tm=db_xml_trans.use_tm,
+                                       db_xml_trans=db_xml_trans)
+        except Exception as e:
+            await _fail_stage([db_xml_trans], e, 'segment_jobs', db)
+        else:
+            jobs_segmented.append(db_xml_trans)
+
+    if jobs_segmented:
+        await run_in_threadpool(crud.update_xml_trans_jobs_state, db, jobs_segmented, models.JOB_SEGMENTED)
+
+
+async def _submit_jobs(jobs, db):
+    """
+    segmented -> submitted: the lines to translate of the jobs are packed in as few eTranslation documents as possible,
+    which are submitted concurrently.
+    Lines that don't fit in a single document are split in chunks on region boundaries.
+    Each job keeps track of the chunks of the documents that hold its lines.
+    A job whose lines can't be loaded fails by itself, the lines of the other jobs are still submitted.
+    """
+
+    def get_mt_groups(db_xml_trans):
+        # Only the lines without a 100% TM match or cached translation are sent to MT.
+        return _get_mt_line_groups(crud.get_document(db, document_id=db_xml_trans.xml_document_id),
+                                   list(map(len, _get_xml_trans_region_sentences(db_xml_trans))))
+
+    l_mt_groups = []
+    jobs_loaded = []
+    for db_xml_trans in jobs:
+        try:
+            l_mt_groups.append(await CPU_EXECUTOR.run(get_mt_groups, db_xml_trans))
+        except Exception as e:
+            await _fail_stage([db_xml_trans], e, 'submit_jobs', db)
+        else:
+            jobs_loaded.append(db_xml_trans)
+
+    if not jobs_loaded:
+        return
+    jobs = jobs_loaded
+
+    documents, l_chunks = _pack_mt_lines(l_mt_groups, MT_DOCUMENT_SIZE)
+
+    def get_chunks():
+        # The chunks are saved before the documents are submitted, and get the eTranslation id once accepted,
+        # such that a retry only submits the documents that weren't accepted yet.
+        ll_db_chunks = []
+        for db_xml_trans, chunks in zip(jobs, l_chunks):
+            if [(db_chunk.offset, db_chunk.n) for db_chunk in db_xml_trans.chunks] != \
+                    [(offset, n) for _, offset, n in chunks]:
+                # Packed differently in an earlier attempt, e.g. after a change of MT_DOCUMENT_SIZE.
+                crud.delete_xml_trans_chunks(db, db_xml_trans)
+                crud.create_xml_trans_chunks(db,
+                                             chunks=[schemas.XMLTransChunkCreate(offset=offset, n=n)
+                                                     for _, offset, n in chunks],
+                                             xml_id=db_xml_trans.id)
+            ll_db_chunks.append(db_xml_trans.chunks)
+        return ll_db_chunks
+
+    ll_db_chunks = await run_in_threadpool(get_chunks)
+
+    # The chunks of each eTranslation document.
+    document_chunks = [[] for _ in documents]
+    for chunks, db_chunks in zip(l_chunks, ll_db_chunks):
+        for (i_document, _, _), db_chunk in zip(chunks, db_chunks):
+            document_chunks[i_document].append(db_chunk)
+
+    # The session is shared by the concurrent submissions.
+    save_lock = asyncio.Lock()
+
+    # The jobs that are submitted together have the same source and target language.
+    source, target = jobs[0].source, jobs[0].target
+
+    async def submit(document, db_chunks):
+        if db_chunks[0].etranslation_id is not None:
+            # Accepted in an earlier attempt.
+            return
+
+        etranslation_id = await ETRANSLATION_CONNECTOR.trans_doc(source, target, text_lines_to_document(document))
+        if etranslation_id is None:
+            raise Exception('Failed to submit a document to eTranslation.')
+
+        async with save_lock:
+            await run_in_threadpool(crud.update_xml_trans_chunks_etranslation_id, db, db_chunks, etranslation_id)
+
+    with time_stage('upload', get_langpair(source, target), sum(map(len, documents))):
+        # Every submission finishes, such that the accepted documents are saved even if another one failed.
+        results = await asyncio.gather(*map(submit, documents, document_chunks), return_exceptions=True)
+
+    for result in results:
+        if isinstance(result, BaseException):
+            # Not the jobs that already failed by themselves.
+            await _fail_stage(jobs, result, 'submit_jobs', db)
+            return
+
+    await run_in_threadpool(crud.update_xml_trans_jobs_state, db, jobs, models.JOB_SUBMITTED)
+
+
+async def _poll_jobs(jobs, db):
+    """
+    submitted -> translated: the finished eTranslation documents are saved, per chunk.
+    Jobs that aren't finished yet are polled again later.
+    An error while polling only counts against the jobs with lines in that eTranslation document,
+    and jobs that wait longer than JOB_MAX_MT_WAIT fail.
+    """
+
+    translations = await run_in_threadpool(
+        lambda: [(db_xml_trans, *_get_xml_trans_document(db_xml_trans, db)) for db_xml_trans in jobs])
+
+    errors = {}
+    ll_trans_sent = await _get_xml_trans_sentences([(db_xml_trans, mt_needed)
+                                                    for db_xml_trans, _, mt_needed in translations], db,
+                                                   errors=errors)
+
+    def save():
+        now = datetime.datetime.now()
+        for (db_xml_trans, db_xml_document, mt_needed), l_trans_sent in zip(translations, ll_trans_sent):
+            if l_trans_sent is None:
+                job_errors = [errors[etranslation_id] for etranslation_id in _get_etranslation_ids(db_xml_trans)
+                              if etranslation_id in errors]
+                if job_errors:
+                    crud.fail_xml_trans_jobs(db, [db_xml_trans], repr(job_errors[0]),
+                                             max_attempts=JOB_MAX_ATTEMPTS, retry_delay=JOB_RETRY_DELAY)
+                elif (now - _get_submitted(db_xml_trans)).total_seconds() > JOB_MAX_MT_WAIT:
+                    # Without retry.
+                    crud.fail_xml_trans_jobs(db, [db_xml_trans],
+                                             f'translation not finished within {JOB_MAX_MT_WAIT:g} seconds.',
+                                             max_attempts=1, retry_delay=0)
+                else:
+                    crud.update_xml_trans_jobs_state(db, [db_xml_trans], models.JOB_SUBMITTED,
+                                                     delay=JOB_POLL_INTERVAL)
+            elif mt_needed and not db_xml_trans.chunks:
+                # Sent as a single document before the job queue, the translation isn't saved, so assemble it now.
+                _build_page_xml_translation(db_xml_trans, db_xml_document, l_trans_sent, db)
+                crud.update_xml_trans_jobs_state(db, [db_xml_trans], _get_assembled_state(db_xml_trans))
+                _observe_jobs_done([(db_xml_trans, db_xml_document)])
+            else:
+                crud.update_xml_trans_jobs_state(db, [db_xml_trans], models.JOB_TRANSLATED)
+
+    await run_in_threadpool(save)
+
+
+async def _assemble_jobs(jobs, db):
+    """
+    translated -> assembled: the translation is added to the XML.
+    Jobs that are not part of a group are done.
+    """
+
+    db_xml_trans, = jobs
+
+    db_xml_document, mt_needed = await run_in_threadpool(_get_xml_trans_document, db_xml_trans, db)
+
+    l_trans_sent, = await _get_xml_trans_sentences([(db_xml_trans, mt_needed)], db)
+
+    await CPU_EXECUTOR.run(_build_page_xml_translation, db_xml_trans, db_xml_document, l_trans_sent, db)
+
+    await run_in_threadpool(crud.update_xml_trans_jobs_state, db, jobs, _get_assembled_state(db_xml_trans))
+    await run_in_threadpool(_observe_jobs_done, [(db_xml_trans, db_xml_document)])
+
+
+def _get_etranslation_ids(db_xml_trans) -> List[str]:
+    """
+    Returns:
+        The eTranslation documents that hold the lines of the job.
+    """
+
+    if db_xml_trans.chunks:
+        return [db_chunk.etranslation_id for db_chunk in db_xml_trans.chunks]
+
+    # Sent as a single document, before the job queue.
+    return [db_xml_trans.etranslation_id]
+
+
+def _get_submitted(db_xml_trans) -> datetime.datetime:
+    """
+    Returns:
+        When the first document of the job was accepted by eTranslation.
+    """
+
+    submitted = [db_chunk.created for db_chunk in db_xml_trans.chunks if db_chunk.created is not None]
+
+    return min(submitted, default=db_xml_trans.created)
+
+
+def _get_assembled_state(db_xml_trans) -> str:
+    """
+    A job that is part of a group waits until the other target languages are assembled as well.
+    """
+
+    return models.JOB_DONE if db_xml_trans.xml_group_id is None else models.JOB_ASSEMBLED
+
+
+def _observe_jobs_done(translations):
+    """
+    Observes the time from the submission until the translation is done, of the jobs that are done.
+
+    Args:
+        translations: List of XML translations and their XML Document object.
+    """
+
+    now = datetime.datetime.now()
+    for db_xml_trans, db_xml_document in translations:
+        if db_xml_trans.state == models.JOB_DONE and db_xml_trans.created is not None:
+            observe_stage('total', get_langpair(db_xml_trans.source, db_xml_trans.target),
+                          (now - db_xml_trans.created).total_seconds(),
+                          None if db_xml_document is None else len(db_xml_document.lines))
+
+
+async def _finish_job_group(jobs, db):
+    """
+    assembled -> done: once every target language is assembled, the translations are added to a single XML.
+    """
+
+    translations = await run_in_threadpool(
+        lambda: [(db_xml_trans, *_get_xml_trans_document(db_xml_trans, db)) for db_xml_trans in jobs])
+
+    ll_trans_sent = await _get_xml_trans_sentences([(db_xml_trans, mt_needed)
+                                                    for db_xml_trans, _, mt_needed in translations], db)
+
+    await CPU_EXECUTOR.run(_build_page_xml_translations, jobs[0].group, translations, ll_trans_sent, db)
+
+    await run_in_threadpool(crud.update_xml_trans_jobs_state, db, jobs, models.JOB_DONE)
+    await run_in_threadpool(_observe_jobs_done, [(db_xml_trans, db_xml_document)
+                                                 for db_xml_trans, db_xml_document, _ in translations])
+
+
+def _read_page_xml_files(files: List[UploadFile]) -> List[Tuple[str, str, bytes]]:
+    """
+    Returns:
+        Filename, hash and compressed content of every uploaded XML, zip files are extracted.
+    """
+
+    pages = []
+    for file in files:
+        if zipfile.is_zipfile(file.file):
+            with zipfile.ZipFile(file.file) as z:
+                for name in z.namelist():
+                    if name.lower().endswith('.xml') and not name.startswith('__MACOSX/'):
+                        with z.open(name) as f_zip, spool_file(f_zip) as f:
+                            pages.append((os.path.basename(name), _hash_file(f), _read_page_xml(f, name)))
+        else:
+            pages.append((file.filename, _hash_file(file.file), _read_page_xml(file.file, file.filename)))
+
+    return pages
+
+
+def _read_page_xml(f: BinaryIO, filename: str = None) -> bytes:
+    """
+    The uploaded XML is stored as is, compressed.
+    It is checked with the streaming parser that the job workers use to extract its text,
+    see _get_xml_trans_region_sentences, such that a malformed XML is refused instead of queued.
+    The full XML is only parsed when the translation is added to it, see _load_page_xml.
+
+    Args:
+        f: XML in Page or XLIFF-Page format, e.g. the spooled file of an upload.
+        filename: to name the XML in the error message.
+
+    Returns:
+        The compressed content of the XML, to be stored.
+
+    Raises:
+        InvalidXMLError: if the XML is malformed.
+    """
+
+    f.seek(0)
+    try:
+        PageText.from_file(f)
+    except etree.XMLSyntaxError as e:
+        raise InvalidXMLError(f'invalid XML{"" if filename is None else " " + filename}: {e}') from e
+
+    f.seek(0)
+    return compress_file(f)
+
+
+def _get_xml_trans_region_sentences(db_xml_trans) -> List[List[str]]:
+    langpair = get_langpair(db_xml_trans.source, db_xml_trans.target)
+
+    with time_stage('parse', langpair) as timer, open_decompressed(db_xml_trans.xml_content) as f:
+        page = PageText.from_file(f)
+        timer.n_lines = len(page.get_lines_text())
+
+    with time_stage('segment', langpair, timer.n_lines):
+        return _get_page_xml_sentences(page)
+
+
+def _pack_mt_lines(l_mt_groups: List[List[List[str]]], max_size: int):
+    """
+    Packs the lines to translate of one or more XML's in as few documents as possible,
+    each of at most max_size bytes (unless a single line is larger).
+    A group of lines (a region) is only split over multiple documents if it doesn't fit in a single document.
+
+    Args:
+        l_mt_groups: For each XML, its lines to translate per group.
+
+    Returns:
+        The lines of each document,
+        and for each XML its chunks as (index of the document, offset in the document, number of lines).
+    """
+
+    documents = [[]]
+    size = 0
+    l_chunks = []
+    for mt_groups in l_mt_groups:
+        chunks = []
+        for group in mt_groups:
+            l_size_line = [len(line.encode('utf-8')) + 1 for line in group]  # Newline
+            if documents[-1] and size + sum(l_size_line) > max_size:
+                documents.append([])
+                size = 0
+
+            for line, size_line in zip(group, l_size_line):
+                if documents[-1] and size + size_line > max_size:
+                    documents.append([])
+                    size = 0
+
+                if not chunks or chunks[-1][0] != len(documents) - 1:
+                    chunks.append([len(documents) - 1, len(documents[-1]), 0])
+
+                documents[-1].append(line)
+                chunks[-1][2] += 1
+                size += size_line
+
+        l_chunks.append(list(map(tuple, chunks)))
+
+    if not documents[-1]:
+        documents.pop()
+
+    return documents, l_chunks
+
+
+def _hash_file(f: BinaryIO) -> str:
+    """
+    SHA-256 of the uploaded XML, read chunk by chunk.
+    """
+
+    f.seek(0)
+    h = hashlib.sha256()
+    for chunk in iter(lambda: f.read(64 * 1024), b''):
+        h.update(chunk)
+
+    return h.hexdigest()
+
+
+def _get_content_hash(file_hash: str, source, target, use_tm) -> str:
+    """
+    Identifies a submission: the uploaded XML together with the parameters that change its translation.
+    """
+
+    key = '\n'.join([file_hash, source, target, str(bool(use_tm))])
+
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def _get_page_xml_sentences(page: PageText) -> List[List[str]]:
+    # Get sentences from the textlines, per region
+    parser = SentenceParser(page)
+    return parser.get_region_sentences()
+
+
+def _load_page_xml(xml_content: bytes, source, langpair: str) -> Tuple[XLIFFPageXML, SentenceParser]:
+    """
+    Parses the full XML, to add a translation to it.
+    The stored XML is decompressed while it is parsed.
+
+    Args:
+        langpair: to label the metrics with.
+
+    Returns:
+        The XML, converted to XLIFF Page,
+        and a sentence parser on the streamed text, such that the sentences are the same as the submitted ones.
+    """
+
+    with time_stage('load', langpair) as timer:
+        with open_decompressed(xml_content) as f:
+            page = PageText.from_file(f)
+        timer.n_lines = len(page.get_lines_text())
+
+        # ORM of XML
+        # convert file to XLIFF Page.
+        with open_decompressed(xml_content) as f:
+            xml_orm = XLIFFPageXML.from_page(f, source_lang=source)
+
+    # Make sure the XML is valid.
+    with time_stage('validate', langpair, timer.n_lines):
+        try:
+            xml_orm.validate()
+        except:
+            xml_orm.auto_fix()
+            # If it can't be fixed, probably not safe to continue
+            xml_orm.validate()
+
+    n_lines, n_lines_orm = len(page.get_lines_text()), len(xml_orm.get_lines_text())
+    if n_lines != n_lines_orm:
+        raise ValueError(f'Expected {n_lines} text lines in the XML, got {n_lines_orm}.')
+
+    return xml_orm, SentenceParser(page)
+
+
+async def _read_page_xml_translation(xml_id, db) -> Response:
+    db_xml_trans = await run_in_threadpool(crud.get_xml_by_etranslation_id,
+                                           db=db,
+                                           etranslation_id=xml_id)
+
+    if db_xml_trans is None:
+        return JSONResponse({'message': 'translation not found.'}, status_code=404)
+
+    if db_xml_trans.is_translated:
+        return _xml_trans_response(db_xml_trans.xml_trans_content, db_xml_trans.filename)
+
+    if db_xml_trans.state == models.JOB_FAILED:
+        content = {'message': 'translation failed.',
+                   'error': db_xml_trans.error}
+        return JSONResponse(content, status_code=500)
+
+    content = {'message': 'translation not finished.',
+               'state': db_xml_trans.state,
+               **await run_in_threadpool(_get_chunks_progress, db_xml_trans)}
+    return JSONResponse(content, status_code=423)
+
+
+async def _read_page_xml_translations(group_id, split, db) -> Response:
+    db_xml_group = await run_in_threadpool(crud.get_xml_group, db=db, group_id=group_id)
+
+    if db_xml_group is None:
+        return JSONResponse({'message': 'translation not found.'}, status_code=404)
+
+    if not db_xml_group.is_translated:
+        translations = await run_in_threadpool(lambda: list(db_xml_group.translations))
+
+        failed = [db_xml_trans for db_xml_trans in translations if db_xml_trans.state == models.JOB_FAILED]
+        if failed:
+            content = {'message': 'translation failed.',
+                       'failed': [db_xml_trans.target for db_xml_trans in failed],
+                       'error': failed[0].error}
+            return JSONResponse(content, status_code=500)
+
+        content = {'message': 'translation not finished.',
+                   'finished': [db_xml_trans.target for db_xml_trans in translations if db_xml_trans.is_translated]}
         return JSONResponse(content, status_code=423)
 
-    # Add to XML
-    xml_orm.add_targets(l_trans_text, target)
+    if split:
+        basename, ext = db_xml_group.filename.split('.', 1)
+        data = await CPU_EXECUTOR.run(lambda: _zip_files({f'{basename}_trans_{db_xml_trans.target}.{ext}':
+                                                              db_xml_trans.xml_trans_content
+                                                          for db_xml_trans in db_xml_group.translations}))
+
+        return _zip_response(data, f'{basename}_trans.zip')
+
+    return _xml_trans_response(db_xml_group.xml_trans_content, db_xml_group.filename)
+
+
+async def _read_page_xml_batch(batch_id, db):
+    db_xml_batch = await run_in_threadpool(crud.get_xml_batch, db=db, batch_id=batch_id)
+
+    if db_xml_batch is None:
+        return JSONResponse({'message': 'batch not found.'}, status_code=404)
+
+    return await run_in_threadpool(_get_xml_batch_out, db_xml_batch)
+
+
+def _get_xml_batch_out(db_xml_batch) -> schemas.XMLTransBatchOut:
+    return schemas.XMLTransBatchOut(id=db_xml_batch.batch_id,
+                                    pages=[schemas.XMLTransBatchPage(id=db_xml_trans.etranslation_id,
+                                                                     filename=db_xml_trans.filename,
+                                                                     state=db_xml_trans.state,
+                                                                     is_translated=db_xml_trans.is_translated,
+                                                                     **_get_chunks_progress(db_xml_trans))
+                                           for db_xml_trans in db_xml_batch.pages])
+
+
+def _get_chunks_progress(db_xml_trans) -> dict:
+    """
+    Amount of chunks of the translation, and how many of them are finished.
+    """
+
+    if not db_xml_trans.chunks:
+        # Sent as a single document.
+        return {'chunks': 1,
+                'chunks_finished': int(db_xml_trans.is_translated)}
+
+    return {'chunks': len(db_xml_trans.chunks),
+            'chunks_finished': sum(db_chunk.translation is not None for db_chunk in db_xml_trans.chunks)}
+
+
+def _get_xml_trans_document(db_xml_trans, db):
+    """
+    Returns:
+        The XML Document object, None for translations that were submitted without one,
+        and whether the translation has been sent to MT.
+    """
+
+    db_xml_document = crud.get_document(db, document_id=db_xml_trans.xml_document_id)
+    mt_needed = db_xml_document is None or bool(_get_mt_lines(db_xml_document))
+
+    return db_xml_document, mt_needed
+
+
+async def _get_xml_trans_sentences(translations, db, errors: dict = None) -> List[Optional[List[str]]]:
+    """
+    Args:
+        translations: List of XML translations and whether they were sent to MT.
+        errors: (Optional) collects the errors per eTranslation id, instead of raising the first one.
+            The translations of a failed document are handled as not finished yet.
+
+    Returns:
+        For each translation, the machine translated lines, None if not finished yet.
+        eTranslation documents shared by multiple translations are only retrieved once.
+    """
+
+    etranslation_ids = await run_in_threadpool(_get_pending_etranslation_ids, translations)
+
+    results = await asyncio.gather(*map(_get_trans_sentences, etranslation_ids, etranslation_ids.values()),
+                                   return_exceptions=errors is not None)
+
+    if errors is not None:
+        for etranslation_id, result in zip(list(etranslation_ids), results):
+            if isinstance(result, Exception):
+                logger.warning('Failed to retrieve eTranslation document %s: %r', etranslation_id, result)
+                STAGE_ERRORS.labels('poll_jobs').inc()
+                errors[etranslation_id] = result
+        results = [None if isinstance(result, Exception) else result for result in results]
+
+    return await run_in_threadpool(_collect_trans_sentences, translations, dict(zip(etranslation_ids, results)), db)
+
+
+def _get_pending_etranslation_ids(translations) -> Dict[str, str]:
+    """
+    Returns:
+        The eTranslation ids with their language pair.
+    """
+
+    etranslation_ids = {}
+    for db_xml_trans, mt_needed in translations:
+        if not mt_needed:
+            continue
 
-    data = xml_orm.to_bstring()
+        langpair = get_langpair(db_xml_trans.source, db_xml_trans.target)
+        if db_xml_trans.chunks:
+            etranslation_ids.update((db_chunk.etranslation_id, langpair) for db_chunk in db_xml_trans.chunks
+                                    if db_chunk.translation is None)
+        else:
+            # Sent as a single document, before the job queue.
+            etranslation_ids[db_xml_trans.etranslation_id] = langpair
+
+    return etranslation_ids
+
+
+def _collect_trans_sentences(translations, results, db) -> List[Optional[List[str]]]:
+    """
+    Saves the finished chunks and puts the chunks of each translation back together.
+    """
+
+    now = datetime.datetime.now()
+    for etranslation_id, l_trans_sent in results.items():
+        if l_trans_sent is not None:
+            db_chunks = crud.update_xml_trans_chunks_translation(db, etranslation_id, l_trans_sent)
+
+            # Time the document spent at eTranslation, since it was submitted.
+            if db_chunks and db_chunks[0].created is not None:
+                db_xml_trans = db_chunks[0].xml_trans
+                observe_stage('mt_wait', get_langpair(db_xml_trans.source, db_xml_trans.target),
+                              (now - db_chunks[0].created).total_seconds(), len(l_trans_sent))
+
+    ll_trans_sent = []
+    for db_xml_trans, mt_needed in translations:
+        if not mt_needed:
+            # Everything was matched, nothing was sent to MT.
+            ll_trans_sent.append([])
+        elif db_xml_trans.chunks:
+            if any(db_chunk.translation is None for db_chunk in db_xml_trans.chunks):
+                ll_trans_sent.append(None)
+            else:
+                ll_trans_sent.append([line for db_chunk in db_xml_trans.chunks for line in db_chunk.translation])
+        else:
+            ll_trans_sent.append(results.get(db_xml_trans.etranslation_id))
+
+    return ll_trans_sent
+
+
+async def _get_trans_sentences(etranslation_id, langpair: str) -> Optional[List[str]]:
+    """
+    Returns:
+        The machine translated lines, None if not finished yet.
+    """
+
+    t0 = time.perf_counter()
+
+    r = await ETRANSLATION_CONNECTOR.trans_doc_id(etranslation_id)
+    if not r:
+        # Polls of unfinished documents are only timed by the connector.
+        return None
+
+    l_trans_sent = document_to_text_lines(r.get('content'))
+
+    observe_stage('download', langpair, time.perf_counter() - t0, len(l_trans_sent))
+
+    return l_trans_sent
+
+
+def _build_page_xml_translation(db_xml_trans, db_xml_document, l_trans_sent, db) -> bytes:
+    """
+    Adds the translation to the XML and saves the result, so it doesn't have to be reconstructed again.
+    """
+
+    langpair = get_langpair(db_xml_trans.source, db_xml_trans.target)
+
+    xml_orm, parser = _load_page_xml(db_xml_trans.xml_content, db_xml_trans.source, langpair)
+
+    with time_stage('reconstruct', langpair) as timer:
+        l_trans_text = _get_trans_text_lines(l_trans_sent, db_xml_document, parser)
+        timer.n_lines = len(l_trans_text)
+
+        # Add to XML
+        xml_orm.add_targets(l_trans_text, db_xml_trans.target)
+
+    with time_stage('serialize', langpair, timer.n_lines):
+        data = xml_orm.to_bstring()
+
+    crud.update_xml_trans_translated(db, db_xml_trans, data)
+
+    return data
+
+
+def _build_page_xml_translations(db_xml_group, translations, ll_trans_sent, db) -> bytes:
+    """
+    Adds the translation of every target language to a single XML.
+    """
+
+    # Labelled as a single language pair, to multiple target languages.
+    langpair = get_langpair(db_xml_group.source, 'multi')
+
+    # The sentences are the same for every target language.
+    xml_orm, parser = _load_page_xml(translations[0][0].xml_content, db_xml_group.source, langpair)
+
+    with time_stage('reconstruct', langpair) as timer:
+        for (db_xml_trans, db_xml_document, _), l_trans_sent in zip(translations, ll_trans_sent):
+            l_trans_text = _get_trans_text_lines(l_trans_sent, db_xml_document, parser)
+            xml_orm.add_targets(l_trans_text, db_xml_trans.target)
+        timer.n_lines = len(l_trans_text)
+
+    with time_stage('serialize', langpair, timer.n_lines):
+        data = xml_orm.to_bstring()
+
+    crud.update_xml_group_translated(db, db_xml_group, data)
+
+    return data
+
+
+def _get_trans_text_lines(l_trans_sent, db_xml_document, parser: SentenceParser) -> List[str]:
+    """
+    Reconstructs the translated text lines from the translated sentences.
+    """
+
+    if db_xml_document is not None:
+        _cache_trans_text_lines(l_trans_sent, db_xml_document)
+        l_trans_sent = _update_trans_text_lines_with_matches(l_trans_sent, db_xml_document)
+
+    region_lines_new = parser.reconstruct_lines(l_trans_sent)
+
+    return [line for region in region_lines_new for line in region]
+
+
+def _is_profiled_path(request: Request) -> bool:
+    if request.method == 'POST':
+        return request.url.path == '/translate/xml'
+
+    return request.method == 'GET' and re.fullmatch('/translate/xml/[^/]+', request.url.path) is not None
+
+
+def _profile_response(profile_id: str, extension: str, media_type: str) -> Response:
+    if not PROFILING_ENABLED:
+        return JSONResponse({'message': 'profiling is disabled.'}, status_code=404)
+
+    filename = profiling.get_profile_path(profile_id, extension)
+    if not profiling.is_profile_id(profile_id) or not os.path.exists(filename):
+        return JSONResponse({'message': 'profile not found.'}, status_code=404)
+
+    with open(filename, 'rb') as f:
+        data = f.read()
+
+    return Response(data,
+                    media_type=media_type,
+                    headers={
+                        "Content-Disposition": f"attachment;filename={os.path.basename(filename)}"
+                    }
+                    )
+
+
+def _zip_files(files: Dict[str, bytes]) -> bytes:
+    with io.BytesIO() as f:
+        with zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED) as z:
+            for filename, data in files.items():
+                z.writestr(filename, data)
+
+        return f.getvalue()
 
-    basename, ext = db_xml_trans.filename.split('.', 1)
 
-    filename_out = f'{basename}_trans.{ext}'
+def _zip_response(data: bytes, filename: str) -> Response:
+    return StreamingResponse(io.BytesIO(data),
+                             media_type="application/zip",
+                             headers={
+                                 "Content-Disposition": f"attachment;filename={filename}"
+                             }
+                             )
+
+
+def _get_trans_filename(filename: str) -> str:
+    basename, ext = filename.split('.', 1)
+
+    return f'{basename}_trans.{ext}'
+
+
+def _xml_trans_response(data: bytes, filename: str) -> Response:
+    filename_out = _get_trans_filename(filename)
 
     return StreamingResponse(io.BytesIO(data),
                              media_type="application/xml",
@@ -236,45 +1414,170 @@ def _read_page_xml_translation(xml_id, target, use_tm, db) -> Response:
                              )
 
 
-def _parse_text_page_xml(lines, source, target, db):
+async def _parse_text_page_xml(lines, source, target, db, use_tm=True, db_xml_trans=None):
+    """
+    Saves the lines in a XML Document object, together with their 100% TM match (if use_tm)
+    or otherwise their cached machine translation, if any, separately such that the stats tell them apart.
+    The translation job, if given, is linked to the document in the same transaction.
+    """
+    if use_tm:
+        with time_stage('tm_lookup', get_langpair(source, target), len(lines)):
+            full_matches = await _lookup_full_tm_matches(lines, source + '-' + target)
+    else:
+        full_matches = [''] * len(lines)
+
+    cached = await run_in_threadpool(MT_CACHE.get_many, source, target,
+                                     [line for line, full_match in zip(lines, full_matches) if not full_match])
+    l_cached_mt = ['' if full_match else cached.get(line, '') for line, full_match in zip(lines, full_matches)]
+
+    return await run_in_threadpool(_create_xml_document, lines, full_matches, l_cached_mt, source, target, db,
+                                   db_xml_trans)
+
+
+def _create_xml_document(lines, full_matches, l_cached_mt, source, target, db, db_xml_trans=None):
+
+    # Index of each line in the document that is sent to MT.
+    # Repeated lines (running headers, captions, ...) share the same index, such that they are only sent once.
+    mt_index = []
+    index_segment = {}
+    for line, full_match, cached_mt in zip(lines, full_matches, l_cached_mt):
+        segment = normalize_segment(line)
+        if full_match or cached_mt or not segment:
+            mt_index.append(-1)
+        else:
+            mt_index.append(index_segment.setdefault(segment, len(index_segment)))
+
     xml_document = XMLDocumentCreate(
         source=source,
-        target=target
+        target=target,
+        mt_index=mt_index
     )
 
-    db_xml_document = crud.create_xml_document(db, xml_document)
+    xml_document_lines = [XMLDocumentLineCreate(text=line, full_match=full_match, cached_mt=cached_mt)
+                          for line, full_match, cached_mt in zip(lines, full_matches, l_cached_mt)]
+
+    return crud.create_xml_document_with_lines(db, xml_document, xml_document_lines,
+                                               [] if db_xml_trans is None else [db_xml_trans])
+
+
+def _get_mt_index(db_xml_document: XMLDocument) -> List[int]:
+    """
+    For each document line, the index of its translation in the MT output, or -1 if it was not sent to MT.
+    """
+    if db_xml_document.mt_index is None:
+        # Sent with a (possibly empty) line for every document line.
+        return list(range(len(db_xml_document.lines)))
+
+    return db_xml_document.mt_index
+
+
+def _get_mt_lines(db_xml_document: XMLDocument) -> List[str]:
+    """
+    The lines to send to MT.
+    """
+    mt_index = _get_mt_index(db_xml_document)
 
-    for line in lines:
-        full_match = _lookup_full_tm_match(line, source + '-' + target)
-        xml_document_line = XMLDocumentLineCreate(
-            text=line,
-            full_match=full_match,
-            document_id=db_xml_document.id
-        )
-        crud.create_xml_document_line(db, xml_document_line, db_xml_document.id)
+    lines_text = [''] * (max(mt_index, default=-1) + 1)
+    for document_line, i in zip(db_xml_document.lines, mt_index):
+        if i >= 0:
+            lines_text[i] = normalize_segment(document_line.text)
 
-    return db_xml_document
+    return lines_text
+
+
+def _get_mt_line_groups(db_xml_document: XMLDocument, region_sizes: List[int]) -> List[List[str]]:
+    """
+    The lines to send to MT, grouped per region.
+    A repeated line belongs to the region where it first occurs.
+
+    Args:
+        region_sizes: Number of document lines per region.
+    """
+    mt_lines = _get_mt_lines(db_xml_document)
+
+    groups = []
+    i_region_prev = None
+    # MT lines are numbered in order of their first occurrence.
+    i_next = 0
+    l_i_region = (i_region for i_region, size in enumerate(region_sizes) for _ in range(size))
+    for i, i_region in zip(_get_mt_index(db_xml_document), l_i_region):
+        if i != i_next:
+            continue
+
+        if i_region != i_region_prev:
+            groups.append([])
+            i_region_prev = i_region
+
+        groups[-1].append(mt_lines[i])
+        i_next += 1
+
+    return groups
+
+
+def _get_mt_stats(db_xml_document: XMLDocument) -> schemas.XMLTransStats:
+    """
+    How much is sent to MT, compared to sending every line without a TM match.
+    """
+    lines_no_match = [document_line.text for document_line in db_xml_document.lines if not document_line.full_match]
+    lines_cached_mt = [document_line.text for document_line in db_xml_document.lines if document_line.cached_mt]
+    lines_mt = _get_mt_lines(db_xml_document)
+
+    n_chars = sum(map(len, lines_no_match))
+    n_chars_mt = sum(map(len, lines_mt))
+
+    return schemas.XMLTransStats(lines=len(db_xml_document.lines),
+                                 lines_no_match=len(lines_no_match),
+                                 lines_cached_mt=len(lines_cached_mt),
+                                 lines_mt=len(lines_mt),
+                                 chars_no_match=n_chars,
+                                 chars_cached_mt=sum(map(len, lines_cached_mt)),
+                                 chars_mt=n_chars_mt,
+                                 chars_saved=n_chars - n_chars_mt)
+
+
+def _cache_trans_text_lines(translated_lines, db_xml_document: XMLDocument):
+    """
+    Adds the machine translated lines to the segment cache.
+    """
+    translations = {document_line.text: translated_lines[i]
+                    for document_line, i in zip(db_xml_document.lines, _get_mt_index(db_xml_document))
+                    if not document_line.full_match and 0 <= i < len(translated_lines)}
+
+    MT_CACHE.set_many(db_xml_document.source, db_xml_document.target, translations)
 
 
 def _update_trans_text_lines_with_matches(translated_lines, db_xml_document: XMLDocument):
+    """
+    Scatters the MT output back to the position of each document line.
+    """
     updated_lines_with_matches = []
-    document_lines = db_xml_document.lines
-    if len(translated_lines) == 0:
-        translated_lines = ['']
-    for document_line, translation in zip(document_lines, cycle(translated_lines)):
-        if document_line.full_match:
-            updated_lines_with_matches.append(document_line.full_match)
+    for document_line, i in zip(db_xml_document.lines, _get_mt_index(db_xml_document)):
+        if document_line.full_match or document_line.cached_mt:
+            updated_lines_with_matches.append(document_line.full_match or document_line.cached_mt)
+        elif 0 <= i < len(translated_lines):
+            updated_lines_with_matches.append(translated_lines[i])
         else:
-            updated_lines_with_matches.append(translation)
+            updated_lines_with_matches.append('')
 
     return updated_lines_with_matches
 
 
-def _lookup_full_tm_match(segment, langpair):
-    mouse = MouseTmConnector()
+async def _lookup_full_tm_match(segment, langpair):
+    matches = await MOUSE_CONNECTOR.lookup_tu(False, "", langpair, segment)
+
+    return _get_full_match(matches)
+
+
+async def _lookup_full_tm_matches(segments: List[str], langpair: str) -> List[str]:
+    """
+    Batch version of _lookup_full_tm_match. The lookups are done concurrently and only once per distinct segment.
+    """
+    l_matches = await MOUSE_CONNECTOR.lookup_tu_many(False, "", langpair, segments)
+
+    return list(map(_get_full_match, l_matches))
 
-    matches = mouse.lookup_tu(False, "", langpair, segment)
 
+def _get_full_match(matches) -> str:
     full_match = ""
     for match in matches:
         if match["match"] >= 1.0:
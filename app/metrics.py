@@ -0,0 +1,84 @@
+import os
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from prometheus_client import CollectorRegistry, CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest, \
+    multiprocess
+
+# Set when running multiple worker processes, e.g. with gunicorn: directory where every process writes its metrics.
+PROMETHEUS_MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR') or os.environ.get('prometheus_multiproc_dir')
+
+# Upper bounds of the document size buckets, in text lines.
+SIZE_BUCKETS = (100, 1000, 10000)
+
+# From milliseconds for the XML processing up to the minutes a document can wait in the eTranslation queue.
+SECONDS_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+STAGE_SECONDS = Histogram('translation_stage_seconds',
+                          'Time spent per stage of the translation pipeline.',
+                          ['stage', 'langpair', 'size'],
+                          buckets=SECONDS_BUCKETS)
+STAGE_ERRORS = Counter('translation_stage_errors_total',
+                       'Translation jobs that raised an error, per stage.',
+                       ['stage'])
+
+# Summed over the live processes in multiprocess mode.
+CPU_QUEUE_DEPTH = Gauge('cpu_executor_queue_depth',
+                        'Tasks waiting for a thread of the executor of the CPU bound XML work.',
+                        multiprocess_mode='livesum')
+
+
+def get_size_bucket(n_lines: int = None) -> str:
+    """
+    Label of the document size, by its amount of text lines.
+    """
+
+    if n_lines is None:
+        return 'unknown'
+
+    lower = 0
+    for upper in SIZE_BUCKETS:
+        if n_lines < upper:
+            return f'{lower}-{upper - 1}'
+        lower = upper
+
+    return f'{lower}+'
+
+
+def get_langpair(source: str, target: str) -> str:
+    return f'{source}-{target}'
+
+
+@contextmanager
+def time_stage(stage: str, langpair: str, n_lines: int = None):
+    """
+    Observes the duration of the block in the stage histogram.
+    When the amount of text lines is only known within the block, it can be set on the yielded timer.
+    """
+
+    timer = SimpleNamespace(n_lines=n_lines)
+    t0 = time.perf_counter()
+    try:
+        yield timer
+    finally:
+        STAGE_SECONDS.labels(stage, langpair, get_size_bucket(timer.n_lines)).observe(time.perf_counter() - t0)
+
+
+def observe_stage(stage: str, langpair: str, seconds: float, n_lines: int = None):
+    STAGE_SECONDS.labels(stage, langpair, get_size_bucket(n_lines)).observe(seconds)
+
+
+def get_metrics():
+    """
+    Returns:
+        The metrics in the Prometheus text format, and its content type.
+        The metrics of every process are combined when running multiple processes.
+    """
+
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+
+    return generate_latest(), CONTENT_TYPE_LATEST
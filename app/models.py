@@ -1,21 +1,40 @@
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Boolean, Column, Integer, JSON, LargeBinary, String, DateTime, ForeignKey
 from sqlalchemy.orm import relationship
 
 from .database import Base
 
+# States of a translation job, in order, see the job workers in app.main.
+JOB_QUEUED = 'queued'
+JOB_SEGMENTED = 'segmented'
+JOB_SUBMITTED = 'submitted'
+JOB_TRANSLATED = 'translated'
+JOB_ASSEMBLED = 'assembled'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
 
 # TODO delete items after they are processed?
 class XMLTrans(Base):
     """
-    Temporary database for the XML's
+    Temporary database for the XML's, with the state of their translation job
     """
     __tablename__ = "xml"
 
     id = Column(Integer, primary_key=True, index=True)
+    # Public id. The eTranslation id for XML's that were sent as a single document before the job queue.
     etranslation_id = Column(String, unique=True, index=True)
     xml_document_id = Column(Integer, ForeignKey("document.id"))
-    xml_content = Column(String)
+    # Set when translated to multiple target languages from a single upload.
+    xml_group_id = Column(Integer, ForeignKey("xml_group.id"), default=None)
+    # Set when submitted together with other XML's.
+    xml_batch_id = Column(Integer, ForeignKey("xml_batch.id"), default=None)
+    # The uploaded XML, gzip compressed, see app.compression.
+    xml_content = Column(LargeBinary)
+    # The translated XML, once finished.
+    xml_trans_content = Column(LargeBinary, default=None)
     filename = Column(String, index=True)
+    # Hash of the uploaded XML together with the source, target and use_tm, to find identical submissions.
+    content_hash = Column(String, index=True, default=None)
 
     source = Column(String)
     target = Column(String)
@@ -26,6 +45,75 @@ class XMLTrans(Base):
 
     is_translated = Column(Boolean, default=False)
 
+    state = Column(String, default=JOB_QUEUED, index=True)
+    # Earliest time a worker may pick up the job (again), also used as lease of the worker that claimed it.
+    due = Column(DateTime, default=None, index=True)
+    attempts = Column(Integer, default=0)
+    error = Column(String, default=None)
+
+    # Empty when the lines to translate were sent as a single eTranslation document, with etranslation_id as id.
+    chunks = relationship("XMLTransChunk", back_populates="xml_trans", order_by="XMLTransChunk.id")
+    group = relationship("XMLTransGroup", back_populates="translations")
+    batch = relationship("XMLTransBatch", back_populates="pages")
+
+
+class XMLTransChunk(Base):
+    """
+    Consecutive lines of a XML translation that are sent as part of an eTranslation document
+    """
+    __tablename__ = "xml_chunk"
+
+    id = Column(Integer, primary_key=True, index=True)
+    xml_id = Column(Integer, ForeignKey("xml.id"))
+    # None until the eTranslation document is submitted.
+    etranslation_id = Column(String, index=True)
+    # Position of the lines in the eTranslation document.
+    offset = Column(Integer)
+    n = Column(Integer)
+    # The machine translated lines, once finished.
+    translation = Column(JSON, default=None)
+    # When the eTranslation document was submitted.
+    created = Column(DateTime)
+
+    xml_trans = relationship("XMLTrans", back_populates="chunks")
+
+
+class XMLTransBatch(Base):
+    """
+    XML's that are submitted together
+    """
+    __tablename__ = "xml_batch"
+
+    id = Column(Integer, primary_key=True, index=True)
+    batch_id = Column(String, unique=True, index=True)
+    source = Column(String)
+    target = Column(String)
+
+    created = Column(DateTime)
+
+    pages = relationship("XMLTrans", back_populates="batch", order_by="XMLTrans.id")
+
+
+class XMLTransGroup(Base):
+    """
+    Translations of a single XML to multiple target languages
+    """
+    __tablename__ = "xml_group"
+
+    id = Column(Integer, primary_key=True, index=True)
+    group_id = Column(String, unique=True, index=True)
+    filename = Column(String)
+    source = Column(String)
+
+    created = Column(DateTime)
+    finished = Column(DateTime, default=None)
+
+    # The multilingual XML, once all target languages are finished.
+    xml_trans_content = Column(LargeBinary, default=None)
+    is_translated = Column(Boolean, default=False)
+
+    translations = relationship("XMLTrans", back_populates="group", order_by="XMLTrans.id")
+
 
 class XMLDocument(Base):
     """
@@ -36,8 +124,11 @@ class XMLDocument(Base):
     id = Column(Integer, primary_key=True, index=True)
     source = Column(String)
     target = Column(String)
+    # For each line, the index of its translation in the document sent to MT, or -1 if it is not sent to MT.
+    # None for documents that were sent to MT with an (empty) line for every line.
+    mt_index = Column(JSON)
 
-    lines = relationship("XMLDocumentLine", back_populates="document")
+    lines = relationship("XMLDocumentLine", back_populates="document", order_by="XMLDocumentLine.id")
 
 
 class XMLDocumentLine(Base):
@@ -49,6 +140,8 @@ class XMLDocumentLine(Base):
     id = Column(Integer, primary_key=True, index=True)
     text = Column(String)
     full_match = Column(String)
+    # Machine translation of a previous document, for lines without a full match.
+    cached_mt = Column(String)
     document_id = Column(Integer, ForeignKey("document.id"))
 
     document = relationship("XMLDocument", back_populates="lines")
\ No newline at end of file
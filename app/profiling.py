@@ -0,0 +1,222 @@
+import cProfile
+import contextvars
+import datetime
+import functools
+import io
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from uuid import uuid4
+
+from .models import JOB_DONE, JOB_FAILED
+
+# Allows clients to profile a single request with the profile header. Off by default, profiling slows the request down.
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "").lower() in ("1", "true", "yes")
+# Directory where the profiles are saved, see save.
+PROFILING_DIR = os.environ.get("PROFILING_DIR", "profiles")
+# Amount of functions and allocating lines in the report.
+PROFILING_TOP = int(os.environ.get("PROFILING_TOP", 30))
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+
+# Profile of the request or job being processed, see profiled.
+_current_profile: contextvars.ContextVar = contextvars.ContextVar('profile', default=None)
+
+# Profiles of the submitted jobs, by XMLTrans id, such that the job workers keep profiling them.
+_job_profiles: Dict[int, 'Profile'] = {}
+
+# tracemalloc is process wide, it traces as long as a profile is recording.
+_tracing_lock = threading.Lock()
+_tracing = 0
+
+
+class Profile:
+    """
+    Profile of a request, and of the translation job it submitted.
+
+    The functions run in the CPU executor are profiled deterministically with cProfile, that's where the XML work is
+    done, see app.executor. Awaiting the database and the connectors only shows up in the wall time of the section.
+    The allocations are traced with tracemalloc, including those of other requests processed meanwhile.
+    """
+
+    def __init__(self, description: str):
+        self.id = uuid4().hex
+        self.description = description
+        self.created = datetime.datetime.utcnow()
+
+        self._lock = threading.Lock()
+        self._stats: Optional[pstats.Stats] = None
+        self._sections: List[str] = []
+
+    def call(self, func, *args, **kwargs):
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            with self._lock:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+
+    @contextmanager
+    def record(self, section: str):
+        """
+        Profiles the CPU executor calls within the block, and reports its wall time and the top allocations.
+        """
+
+        token = _current_profile.set(self)
+        _start_tracing()
+        t0 = time.perf_counter()
+        try:
+            yield self
+        finally:
+            seconds = time.perf_counter() - t0
+            snapshot = _take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            _stop_tracing()
+            _current_profile.reset(token)
+
+            with self._lock:
+                self._sections.append(_format_section(section, seconds, current, peak, snapshot))
+
+    def save(self, directory: str = PROFILING_DIR):
+        """
+        Saves the cProfile stats to <id>.prof, for pstats or snakeviz,
+        and the report with the top functions and allocations to <id>.txt.
+        """
+
+        os.makedirs(directory, exist_ok=True)
+
+        with self._lock:
+            report = io.StringIO()
+            report.write(f'{self.description}\n{self.created.isoformat()}\n\n')
+            report.write('\n'.join(self._sections))
+
+            if self._stats is not None:
+                self._stats.dump_stats(get_profile_path(self.id, 'prof', directory))
+
+                stats = pstats.Stats(get_profile_path(self.id, 'prof', directory), stream=report)
+                stats.sort_stats('cumulative').print_stats(PROFILING_TOP)
+
+        with open(get_profile_path(self.id, 'txt', directory), 'w', encoding='utf-8') as f:
+            f.write(report.getvalue())
+
+
+def profiled(func):
+    """
+    Returns:
+        func, profiled by the profile of the calling request or job, if any.
+    """
+
+    profile = _current_profile.get()
+    if profile is None:
+        return func
+
+    return functools.partial(profile.call, func)
+
+
+def get_current_profile() -> Optional[Profile]:
+    return _current_profile.get()
+
+
+def attach_job(xml_trans_id: int):
+    """
+    Keeps profiling the job submitted by the current request, when it's processed by a job worker of this process.
+    """
+
+    profile = _current_profile.get()
+    if profile is not None:
+        _job_profiles[xml_trans_id] = profile
+
+
+@contextmanager
+def profile_jobs(jobs, stage: str):
+    """
+    Profiles a stage of the jobs, if one of them was submitted by a profiled request.
+    The profile is saved after every stage and dropped once the jobs finished.
+    """
+
+    profile = _job_profiles and next((_job_profiles[job.id] for job in jobs if job.id in _job_profiles), None)
+    if not profile:
+        yield
+        return
+
+    try:
+        with profile.record(stage):
+            yield
+    finally:
+        profile.save()
+
+        for job in jobs:
+            if job.state in (JOB_DONE, JOB_FAILED):
+                _job_profiles.pop(job.id, None)
+
+
+def is_profile_id(profile_id: str) -> bool:
+    return re.fullmatch('[0-9a-f]{32}', profile_id) is not None
+
+
+def get_profile_path(profile_id: str, extension: str, directory: str = PROFILING_DIR) -> str:
+    return os.path.join(directory, f'{profile_id}.{extension}')
+
+
+def list_profiles(directory: str = PROFILING_DIR) -> List[dict]:
+    """
+    Returns:
+        The saved profiles, most recent first.
+    """
+
+    if not os.path.isdir(directory):
+        return []
+
+    profiles = []
+    for filename in os.listdir(directory):
+        profile_id, extension = os.path.splitext(filename)
+        if extension == '.txt' and is_profile_id(profile_id):
+            with open(os.path.join(directory, filename), encoding='utf-8') as f:
+                description = f.readline().strip()
+            modified = os.path.getmtime(os.path.join(directory, filename))
+            profiles.append({'id': profile_id,
+                             'description': description,
+                             'modified': datetime.datetime.utcfromtimestamp(modified).isoformat()})
+
+    return sorted(profiles, key=lambda profile: profile['modified'], reverse=True)
+
+
+def _start_tracing():
+    global _tracing
+
+    with _tracing_lock:
+        if _tracing == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _tracing += 1
+
+
+def _stop_tracing():
+    global _tracing
+
+    with _tracing_lock:
+        _tracing -= 1
+        if _tracing == 0:
+            tracemalloc.stop()
+
+
+def _take_snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),
+                                                      tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+                                                      tracemalloc.Filter(False, '<unknown>')))
+
+
+def _format_section(section: str, seconds: float, current: int, peak: int, snapshot: tracemalloc.Snapshot) -> str:
+    lines = [f'== {section}: {seconds:.3f}s, traced memory {current / 2 ** 20:.1f} MiB, peak {peak / 2 ** 20:.1f} MiB',
+             f'Top {PROFILING_TOP} allocations:']
+    lines.extend(f'  {stat}' for stat in snapshot.statistics('lineno')[:PROFILING_TOP])
+
+    return '\n'.join(lines) + '\n'
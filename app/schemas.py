@@ -1,16 +1,22 @@
-from typing import List
+from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, validator
+
+from .compression import decompress
 
 
 class XMLTransBase(BaseModel):
     etranslation_id: str
-    xml_content: str
+    # gzip compressed
+    xml_content: bytes
     filename: str
     source: str
     target: str
     use_tm: bool
-    xml_document_id: int
+    xml_document_id: Optional[int] = None
+    xml_group_id: Optional[int] = None
+    xml_batch_id: Optional[int] = None
+    content_hash: Optional[str] = None
 
 
 class XMLTransCreate(XMLTransBase):
@@ -23,13 +29,71 @@ class XMLTransOut(BaseModel):
 
 
 class XMLTrans(XMLTransBase, XMLTransOut):
+    xml_content: str
+    state: Optional[str] = None
+
+    @validator('xml_content', pre=True)
+    def decompress_xml_content(cls, v):
+        if isinstance(v, bytes):
+            # Not every uploaded XML is UTF-8 encoded, the listing shouldn't fail on them.
+            return decompress(v).decode('utf-8', errors='replace')
+        return v
+
     class Config:
         orm_mode = True
 
 
+class XMLTransStats(BaseModel):
+    """Amount of lines and characters sent to MT"""
+    lines: int
+    lines_no_match: int
+    lines_cached_mt: int
+    lines_mt: int
+    chars_no_match: int
+    chars_cached_mt: int
+    chars_mt: int
+    chars_saved: int
+
+
+class XMLTransChunkCreate(BaseModel):
+    # None until the eTranslation document is submitted.
+    etranslation_id: Optional[str] = None
+    offset: int
+    n: int
+
+
+class XMLTransBatchCreate(BaseModel):
+    batch_id: str
+    source: str
+    target: str
+
+
+class XMLTransBatchPage(BaseModel):
+    id: str
+    filename: str
+    state: str
+    is_translated: bool
+    chunks: int
+    chunks_finished: int
+
+
+class XMLTransBatchOut(BaseModel):
+    """Allowed information to return"""
+    id: str
+    pages: List[XMLTransBatchPage]
+
+
+class XMLTransGroupCreate(BaseModel):
+    group_id: str
+    filename: str
+    source: str
+
+
 class XMLDocumentLineBase(BaseModel):
     text: str
     full_match: str
+    # None for documents saved before the cached MT was kept apart from the TM matches.
+    cached_mt: Optional[str] = None
 
 
 class XMLDocumentLineCreate(XMLDocumentLineBase):
@@ -47,6 +111,7 @@ class XMLDocumentLine(XMLDocumentLineBase):
 class XMLDocumentBase(BaseModel):
     source: str
     target: str
+    mt_index: Optional[List[int]] = None
 
 
 class XMLDocumentCreate(XMLDocumentBase):
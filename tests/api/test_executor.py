@@ -0,0 +1,53 @@
+import asyncio
+import threading
+import unittest
+
+from prometheus_client import CollectorRegistry, Gauge
+
+from app.executor import BoundedExecutor
+
+
+class TestBoundedExecutor(unittest.TestCase):
+
+    def test_run(self):
+        executor = BoundedExecutor(max_workers=2, max_queue=2)
+
+        async def main():
+            return await executor.run(threading.current_thread), await executor.run(sum, [1, 2], start=3)
+
+        thread, total = asyncio.run(main())
+
+        self.assertNotEqual(threading.main_thread(), thread, 'Should run outside of the event loop.')
+        self.assertEqual(6, total)
+
+    def test_backpressure(self):
+        gauge = Gauge('queue_depth', 'Queue depth.', registry=CollectorRegistry())
+        executor = BoundedExecutor(max_workers=1, max_queue=1, queue_depth_gauge=gauge)
+        release = threading.Event()
+
+        async def main():
+            tasks = [asyncio.ensure_future(executor.run(release.wait)) for _ in range(4)]
+            while executor.stats()['running'] < 1:
+                await asyncio.sleep(.01)
+
+            stats = executor.stats()
+            stats['gauge'] = gauge._value.get()
+
+            release.set()
+            await asyncio.gather(*tasks)
+
+            return stats
+
+        stats = asyncio.run(main())
+
+        self.assertEqual(1, stats['running'])
+        self.assertEqual(1, stats['queued'], 'Only max_queue tasks should be queued in the pool.')
+        self.assertEqual(2, stats['waiting'], 'The others should wait for place in the queue.')
+        self.assertEqual(3, stats['queue_depth'])
+        self.assertEqual(3, stats['gauge'], 'The gauge should follow the queue depth.')
+        self.assertEqual(0, executor.queue_depth())
+        self.assertEqual(0, gauge._value.get())
+
+
+if __name__ == '__main__':
+    unittest.main()
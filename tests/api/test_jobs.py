@@ -0,0 +1,223 @@
+"""
+The state machine of the translation jobs, against an in-memory database and a fake eTranslation,
+such that it's tested without the live services.
+"""
+
+import asyncio
+import datetime
+import io
+import os
+import unittest
+from unittest import mock
+from uuid import uuid4
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.main
+from app import crud, models, schemas
+from app.compression import compress_file
+from app.database import Base
+from app.main import JOB_MAX_ATTEMPTS, JOB_RETRY_DELAY, _poll_jobs, _segment_jobs, _submit_jobs
+from tests.benchmark.fake_services import FakeServer, create_etranslation_app
+from translation.connector.cef_etranslation import AsyncETranslationConnector
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+PAGE_MINIMAL = os.path.join(ROOT, 'tests/media/example_files/page_minimal_working_example.xml')
+
+LEASE = 600
+
+
+class JobsTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        engine = create_engine('sqlite://', connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        self.addCleanup(engine.dispose)
+
+        self.db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+        self.addCleanup(self.db.close)
+
+    def _create_job(self, state=models.JOB_QUEUED, xml_content: bytes = b'', **kwargs) -> models.XMLTrans:
+        db_xml_trans = models.XMLTrans(etranslation_id=uuid4().hex,
+                                       xml_content=compress_file(io.BytesIO(xml_content)),
+                                       filename='page.xml',
+                                       source='fr',
+                                       target='en',
+                                       use_tm=False,
+                                       created=datetime.datetime.now(),
+                                       state=state,
+                                       **kwargs)
+        self.db.add(db_xml_trans)
+        self.db.commit()
+        return db_xml_trans
+
+
+class TestClaim(JobsTestCase):
+
+    def test_lease(self):
+        db_xml_trans = self._create_job()
+
+        self.assertTrue(crud.claim_xml_trans_jobs(self.db, [db_xml_trans], LEASE))
+        self.assertGreater(db_xml_trans.due, datetime.datetime.now(), 'Should be leased.')
+
+        with self.subTest('Claimed'):
+            self.assertFalse(crud.claim_xml_trans_jobs(self.db, [db_xml_trans], LEASE))
+            self.assertListEqual([], crud.get_xml_trans_jobs_due(self.db, models.JOB_QUEUED))
+
+    def test_all_or_nothing(self):
+        jobs = [self._create_job(), self._create_job()]
+        crud.claim_xml_trans_jobs(self.db, jobs[:1], LEASE)
+
+        self.assertFalse(crud.claim_xml_trans_jobs(self.db, jobs, LEASE))
+        self.assertIsNone(jobs[1].due, 'Should not claim part of the jobs.')
+
+    def test_state_changed(self):
+        db_xml_trans = self._create_job()
+        # Moved on by another worker, after this one read it.
+        self.db.query(models.XMLTrans).filter(models.XMLTrans.id == db_xml_trans.id) \
+            .update({models.XMLTrans.state: models.JOB_SEGMENTED}, synchronize_session=False)
+
+        self.assertFalse(crud.claim_xml_trans_jobs(self.db, [db_xml_trans], LEASE))
+
+    def test_expired_lease(self):
+        db_xml_trans = self._create_job()
+        # The worker that claimed it stopped, e.g. a restart.
+        crud.claim_xml_trans_jobs(self.db, [db_xml_trans], -1)
+
+        self.assertListEqual([db_xml_trans], crud.get_xml_trans_jobs_due(self.db, models.JOB_QUEUED),
+                             'Should be due again.')
+        self.assertTrue(crud.claim_xml_trans_jobs(self.db, [db_xml_trans], LEASE))
+
+
+class TestFail(JobsTestCase):
+
+    def test_retry(self):
+        db_xml_trans = self._create_job()
+
+        for attempts in range(1, JOB_MAX_ATTEMPTS):
+            t0 = datetime.datetime.now()
+            crud.fail_xml_trans_jobs(self.db, [db_xml_trans], 'error', JOB_MAX_ATTEMPTS, JOB_RETRY_DELAY)
+
+            with self.subTest(attempts=attempts):
+                self.assertEqual(models.JOB_QUEUED, db_xml_trans.state, 'Should be retried.')
+                self.assertEqual(attempts, db_xml_trans.attempts)
+                self.assertGreaterEqual(db_xml_trans.due,
+                                        t0 + datetime.timedelta(seconds=attempts * JOB_RETRY_DELAY),
+                                        'Should back off.')
+
+        crud.fail_xml_trans_jobs(self.db, [db_xml_trans], 'error', JOB_MAX_ATTEMPTS, JOB_RETRY_DELAY)
+
+        self.assertEqual(models.JOB_FAILED, db_xml_trans.state)
+        self.assertEqual('error', db_xml_trans.error)
+        self.assertListEqual([], crud.get_xml_trans_jobs_due(self.db, models.JOB_QUEUED))
+
+    def test_success_resets_attempts(self):
+        db_xml_trans = self._create_job(models.JOB_SUBMITTED)
+        crud.fail_xml_trans_jobs(self.db, [db_xml_trans], 'error', JOB_MAX_ATTEMPTS, JOB_RETRY_DELAY)
+
+        # Polled again, not finished yet.
+        crud.update_xml_trans_jobs_state(self.db, [db_xml_trans], models.JOB_SUBMITTED, delay=1)
+
+        self.assertEqual(0, db_xml_trans.attempts)
+
+
+class TestStages(JobsTestCase):
+    """
+    The stages of the job workers, with eTranslation faked.
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+
+        self.etranslation = create_etranslation_app()
+        server = FakeServer(self.etranslation).start()
+        self.addCleanup(server.stop)
+
+        self.connector = AsyncETranslationConnector('user', 'password', retries=0)
+        self.connector.url_trans_doc = server.url + '/translate/document'
+        self.connector.url_trans_doc_id = server.url + '/translate/document/{id}'
+
+        patcher = mock.patch.object(app.main, 'ETRANSLATION_CONNECTOR', self.connector)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _run(self, stage, jobs):
+        async def main():
+            try:
+                await stage(jobs, self.db)
+            finally:
+                await self.connector.aclose()
+
+        asyncio.run(main())
+
+    def _create_job_submitted(self, etranslation_id: str) -> models.XMLTrans:
+        db_xml_document = crud.create_xml_document_with_lines(
+            self.db,
+            schemas.XMLDocumentCreate(source='fr', target='en', mt_index=[0]),
+            [schemas.XMLDocumentLineCreate(text='Ceci est un test.', full_match='')])
+
+        db_xml_trans = self._create_job(models.JOB_SUBMITTED, xml_document_id=db_xml_document.id)
+        crud.create_xml_trans_chunks(self.db,
+                                     [schemas.XMLTransChunkCreate(etranslation_id=etranslation_id, offset=0, n=1)],
+                                     xml_id=db_xml_trans.id)
+        return db_xml_trans
+
+    def test_segment_and_submit_batch(self):
+        with open(PAGE_MINIMAL, 'rb') as f:
+            xml_content = f.read()
+        jobs = [self._create_job(xml_content=xml_content),
+                self._create_job(xml_content=b'<PcGts>'),
+                self._create_job(xml_content=xml_content)]
+
+        self._run(_segment_jobs, jobs)
+
+        with self.subTest('Segment'):
+            self.assertListEqual([models.JOB_SEGMENTED, models.JOB_QUEUED, models.JOB_SEGMENTED],
+                                 [db_xml_trans.state for db_xml_trans in jobs],
+                                 'Only the malformed XML should fail.')
+            self.assertEqual(1, jobs[1].attempts)
+            self.assertIn('XMLSyntaxError', jobs[1].error)
+
+        jobs_segmented = [jobs[0], jobs[2]]
+        self._run(_submit_jobs, jobs_segmented)
+
+        with self.subTest('Submit'):
+            self.assertListEqual([models.JOB_SUBMITTED] * 2, [db_xml_trans.state for db_xml_trans in jobs_segmented])
+            self.assertEqual(1, len(self.etranslation.state.documents), 'Should be packed in a single document.')
+            self.assertTrue(all(db_chunk.etranslation_id for db_xml_trans in jobs_segmented
+                                for db_chunk in db_xml_trans.chunks))
+
+    def test_poll(self):
+        self.etranslation.state.documents['1'] = (0, 'text_lines.txt', b'THIS IS A TEST.\n')
+        db_xml_trans = self._create_job_submitted('1')
+
+        self._run(_poll_jobs, [db_xml_trans])
+
+        self.assertEqual(models.JOB_TRANSLATED, db_xml_trans.state)
+        self.assertListEqual(['THIS IS A TEST.'], db_xml_trans.chunks[0].translation)
+
+    def test_poll_pending(self):
+        self.etranslation.state.documents['1'] = (float('inf'), 'text_lines.txt', b'')
+        db_xml_trans = self._create_job_submitted('1')
+        crud.fail_xml_trans_jobs(self.db, [db_xml_trans], 'error', JOB_MAX_ATTEMPTS, JOB_RETRY_DELAY)
+
+        self._run(_poll_jobs, [db_xml_trans])
+
+        self.assertEqual(models.JOB_SUBMITTED, db_xml_trans.state)
+        self.assertEqual(0, db_xml_trans.attempts, 'A successful poll should reset the failed attempts.')
+        self.assertGreater(db_xml_trans.due, datetime.datetime.now(), 'Should be polled again later.')
+
+    def test_poll_not_found(self):
+        db_xml_trans = self._create_job_submitted('unknown')
+
+        self._run(_poll_jobs, [db_xml_trans])
+
+        self.assertEqual(models.JOB_SUBMITTED, db_xml_trans.state)
+        self.assertEqual(1, db_xml_trans.attempts, 'Should count as a failed attempt.')
+        self.assertIn('404', db_xml_trans.error)
+
+
+if __name__ == '__main__':
+    unittest.main()
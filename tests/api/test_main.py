@@ -1,13 +1,18 @@
+import asyncio
+import io
 import os
 import re
 import sys
 import unittest
+import zipfile
+from uuid import uuid4
 
 from fastapi.testclient import TestClient
 from lxml import etree
 
-from app.main import app, _lookup_full_tm_match, _parse_text_page_xml, get_db
-from app.models import XMLDocument
+from app.main import app, MT_CACHE, _lookup_full_tm_match, _lookup_full_tm_matches, _parse_text_page_xml, get_db, \
+    _get_content_hash, _get_mt_lines, _get_mt_stats, _hash_file, _pack_mt_lines, _update_trans_text_lines_with_matches
+from app.models import JOB_FAILED, XMLDocument, XMLTrans
 
 TEST_CLIENT = TestClient(app)
 
@@ -20,6 +25,15 @@ PAGE_MINIMAL = os.path.join(ROOT_MEDIA, 'example_files/page_minimal_working_exam
 PAGE_MINIMAL_MULTI = os.path.join(ROOT_MEDIA, 'example_files/multilingual_page_minimal_working_example.xml')
 
 
+def setUpModule():
+    # Runs the startup events, which start the job workers that process the translations.
+    TEST_CLIENT.__enter__()
+
+
+def tearDownModule():
+    TEST_CLIENT.__exit__(None, None, None)
+
+
 class TestApp(unittest.TestCase):
     def test_root(self):
         """ Test if root url can be accessed
@@ -36,6 +50,17 @@ class TestApp(unittest.TestCase):
 
         self.assertLess(r.status_code, 300, "Status code should indicate a proper connection.")
 
+    def test_metrics(self):
+        """ Test if the metrics are exposed in the Prometheus text format
+        """
+        r = TEST_CLIENT.get('/metrics')
+
+        self.assertLess(r.status_code, 300, "Status code should indicate a proper connection.")
+        self.assertIn('text/plain', r.headers['content-type'])
+        for name in ['translation_stage_seconds', 'etranslation_requests_total', 'mouse_requests_total']:
+            with self.subTest(name):
+                self.assertIn(f'# TYPE {name}', r.text)
+
 
 class TestTranslatePageXML(unittest.TestCase):
     def test_upload(self):
@@ -166,6 +191,17 @@ class TestTranslatePageXML(unittest.TestCase):
         # TODO correct response
         self.assertEqual(response.status_code, 301, "Should indicate when source and target are the same.")
 
+    def test_upload_deadline(self):
+        with open(FILENAME_CLARIAH_XML, 'rb') as f:
+            files = {'file': f}
+            headers = {'source': 'nl',
+                       'target': 'fr',
+                       'deadline': '0'}
+            response = TEST_CLIENT.post("/translate/xml/blocking", files=files, headers=headers)
+
+        self.assertEqual(response.status_code, 504, "Should time out when the deadline has passed.")
+        self.assertIn('id', response.json(), "Should contain the id to retrieve the translation later.")
+
 
 class TestTranslatePageXMLNonBlocking(unittest.TestCase):
 
@@ -210,6 +246,91 @@ class TestTranslatePageXMLNonBlocking(unittest.TestCase):
         self.assertLess(response.status_code, 300, "Status code should indicate a proper connection.")
         self.assertTrue(response.content, "Should contain the xml.")
 
+    def test_read_state(self):
+        with open(PAGE_MINIMAL, 'rb') as f:
+            files = {'file': f}
+            headers = {'source': 'fr',
+                       'target': 'de',
+                       'force': 'true'}
+            response = TEST_CLIENT.post("/translate/xml",
+                                        files=files,
+                                        headers=headers
+                                        )
+
+        id_trans = response.json()['id']
+
+        response = TEST_CLIENT.get(f"/translate/xml/{id_trans}")
+        if response.status_code == 423:
+            self.assertIn(response.json()['state'], ['queued', 'segmented', 'submitted', 'translated', 'assembled'],
+                          "Should contain the state of the translation job.")
+        else:
+            self.assertLess(response.status_code, 300, "Should be translated already or not finished yet.")
+
+    def test_read_not_found(self):
+        response = TEST_CLIENT.get(f"/translate/xml/{uuid4().hex}")
+
+        self.assertEqual(404, response.status_code)
+
+    def test_read_multiple_targets(self):
+        targets = ['en', 'fr', 'de']
+
+        with open(PAGE_MINIMAL, 'rb') as f:
+            files = {'file': f}
+            headers = {'source': 'nl',
+                       'targets': ','.join(targets)}
+            response = TEST_CLIENT.post("/translate/xml/multi",
+                                        files=files,
+                                        headers=headers
+                                        )
+
+        id_trans = response.json()['id']
+
+        import time
+        t0 = time.time()
+        t_max = 120  # seconds
+        while time.time() - t0 < t_max:
+            response = TEST_CLIENT.get(f"/translate/xml/multi/{id_trans}",
+                                       )
+            if response.ok:
+                break
+
+            time.sleep(1)
+
+        self.assertLess(response.status_code, 300, "Status code should indicate a proper connection.")
+
+        with self.subTest('Multilingual'):
+            for target in targets:
+                self.assertIn(f'"{target}"', response.text)
+
+        with self.subTest('Per target language'):
+            response = TEST_CLIENT.get(f"/translate/xml/multi/{id_trans}", params={'split': True})
+
+            with zipfile.ZipFile(io.BytesIO(response.content)) as z:
+                self.assertEqual(len(z.namelist()), len(targets), "Should contain a XML per target language.")
+
+    def test_upload_identical_multiple_targets(self):
+
+        def submit(targets='en,de', **headers):
+            with open(PAGE_MINIMAL, 'rb') as f:
+                response = TEST_CLIENT.post("/translate/xml/multi",
+                                            files={'file': f},
+                                            headers={'source': 'fr',
+                                                     'targets': targets,
+                                                     **headers}
+                                            )
+            return response.json()['id']
+
+        id_trans = submit()
+
+        with self.subTest('Identical'):
+            self.assertEqual(id_trans, submit(targets='de,en'), "Should return the id of the earlier submission.")
+
+        with self.subTest('Other target languages'):
+            self.assertNotEqual(id_trans, submit(targets='en'), "Should be translated again.")
+
+        with self.subTest('Forced'):
+            self.assertNotEqual(id_trans, submit(force='true'), "Should be translated again.")
+
     def test_upload_small(self):
 
         with open(PAGE_MINIMAL, 'rb') as f:
@@ -224,6 +345,80 @@ class TestTranslatePageXMLNonBlocking(unittest.TestCase):
         self.assertLess(response.status_code, 300, "Status code should indicate a proper connection.")
         self.assertIn('id', response.json(), "Should contain the id.")
 
+    def test_upload_identical(self):
+
+        def submit(**headers):
+            with open(PAGE_MINIMAL, 'rb') as f:
+                response = TEST_CLIENT.post("/translate/xml",
+                                            files={'file': f},
+                                            headers={'source': 'fr',
+                                                     'target': 'en',
+                                                     **headers}
+                                            )
+            return response.json()['id']
+
+        id_trans = submit()
+
+        with self.subTest('Identical'):
+            self.assertEqual(id_trans, submit(), "Should return the id of the earlier submission.")
+
+        with self.subTest('Other parameters'):
+            self.assertNotEqual(id_trans, submit(**{'use-tm': 'true'}), "Should be translated again.")
+
+        with self.subTest('Forced'):
+            self.assertNotEqual(id_trans, submit(force='true'), "Should be translated again.")
+
+    def test_upload_identical_failed(self):
+        with open(PAGE_MINIMAL, 'rb') as f:
+            # Unique, such that it isn't identical to the submissions of the other tests.
+            content = f.read() + f'<!-- {uuid4().hex} -->'.encode('utf-8')
+
+        db = next(get_db())
+        db_xml_trans = XMLTrans(etranslation_id=uuid4().hex,
+                                content_hash=_get_content_hash(_hash_file(io.BytesIO(content)), 'fr', 'en', False),
+                                state=JOB_FAILED)
+        db.add(db_xml_trans)
+        db.commit()
+
+        response = TEST_CLIENT.post("/translate/xml",
+                                    files={'file': ('page.xml', content)},
+                                    headers={'source': 'fr',
+                                             'target': 'en'}
+                                    )
+
+        self.assertNotEqual(db_xml_trans.etranslation_id, response.json()['id'], "Should be translated again.")
+
+    def test_upload_malformed(self):
+        headers = {'source': 'fr',
+                   'target': 'en'}
+
+        with self.subTest('Not XML'):
+            response = TEST_CLIENT.post("/translate/xml",
+                                        files={'file': ('page.xml', b'not an XML')},
+                                        headers=headers
+                                        )
+            self.assertEqual(422, response.status_code, "Should be refused instead of queued.")
+            self.assertIn('page.xml', response.json()['message'])
+
+        with self.subTest('Truncated'):
+            with open(PAGE_MINIMAL, 'rb') as f:
+                content = f.read()
+            response = TEST_CLIENT.post("/translate/xml",
+                                        files={'file': ('page.xml', content[:len(content) // 2])},
+                                        headers=headers
+                                        )
+            self.assertEqual(422, response.status_code)
+
+        with self.subTest('Batch'):
+            with open(PAGE_MINIMAL, 'rb') as f:
+                response = TEST_CLIENT.post("/translate/xml/batch",
+                                            files=[('files', f),
+                                                   ('files', ('malformed.xml', b'<PcGts>'))],
+                                            headers=headers
+                                            )
+            self.assertEqual(422, response.status_code)
+            self.assertIn('malformed.xml', response.json()['message'])
+
     def test_read_small(self):
 
         with open(PAGE_MINIMAL, 'rb') as f:
@@ -287,6 +482,81 @@ class TestTranslatePageXMLNonBlocking(unittest.TestCase):
             self._check_tree_equal(child_i, child_j)
 
 
+class TestTranslatePageXMLBatch(unittest.TestCase):
+
+    def test_read(self):
+        with open(FILENAME_CLARIAH_XML, 'rb') as f_1, open(PAGE_MINIMAL, 'rb') as f_2:
+            files = [('files', f_1),
+                     ('files', f_2)]
+            headers = {'source': 'nl',
+                       'target': 'fr'}
+            response = TEST_CLIENT.post("/translate/xml/batch",
+                                        files=files,
+                                        headers=headers
+                                        )
+
+        self.assertLess(response.status_code, 300, "Status code should indicate a proper connection.")
+        self.assertEqual(len(response.json()['pages']), 2, "Should contain the status per XML.")
+
+        id_batch = response.json()['id']
+
+        import time
+        t0 = time.time()
+        t_max = 120  # seconds
+        while time.time() - t0 < t_max:
+            response = TEST_CLIENT.get(f"/translate/xml/batch/{id_batch}")
+            if all(page['is_translated'] for page in response.json()['pages']):
+                break
+
+            time.sleep(1)
+
+        for page in response.json()['pages']:
+            with self.subTest(page['filename']):
+                response_page = TEST_CLIENT.get(f"/translate/xml/{page['id']}")
+
+                self.assertLess(response_page.status_code, 300, "Should be able to retrieve each XML.")
+
+    def test_upload_identical(self):
+
+        def submit(*paths, **headers):
+            files = [('files', (os.path.basename(path), open(path, 'rb').read())) for path in paths]
+            response = TEST_CLIENT.post("/translate/xml/batch",
+                                        files=files,
+                                        headers={'source': 'nl',
+                                                 'target': 'fr',
+                                                 **headers}
+                                        )
+            return response.json()['id']
+
+        id_batch = submit(FILENAME_CLARIAH_XML, PAGE_MINIMAL)
+
+        with self.subTest('Identical'):
+            self.assertEqual(id_batch, submit(PAGE_MINIMAL, FILENAME_CLARIAH_XML),
+                             "Should return the id of the earlier batch.")
+
+        with self.subTest('Other XML\'s'):
+            self.assertNotEqual(id_batch, submit(PAGE_MINIMAL), "Should be translated again.")
+
+        with self.subTest('Forced'):
+            self.assertNotEqual(id_batch, submit(FILENAME_CLARIAH_XML, PAGE_MINIMAL, force='true'),
+                                "Should be translated again.")
+
+    def test_pack_mt_lines(self):
+        l_mt_groups = [[['aaa', 'bbb']], [], [['ccc'], ['ddd', 'eee']], [['fff', 'ggg', 'hhh']]]
+
+        documents, l_chunks = _pack_mt_lines(l_mt_groups, max_size=8)
+
+        with self.subTest('Groups in the same document'):
+            self.assertListEqual(documents, [['aaa', 'bbb'], ['ccc'], ['ddd', 'eee'], ['fff', 'ggg'], ['hhh']],
+                                 'A group should only be split if it does not fit in a single document.')
+            self.assertListEqual(l_chunks, [[(0, 0, 2)], [], [(1, 0, 1), (2, 0, 2)], [(3, 0, 2), (4, 0, 1)]])
+
+        with self.subTest('Split back'):
+            for mt_groups, chunks in zip(l_mt_groups, l_chunks):
+                self.assertListEqual([line for i, offset, n in chunks for line in documents[i][offset:offset + n]],
+                                     [line for group in mt_groups for line in group])
+
+
 class TestGetAllXMLS(unittest.TestCase):
     def test_get_xmls(self, verbose=1):
         response = TEST_CLIENT.get("/translate/xmls/",
@@ -305,16 +575,75 @@ class TestGetAllXMLS(unittest.TestCase):
 class TestParseXMLTextLines(unittest.TestCase):
 
     def test_lookup_full_tm_match(self):
-        full_match = _lookup_full_tm_match('this is a test', 'en-nl')
+        full_match = asyncio.run(_lookup_full_tm_match('this is a test', 'en-nl'))
         self.assertIsInstance(full_match, str)
 
+    def test_lookup_full_tm_matches(self):
+        segments = ['this is a test', 'this', 'this is a test']
+        full_matches = asyncio.run(_lookup_full_tm_matches(segments, 'en-nl'))
+        self.assertEqual(len(full_matches), len(segments))
+        self.assertEqual(full_matches[0], asyncio.run(_lookup_full_tm_match(segments[0], 'en-nl')))
+
     def test_parse_text_page_xml(self):
         lines = ['this', 'this is a', 'this is a test']
         db = next(get_db())
-        db_xml_document = _parse_text_page_xml(lines, 'en', 'nl', db)
+        db_xml_document = asyncio.run(_parse_text_page_xml(lines, 'en', 'nl', db))
         self.assertIsInstance(db_xml_document, XMLDocument)
         self.assertEqual(len(db_xml_document.lines), 3)
 
+        with self.subTest('MT index'):
+            mt_lines = _get_mt_lines(db_xml_document)
+            self.assertListEqual(mt_lines, [line.text for line in db_xml_document.lines if not line.full_match],
+                                 'Only lines without a match should be sent to MT.')
+
+            translated_lines = _update_trans_text_lines_with_matches(mt_lines, db_xml_document)
+            self.assertListEqual(translated_lines, [line.full_match or line.text for line in db_xml_document.lines],
+                                 'MT output should be scattered back to the original positions.')
+
+    def test_parse_text_page_xml_duplicates(self):
+        header = f'Advertentie {uuid4().hex}'
+        lines = [header, f'this is a test {uuid4().hex}', header + ' ', '', header.replace(' ', '  ')]
+        db = next(get_db())
+        db_xml_document = asyncio.run(_parse_text_page_xml(lines, 'en', 'nl', db, use_tm=False))
+
+        mt_lines = _get_mt_lines(db_xml_document)
+        self.assertListEqual(mt_lines, [header, lines[1]], 'Repeated and empty lines should not be sent to MT.')
+
+        translated_lines = _update_trans_text_lines_with_matches(['A', 'B'], db_xml_document)
+        self.assertListEqual(translated_lines, ['A', 'B', 'A', '', 'A'],
+                             'MT output should be expanded back to every repeated line.')
+
+        stats = _get_mt_stats(db_xml_document)
+        self.assertEqual(stats.chars_saved, sum(map(len, lines)) - sum(map(len, mt_lines)))
+
+    def test_parse_text_page_xml_cached_mt(self):
+        lines = [f'cached {uuid4().hex}', f'not cached {uuid4().hex}']
+        MT_CACHE.set_many('en', 'nl', {lines[0]: 'gecachet'})
+        db = next(get_db())
+        db_xml_document = asyncio.run(_parse_text_page_xml(lines, 'en', 'nl', db, use_tm=False))
+
+        self.assertListEqual(_get_mt_lines(db_xml_document), lines[1:], 'Cached lines should not be sent to MT.')
+        self.assertListEqual(_update_trans_text_lines_with_matches(['B'], db_xml_document), ['gecachet', 'B'])
+
+        stats = _get_mt_stats(db_xml_document)
+        self.assertEqual(stats.lines_no_match, 2, 'Cached lines are no TM match.')
+        self.assertEqual(stats.lines_cached_mt, 1)
+        self.assertEqual(stats.chars_cached_mt, len(lines[0]))
+
+    def test_parse_text_page_xml_job(self):
+        lines = [f'line {i} {uuid4().hex}' for i in range(500)]
+        db = next(get_db())
+        # Not queued, such that the job workers leave it alone.
+        db_xml_trans = XMLTrans(etranslation_id=uuid4().hex, state=JOB_FAILED)
+        db.add(db_xml_trans)
+        db.commit()
+
+        db_xml_document = asyncio.run(_parse_text_page_xml(lines, 'en', 'nl', db, use_tm=False,
+                                                           db_xml_trans=db_xml_trans))
+
+        self.assertEqual(db_xml_document.id, db_xml_trans.xml_document_id, 'Should link the job to the document.')
+        self.assertListEqual(lines, [line.text for line in db_xml_document.lines], 'Should keep the order.')
+
 
 def _single_line_html(l,
                       b_replace_quote=True):
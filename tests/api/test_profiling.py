@@ -0,0 +1,45 @@
+import os
+import pstats
+import tempfile
+import unittest
+
+from app import profiling
+
+
+class TestProfile(unittest.TestCase):
+
+    def test_profiled(self):
+        self.assertIs(sorted, profiling.profiled(sorted), 'Should not profile outside of a profiled request.')
+
+    def test_save(self):
+        profile = profiling.Profile('POST /translate/xml')
+
+        with profile.record('request'):
+            func = profiling.profiled(sorted)
+            self.assertEqual([1, 2, 3], func([3, 1, 2]))
+
+        self.assertIsNone(profiling.get_current_profile())
+
+        with tempfile.TemporaryDirectory() as d:
+            profile.save(d)
+
+            with open(profiling.get_profile_path(profile.id, 'txt', d)) as f:
+                report = f.read()
+            stats = pstats.Stats(profiling.get_profile_path(profile.id, 'prof', d))
+
+            profiles = profiling.list_profiles(d)
+
+        self.assertIn('== request:', report)
+        self.assertIn('allocations', report)
+        self.assertTrue(any(func_name == '<built-in method builtins.sorted>' for _, _, func_name in stats.stats),
+                        'Should profile the calls of the executor.')
+        self.assertEqual([profile.id], [p['id'] for p in profiles])
+        self.assertEqual('POST /translate/xml', profiles[0]['description'])
+
+    def test_is_profile_id(self):
+        self.assertTrue(profiling.is_profile_id(profiling.Profile('').id))
+        self.assertFalse(profiling.is_profile_id(os.path.join('..', 'sql_app')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
+import io
 import unittest
 
-from app.schemas import XMLDocumentLineBase
+from app.compression import compress_file, open_decompressed
+from app.schemas import XMLDocumentLineBase, XMLTrans
 
 
 class TestXMLDocumentLineBase(unittest.TestCase):
@@ -15,3 +17,39 @@ class TestXMLDocumentLineBase(unittest.TestCase):
 
         with self.subTest('Match'):
             self.assertEqual(obj.full_match, full_match)
+
+
+class TestXMLTrans(unittest.TestCase):
+    def test_xml_content(self):
+        xml_content = '<?xml version="1.0" encoding="UTF-8"?><PcGts>é</PcGts>'
+        xml_content_compressed = compress_file(io.BytesIO(xml_content.encode('utf-8')))
+
+        with self.subTest('Compressed'):
+            self.assertLess(len(xml_content_compressed), 2 * len(xml_content))
+            with open_decompressed(xml_content_compressed) as f:
+                self.assertEqual(xml_content.encode('utf-8'), f.read())
+
+        obj = XMLTrans(id='1',
+                       etranslation_id='abc',
+                       xml_content=xml_content_compressed,
+                       filename='page.xml',
+                       source='nl',
+                       target='en',
+                       use_tm=False,
+                       xml_document_id=1)
+
+        with self.subTest('Decompressed'):
+            self.assertEqual(xml_content, obj.xml_content)
+
+    def test_xml_content_not_utf8(self):
+        xml_content = '<?xml version="1.0" encoding="ISO-8859-1"?><PcGts>é</PcGts>'
+
+        obj = XMLTrans(id='1',
+                       etranslation_id='abc',
+                       xml_content=compress_file(io.BytesIO(xml_content.encode('iso-8859-1'))),
+                       filename='page.xml',
+                       source='nl',
+                       target='en',
+                       use_tm=False)
+
+        self.assertEqual(xml_content.replace('é', '\ufffd'), obj.xml_content)
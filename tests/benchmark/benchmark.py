@@ -0,0 +1,143 @@
+"""
+End-to-end benchmark of the app, against the local stand-ins of eTranslation and Mouse in fake_services.
+
+The pages in tests/media are translated with /translate/xml/blocking at each concurrency, e.g.:
+    python -m tests.benchmark.benchmark --concurrency 1 4 16 --requests 32 --queue-delay 2
+
+Reports per page and concurrency the p50/p95/p99 latency in seconds and the pages translated per second.
+By default the MT cache and TM cache are disabled, such that every page goes through MT.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+import numpy as np
+
+from .fake_services import FakeServer, create_etranslation_app, create_mouse_app
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+ROOT_MEDIA = os.path.join(ROOT, 'tests/media')
+
+# Name: (path, source language), from small to large.
+PAGES = {'minimal': (os.path.join(ROOT_MEDIA, 'example_files/page_minimal_working_example.xml'), 'fr'),
+         'bris': (os.path.join(ROOT_MEDIA, 'BRIS/20091542_p001.xml'), 'nl'),
+         'clariah': (os.path.join(ROOT_MEDIA, 'CLARIAH-VL_examples/1KBR/De_Standaard_19190401/PERO_OCR/'
+                                              'KB_JB840_1919-04-01_01_0_fixed.xml'), 'nl')}
+TARGET = 'en'
+
+
+class _NoCache:
+    """
+    Stand-in for the MT cache, such that repeated pages are translated again.
+    """
+
+    def get_many(self, source, target, segments):
+        return {}
+
+    def set_many(self, source, target, translations):
+        pass
+
+
+async def run(url: str, filename: str, source: str, concurrency: int, n_requests: int, use_tm: bool) -> dict:
+    """
+    Returns:
+        Latency percentiles in seconds, pages per second and amount of failed requests.
+    """
+
+    with open(filename, 'rb') as f:
+        content = f.read()
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async with httpx.AsyncClient(base_url=url, timeout=None) as client:
+        async def translate():
+            nonlocal errors
+            async with semaphore:
+                t0 = time.perf_counter()
+                r = await client.post('/translate/xml/blocking',
+                                      files={'file': (os.path.basename(filename), content)},
+                                      headers={'source': source,
+                                               'target': TARGET,
+                                               'use-tm': str(use_tm).lower(),
+                                               # Identical submissions would be answered from the database.
+                                               'force': 'true'})
+                if r.status_code == 200:
+                    latencies.append(time.perf_counter() - t0)
+                else:
+                    errors += 1
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(translate() for _ in range(n_requests)))
+        t_total = time.perf_counter() - t0
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies else (float('nan'),) * 3
+
+    return {'p50': p50,
+            'p95': p95,
+            'p99': p99,
+            'pages_per_second': len(latencies) / t_total,
+            'errors': errors}
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', nargs='+', choices=list(PAGES), default=list(PAGES))
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=16, help='Requests per page and concurrency.')
+    parser.add_argument('--latency', type=float, default=.05, help='Delay of every response of the fake services.')
+    parser.add_argument('--queue-delay', type=float, default=1., help='Time until eTranslation translated a document.')
+    parser.add_argument('--error-rate', type=float, default=0., help='Fraction of the fake responses that are a 503.')
+    parser.add_argument('--use-tm', action='store_true', help='Look up the sentences in (the empty) Mouse.')
+    parser.add_argument('--warm', action='store_true', help='Keep the MT and TM caches enabled.')
+    parser.add_argument('--json', help='Save the results to this file as well.')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='benchmark_')
+
+    with FakeServer(create_etranslation_app(args.latency, args.queue_delay, args.error_rate)) as etranslation, \
+            FakeServer(create_mouse_app(args.latency, args.error_rate)) as mouse:
+        # The connectors and caches read their configuration when they are imported.
+        os.environ.update(ETRANSLATION=etranslation.url,
+                          MOUSE=mouse.url,
+                          CEF_LOGIN='benchmark',
+                          CEF_PASSW='benchmark',
+                          MT_CACHE_PATH=os.path.join(workdir, 'mt_cache.db'),
+                          SQLALCHEMY_DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'sql_app.db')}")
+        if not args.warm:
+            os.environ['TM_CACHE_SIZE'] = '0'
+        sys.path.insert(0, ROOT)
+
+        import app.main
+
+        if not args.warm:
+            app.main.MT_CACHE = _NoCache()
+
+        results: Dict[str, Dict[int, dict]] = {}
+        with FakeServer(app.main.app) as server:
+            for page in args.pages:
+                filename, source = PAGES[page]
+                for concurrency in args.concurrency:
+                    result = asyncio.run(run(server.url, filename, source, concurrency, args.requests, args.use_tm))
+                    results.setdefault(page, {})[concurrency] = result
+
+                    print(f"{page:>8} concurrency {concurrency:>3}: "
+                          f"p50 {result['p50']:7.3f}s  p95 {result['p95']:7.3f}s  p99 {result['p99']:7.3f}s  "
+                          f"{result['pages_per_second']:7.2f} pages/s  {result['errors']} errors", flush=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""
+Local stand-ins for eTranslation and Mouse, implementing the endpoints used by
+translation.connector.cef_etranslation and tm.tm_connector.
+
+The latency of every request, the time a document waits in the eTranslation queue and the rate of failing requests
+are configurable, to benchmark the app without the live services, see tests/benchmark/benchmark.py.
+
+Run them standalone with e.g.:
+    python -m tests.benchmark.fake_services --etranslation-port 8001 --mouse-port 8002 --queue-delay 5
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import socket
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, File, Form, Request, Response, UploadFile
+from fastapi.responses import JSONResponse
+
+
+def create_etranslation_app(latency: float = 0.,
+                            queue_delay: float = 0.,
+                            error_rate: float = 0.) -> FastAPI:
+    """
+    Fake eTranslation. Documents are "translated" by upper casing every line, keeping the amount of lines.
+
+    Args:
+        latency: Delay of every response in seconds.
+        queue_delay: Time in seconds until a submitted document is translated.
+        error_rate: Fraction of the requests that get a 503, which the connector retries.
+    """
+
+    app = FastAPI()
+    app.state.documents = {}
+    ids = itertools.count(1)
+
+    @app.middleware("http")
+    async def delay_or_fail(request: Request, call_next):
+        if latency:
+            await asyncio.sleep(latency)
+        if random.random() < error_rate:
+            return JSONResponse({'message': 'fake error.'}, status_code=503)
+        return await call_next(request)
+
+    @app.get("/info")
+    async def info():
+        return {'service': 'fake eTranslation'}
+
+    @app.post("/translate/document")
+    async def trans_doc(source: str = Form(...),
+                        target: str = Form(...),
+                        file: UploadFile = File(...)):
+        id_doc = str(next(ids))
+        app.state.documents[id_doc] = (time.monotonic() + queue_delay, file.filename, _translate(await file.read()))
+        return id_doc
+
+    @app.get("/translate/document/{id_doc}")
+    async def trans_doc_id(id_doc: str):
+        if id_doc not in app.state.documents:
+            return JSONResponse({'message': 'document not found.'}, status_code=404)
+
+        t_finished, filename, content = app.state.documents[id_doc]
+        if time.monotonic() < t_finished:
+            return JSONResponse({'message': 'translation not finished.'}, status_code=423)
+
+        return _document_response(content, filename)
+
+    @app.post("/translate/document/blocking")
+    async def trans_doc_blocking(source: str = Form(...),
+                                 target: str = Form(...),
+                                 file: UploadFile = File(...)):
+        await asyncio.sleep(queue_delay)
+        return _document_response(_translate(await file.read()), file.filename)
+
+    @app.post("/translate/snippet/blocking")
+    async def trans_snippet_blocking(source: str = Form(...),
+                                     target: str = Form(...),
+                                     snippet: str = Form(...)):
+        await asyncio.sleep(queue_delay)
+        return snippet.upper()
+
+    return app
+
+
+def create_mouse_app(latency: float = 0.,
+                     error_rate: float = 0.) -> FastAPI:
+    """
+    Fake Mouse, an in-memory TM with exact matches only.
+
+    Args:
+        latency: Delay of every response in seconds.
+        error_rate: Fraction of the requests that get a 503.
+    """
+
+    app = FastAPI()
+    # {(key, langpair): {segment: translation}}
+    app.state.tus = {}
+
+    @app.middleware("http")
+    async def delay_or_fail(request: Request, call_next):
+        if latency:
+            await asyncio.sleep(latency)
+        if random.random() < error_rate:
+            return JSONResponse({'message': 'fake error.'}, status_code=503)
+        return await call_next(request)
+
+    @app.get("/admin/tminfo")
+    async def tminfo(key: str = ''):
+        return {'langPairs': sorted({langpair for k, langpair in app.state.tus if k == key})}
+
+    @app.get("/get")
+    async def get(q: str, langpair: str, key: str = '', conc: str = 'False'):
+        tra = app.state.tus.get((key, langpair), {}).get(q)
+        matches = [] if tra is None else [{'segment': q, 'translation': tra, 'match': 1.0}]
+        return {'matches': matches}
+
+    @app.post("/set")
+    async def set_tu(seg: str = Form(...), tra: str = Form(...), langpair: str = Form(...), key: str = Form('')):
+        app.state.tus.setdefault((key, langpair), {})[seg] = tra
+        return {'message': 'ok'}
+
+    @app.post("/delete")
+    async def delete_tu(seg: str = Form(...), tra: str = Form(...), langpair: str = Form(...), key: str = Form('')):
+        app.state.tus.get((key, langpair), {}).pop(seg, None)
+        return {'message': 'ok'}
+
+    @app.get("/tu/amount")
+    async def tu_amount(langpair: str, key: str = ''):
+        return Response(str(len(app.state.tus.get((key, langpair), {}))))
+
+    return app
+
+
+class FakeServer:
+    """
+    Serves an app with uvicorn in a background thread, on a free local port.
+    """
+
+    def __init__(self, app, port: int = None):
+        self.port = port or _get_free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+
+        self._server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=self.port, log_level='warning'))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(.01)
+        return self
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _translate(content: bytes) -> bytes:
+    return ''.join(line.upper() + '\n' for line in content.decode('utf-8').splitlines()).encode('utf-8')
+
+
+def _document_response(content: bytes, filename: str) -> Response:
+    return Response(content,
+                    media_type='text/plain',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+def _get_free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--etranslation-port', type=int, default=8001)
+    parser.add_argument('--mouse-port', type=int, default=8002)
+    parser.add_argument('--latency', type=float, default=0., help='Delay of every response in seconds.')
+    parser.add_argument('--queue-delay', type=float, default=1., help='Time in seconds until a document is translated.')
+    parser.add_argument('--error-rate', type=float, default=0., help='Fraction of the requests that get a 503.')
+    args = parser.parse_args()
+
+    with FakeServer(create_etranslation_app(args.latency, args.queue_delay, args.error_rate), args.etranslation_port) \
+            as etranslation, \
+            FakeServer(create_mouse_app(args.latency, args.error_rate), args.mouse_port) as mouse:
+        print(f'ETRANSLATION={etranslation.url}')
+        print(f'MOUSE={mouse.url}')
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from fastapi.testclient import TestClient
+
+from tests.benchmark.fake_services import create_etranslation_app, create_mouse_app
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+
+
+class TestFakeServices(unittest.TestCase):
+
+    def test_etranslation(self):
+        client = TestClient(create_etranslation_app(queue_delay=.2))
+
+        response = client.post('/translate/document',
+                               data={'source': 'nl', 'target': 'en'},
+                               files={'file': ('text_lines.txt', b'een\ntwee\n')})
+        id_doc = response.json()
+
+        self.assertEqual(423, client.get(f'/translate/document/{id_doc}').status_code,
+                         'Should wait in the queue.')
+
+        time.sleep(.2)
+        response = client.get(f'/translate/document/{id_doc}')
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(b'EEN\nTWEE\n', response.content, 'Should keep a line per line.')
+        self.assertIn('filename=', response.headers['Content-Disposition'])
+
+    def test_error_rate(self):
+        client = TestClient(create_etranslation_app(error_rate=1.))
+
+        self.assertEqual(503, client.get('/info').status_code)
+
+    def test_mouse(self):
+        client = TestClient(create_mouse_app())
+
+        client.post('/set', data={'key': '', 'langpair': 'nl-en', 'seg': 'een', 'tra': 'one'})
+
+        matches = client.get('/get', params={'q': 'een', 'langpair': 'nl-en'}).json()['matches']
+        self.assertEqual('one', matches[0]['translation'])
+        self.assertEqual([], client.get('/get', params={'q': 'twee', 'langpair': 'nl-en'}).json()['matches'])
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_benchmark(self):
+        """ Runs the benchmark in a separate process, as it configures the app before importing it.
+        """
+
+        with tempfile.TemporaryDirectory() as d:
+            filename = os.path.join(d, 'results.json')
+            subprocess.run([sys.executable, '-m', 'tests.benchmark.benchmark',
+                            '--pages', 'minimal',
+                            '--concurrency', '1', '2',
+                            '--requests', '2',
+                            '--latency', '0',
+                            '--queue-delay', '.1',
+                            '--json', filename],
+                           cwd=ROOT, check=True, timeout=300)
+
+            with open(filename) as f:
+                results = json.load(f)
+
+        for concurrency in ['1', '2']:
+            with self.subTest(concurrency=concurrency):
+                result = results['minimal'][concurrency]
+                self.assertEqual(0, result['errors'])
+                self.assertLessEqual(result['p50'], result['p99'])
+                self.assertGreater(result['pages_per_second'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
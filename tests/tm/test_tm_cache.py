@@ -0,0 +1,147 @@
+import asyncio
+import os
+import tempfile
+import time
+from unittest import TestCase
+
+from tm.tm_cache import AsyncCachedTmConnector, CachedTmConnector, TmCache
+from tm.tm_connector import TmConnector
+
+
+class FakeTmConnector(TmConnector):
+    """
+    In-memory TM that counts the lookups.
+    """
+
+    def __init__(self):
+        self.tus = {}
+        self.n_lookup = 0
+
+    def lookup_tu(self, concordance: bool, key: str, langpair: str, q: str):
+        self.n_lookup += 1
+        if q in self.tus:
+            return [{'segment': q, 'translation': self.tus[q], 'match': 1.0}]
+        return []
+
+    def add_tu(self, key: str, langpair: str, seg: str, tra: str):
+        self.tus[seg] = tra
+
+    def delete_tu(self, key: str, langpair: str, seg: str, tra: str):
+        self.tus.pop(seg, None)
+
+
+class AsyncFakeTmConnector(TmConnector):
+    """
+    Asynchronous FakeTmConnector.
+    """
+
+    def __init__(self, tm: FakeTmConnector):
+        self.tm = tm
+
+    async def lookup_tu(self, concordance: bool, key: str, langpair: str, q: str):
+        return self.tm.lookup_tu(concordance, key, langpair, q)
+
+    async def lookup_tu_many(self, concordance: bool, key: str, langpair: str, segments):
+        return self.tm.lookup_tu_many(concordance, key, langpair, segments)
+
+
+class TmCacheTest(TestCase):
+    PAIR = 'en-nl'
+    NL_SENT = 'dit is een test'
+    EN_SENT = 'this is a test'
+
+    def setUp(self):
+        self.tm = FakeTmConnector()
+        self.tm.add_tu('', self.PAIR, self.EN_SENT, self.NL_SENT)
+        self.conn = CachedTmConnector(self.tm, TmCache(maxsize=2, ttl=60))
+
+    def test_hit(self):
+        matches = self.conn.lookup_tu(False, '', self.PAIR, self.EN_SENT)
+        matches_cached = self.conn.lookup_tu(False, '', self.PAIR, self.EN_SENT)
+
+        self.assertEqual(matches, matches_cached)
+        self.assertEqual(self.tm.n_lookup, 1, 'Second lookup should come from the cache.')
+        self.assertEqual(self.conn.cache.stats()['hits'], 1)
+        self.assertEqual(self.conn.cache.stats()['misses'], 1)
+
+    def test_miss_is_cached(self):
+        self.conn.lookup_tu(False, '', self.PAIR, 'no match')
+        matches = self.conn.lookup_tu(False, '', self.PAIR, 'no match')
+
+        self.assertEqual(matches, [])
+        self.assertEqual(self.tm.n_lookup, 1)
+
+    def test_eviction(self):
+        for q in ['a', 'b', 'c']:
+            self.conn.lookup_tu(False, '', self.PAIR, q)
+
+        self.assertEqual(self.conn.cache.stats()['evictions'], 1)
+        self.assertEqual(self.conn.cache.stats()['size'], 2)
+
+        self.conn.lookup_tu(False, '', self.PAIR, 'a')
+        self.assertEqual(self.tm.n_lookup, 4, 'Least recently used lookup should be evicted.')
+
+    def test_ttl(self):
+        self.conn.cache.ttl = 0.01
+        self.conn.lookup_tu(False, '', self.PAIR, self.EN_SENT)
+        time.sleep(0.02)
+        self.conn.lookup_tu(False, '', self.PAIR, self.EN_SENT)
+
+        self.assertEqual(self.tm.n_lookup, 2, 'Expired lookups should not be used.')
+
+    def test_add_delete_invalidate(self):
+        self.assertEqual(self.conn.lookup_tu(False, '', self.PAIR, 'new'), [])
+
+        self.conn.add_tu('', self.PAIR, 'new', 'nieuw')
+        with self.subTest('add'):
+            self.assertEqual(self.conn.lookup_tu(False, '', self.PAIR, 'new')[0]['translation'], 'nieuw')
+
+        self.conn.delete_tu('', self.PAIR, 'new', 'nieuw')
+        with self.subTest('delete'):
+            self.assertEqual(self.conn.lookup_tu(False, '', self.PAIR, 'new'), [])
+
+    def test_lookup_tu_many(self):
+        self.conn.lookup_tu(False, '', self.PAIR, self.EN_SENT)
+
+        segments = [self.EN_SENT, 'no match', 'no match']
+        l_matches = self.conn.lookup_tu_many(False, '', self.PAIR, segments)
+
+        self.assertEqual(l_matches, [self.tm.lookup_tu(False, '', self.PAIR, q) for q in segments])
+        self.assertEqual(self.tm.n_lookup, 2 + len(segments), 'Only the distinct miss should be looked up.')
+
+    def test_persistent(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'tm_cache.db')
+
+            CachedTmConnector(self.tm, TmCache(path=path)).lookup_tu(False, '', self.PAIR, self.EN_SENT)
+
+            conn = CachedTmConnector(self.tm, TmCache(path=path))
+            matches = conn.lookup_tu(False, '', self.PAIR, self.EN_SENT)
+
+            self.assertEqual(matches[0]['translation'], self.NL_SENT)
+            self.assertEqual(self.tm.n_lookup, 1, 'Lookup should survive a restart.')
+
+    def test_get_set_many(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'tm_cache.db')
+
+            l_matches = {q: self.tm.lookup_tu(False, '', self.PAIR, q) for q in [self.EN_SENT, 'no match']}
+            TmCache(path=path).set_many('', self.PAIR, l_matches)
+
+            cache = TmCache(path=path)
+            found = cache.get_many('', self.PAIR, [self.EN_SENT, 'no match', 'unknown', self.EN_SENT])
+
+            self.assertEqual(found, l_matches, 'Should read the persistent tier.')
+            self.assertEqual(cache.stats()['hits'], 2)
+            self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_async_lookup_tu_many(self):
+        conn = AsyncCachedTmConnector(AsyncFakeTmConnector(self.tm), self.conn.cache)
+        segments = [self.EN_SENT, 'no match', 'no match']
+
+        l_matches = asyncio.run(conn.lookup_tu_many(False, '', self.PAIR, segments))
+        l_matches_cached = asyncio.run(conn.lookup_tu_many(False, '', self.PAIR, segments))
+
+        self.assertEqual(l_matches, l_matches_cached)
+        self.assertEqual(l_matches, [self.tm.lookup_tu(False, '', self.PAIR, q) for q in segments])
+        self.assertEqual(self.tm.n_lookup, 2 + len(segments), 'Second lookup should come from the cache.')
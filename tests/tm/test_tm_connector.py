@@ -33,6 +33,13 @@ class MouseTmConnectorTest(TestCase):
         self.assertEqual(matches[0]["segment"], self.EN_SENT)
         self.assertEqual(matches[0]["translation"], self.NL_SENT)
 
+    def test_lookup_tu_many(self):
+        segments = [self.EN_SENT, 'no match for this sentence', self.EN_SENT]
+        l_matches = self.conn.lookup_tu_many(False, '', self.PAIR, segments)
+        self.assertEqual(len(l_matches), len(segments), 'Should return matches for each segment.')
+        self.assertEqual(l_matches[0], self.conn.lookup_tu(False, '', self.PAIR, self.EN_SENT))
+        self.assertEqual(l_matches[0], l_matches[2], 'Duplicate segments should give the same matches.')
+
     def test_add_tu(self):
         response = self.conn.add_tu('', self.PAIR, self.EN_SENT, self.NL_SENT)
         print(response.content)
@@ -0,0 +1,68 @@
+import asyncio
+import collections
+import unittest
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from tests.benchmark.fake_services import FakeServer
+from translation.connector.cef_etranslation import AsyncETranslationConnector, ETranslationConnector
+
+RETRIES = 2
+
+
+def _create_app(status_code: int) -> FastAPI:
+    """
+    Answers every request with the status code, and counts the requests per method.
+    """
+
+    app = FastAPI()
+    app.state.requests = collections.Counter()
+
+    @app.middleware("http")
+    async def count(request: Request, call_next):
+        app.state.requests[request.method] += 1
+        return JSONResponse({'message': 'fake error.'}, status_code=status_code)
+
+    return app
+
+
+class TestRetries(unittest.TestCase):
+
+    def _count_requests(self, status_code: int) -> collections.Counter:
+        """
+        Requests made by the sync and async connector, for a GET and a POST each.
+        """
+
+        app = _create_app(status_code)
+        with FakeServer(app) as server:
+            connector = ETranslationConnector('user', 'password', retries=RETRIES, backoff_factor=0)
+            connector._get(server.url)
+            connector._post(server.url, data={'source': 'nl'})
+
+            async_connector = AsyncETranslationConnector('user', 'password', retries=RETRIES, backoff_factor=0)
+
+            async def main():
+                await async_connector._get(server.url)
+                await async_connector._post(server.url, data={'source': 'nl'})
+                await async_connector.aclose()
+
+            asyncio.run(main())
+
+        return app.state.requests
+
+    def test_server_error(self):
+        requests = self._count_requests(503)
+
+        self.assertEqual(2 * (RETRIES + 1), requests['GET'], 'Should retry a GET.')
+        self.assertEqual(2, requests['POST'], 'Should not submit a document twice.')
+
+    def test_too_many_requests(self):
+        requests = self._count_requests(429)
+
+        self.assertEqual(2 * (RETRIES + 1), requests['GET'])
+        self.assertEqual(2 * (RETRIES + 1), requests['POST'], 'Should retry a POST that was refused.')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import asyncio
+import unittest
+
+from tests.benchmark.fake_services import FakeServer, create_etranslation_app
+from translation.connector.cef_etranslation import AsyncETranslationConnector, ETranslationConnector
+
+
+class TestTransDocId(unittest.TestCase):
+    """
+    Only a document that isn't translated yet is pending, other errors are raised instead of polled until the deadline.
+    """
+
+    def setUp(self) -> None:
+        self.app = create_etranslation_app()
+        self.server = FakeServer(self.app).start()
+        self.addCleanup(self.server.stop)
+
+        url_trans_doc_id = self.server.url + '/translate/document/{id}'
+        self.app.state.documents['1'] = (float('inf'), 'text_lines.txt', b'')
+
+        self.connector = ETranslationConnector('user', 'password', retries=0)
+        self.connector.url_trans_doc_id = url_trans_doc_id
+
+        self.async_connector = AsyncETranslationConnector('user', 'password', retries=0)
+        self.async_connector.url_trans_doc_id = url_trans_doc_id
+
+    def _trans_doc_id_async(self, request_id):
+        async def main():
+            try:
+                return await self.async_connector.trans_doc_id(request_id)
+            finally:
+                await self.async_connector.aclose()
+
+        return asyncio.run(main())
+
+    def test_pending(self):
+        self.assertIsNone(self.connector.trans_doc_id('1'))
+        self.assertIsNone(self._trans_doc_id_async('1'))
+
+    def test_not_found(self):
+        with self.subTest('Sync'):
+            self.assertRaises(Exception, self.connector.trans_doc_id, '2')
+
+        with self.subTest('Async'):
+            self.assertRaises(Exception, self._trans_doc_id_async, '2')
+
+
+if __name__ == '__main__':
+    unittest.main()
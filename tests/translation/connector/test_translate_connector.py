@@ -2,6 +2,7 @@
 Swagger at https://mtapi.occam.crosslang.com/swagger-ui.html
 """
 
+import io
 import os
 import random
 import signal
@@ -10,7 +11,8 @@ import tempfile
 import time
 import unittest
 
-from translation.connector.cef_etranslation import ETranslationConnector
+from translation.connector.cef_etranslation import ETranslationConnector, document_to_text_lines, \
+    text_lines_to_document
 
 CEF_LOGIN = os.environ.get("CEF_LOGIN")
 CEF_PASSW = os.environ.get("CEF_PASSW")
@@ -236,6 +238,33 @@ class TestETranslationConnector(unittest.TestCase):
 
         return
 
+    def test_trans_doc_blocking_in_memory(self):
+
+        source = 'fr'
+        target = 'en'
+
+        with open(FILENAME_TXT, 'rb') as f:
+            content = f.read()
+
+        for name, document in {'bytes': content,
+                               'buffer': io.BytesIO(content)}.items():
+            with self.subTest(name):
+                r = self.connector.trans_doc_blocking(source, target, document)
+
+                self.assertEqual(len(content.decode('utf-8').splitlines()),
+                                 len(r.get('content').decode('utf-8').splitlines()),
+                                 "Should give the same result as uploading from a file.")
+
+
+class TestTextLinesDocument(unittest.TestCase):
+    def test_round_trip(self):
+        l_text = ['Dit is een test.', '', 'Één zin.']
+
+        document = text_lines_to_document(l_text)
+
+        self.assertEqual(len(l_text), document.count(b'\n'), 'Should have a line per segment.')
+        self.assertListEqual(l_text, document_to_text_lines(document))
+
 
 class TestTransXML(unittest.TestCase):
     """
@@ -0,0 +1,71 @@
+import io
+import os
+import unittest
+import zipfile
+
+from xml_orm.orm import PageXML, XLIFFPageXML
+
+from translation.page_stream import PageText, spool_file
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+ROOT_MEDIA = os.path.join(ROOT, 'tests/media')
+
+FILENAME_CLARIAH_XML = os.path.join(ROOT_MEDIA,
+                                    'CLARIAH-VL_examples/1KBR/De_Standaard_19190401/PERO_OCR/KB_JB840_1919-04-01_01_0_fixed.xml')
+FILENAME_CLARIAH_XLIFF = os.path.join(ROOT_MEDIA,
+                                      'CLARIAH-VL_examples/1KBR/De_Standaard_19190401/PERO_OCR/KB_JB840_1919-04-01_01_0_fixed_trans_multi.xml')
+
+PAGE_NESTED = b"""<?xml version="1.0" encoding="UTF-8"?>
+<PcGts xmlns="http://schema.primaresearch.org/PAGE/gts/pagecontent/2013-07-15">
+  <Page>
+    <TextRegion id="r0">
+      <TextLine id="r0l0">
+        <Word id="r0l0w0"><TextEquiv><Unicode>word</Unicode></TextEquiv></Word>
+        <TextEquiv><Unicode>first line</Unicode></TextEquiv>
+      </TextLine>
+      <TextRegion id="r1">
+        <TextLine id="r1l0"><TextEquiv><Unicode>nested line</Unicode></TextEquiv></TextLine>
+      </TextRegion>
+      <TextLine id="r0l1"><TextEquiv><Unicode/></TextEquiv></TextLine>
+      <TextEquiv><Unicode>region text</Unicode></TextEquiv>
+    </TextRegion>
+  </Page>
+</PcGts>
+"""
+
+
+class TestPageText(unittest.TestCase):
+
+    def test_same_as_xml_orm(self):
+        for filename, xml_orm in {FILENAME_CLARIAH_XML: PageXML(FILENAME_CLARIAH_XML),
+                                  FILENAME_CLARIAH_XLIFF: XLIFFPageXML(FILENAME_CLARIAH_XLIFF)}.items():
+            with self.subTest(os.path.basename(filename)):
+                with open(filename, 'rb') as f:
+                    page = PageText.from_file(f)
+
+                self.assertEqual(xml_orm.get_regions_lines_text(), page.get_regions_lines_text())
+                self.assertEqual(xml_orm.get_lines_text(), page.get_lines_text())
+
+    def test_nested_regions(self):
+        page = PageText.from_file(io.BytesIO(PAGE_NESTED))
+
+        self.assertEqual([['first line', ''], ['nested line']], page.get_regions_lines_text(),
+                         'Lines should belong to their innermost region, without the text of words or regions.')
+        self.assertEqual(['first line ', 'nested line'], page.get_regions_text())
+
+    def test_spool_file(self):
+        with io.BytesIO() as f:
+            with zipfile.ZipFile(f, 'w') as z:
+                z.writestr('page.xml', PAGE_NESTED)
+
+            with zipfile.ZipFile(f) as z, z.open('page.xml') as f_zip, spool_file(f_zip) as f_spooled:
+                page = PageText.from_file(f_spooled)
+
+                f_spooled.seek(0)
+                self.assertEqual(PAGE_NESTED, f_spooled.read())
+
+        self.assertEqual(3, len(page.get_lines_text()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import tempfile
+import time
+import unittest
+
+from translation.segment_cache import SegmentCache
+
+
+class TestSegmentCache(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'mt_cache.db')
+        self.cache = SegmentCache(self.path)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_get_set(self):
+        self.cache.set_many('nl', 'en', {'Dit is een test.': 'This is a test.'})
+
+        with self.subTest('Hit'):
+            self.assertDictEqual(self.cache.get_many('nl', 'en', ['Dit is een test.', 'Geen vertaling.']),
+                                 {'Dit is een test.': 'This is a test.'})
+
+        with self.subTest('Other language pair'):
+            self.assertDictEqual(self.cache.get_many('nl', 'fr', ['Dit is een test.']), {})
+
+        with self.subTest('Case insensitive languages'):
+            self.assertDictEqual(self.cache.get_many('NL', 'EN', ['Dit is een test.']),
+                                 {'Dit is een test.': 'This is a test.'})
+
+    def test_empty_not_cached(self):
+        self.cache.set_many('nl', 'en', {'': '', 'Dit is een test.': ''})
+
+        self.assertDictEqual(self.cache.get_many('nl', 'en', ['', 'Dit is een test.']), {})
+
+    def test_persistent(self):
+        self.cache.set_many('nl', 'en', {'Dit is een test.': 'This is a test.'})
+
+        cache = SegmentCache(self.path)
+
+        self.assertDictEqual(cache.get_many('nl', 'en', ['Dit is een test.']),
+                             {'Dit is een test.': 'This is a test.'})
+
+    def test_many(self):
+        translations = {f'Zin {i}.': f'Sentence {i}.' for i in range(1234)}
+        self.cache.set_many('nl', 'en', translations)
+
+        self.assertDictEqual(self.cache.get_many('nl', 'en', list(translations)), translations)
+
+    def test_memory(self):
+        cache = SegmentCache(':memory:')
+        cache.set_many('nl', 'en', {'Dit is een test.': 'This is a test.'})
+
+        self.assertDictEqual(cache.get_many('nl', 'en', ['Dit is een test.']),
+                             {'Dit is een test.': 'This is a test.'})
+        self.assertDictEqual(SegmentCache(':memory:').get_many('nl', 'en', ['Dit is een test.']), {},
+                             'Should not be shared.')
+
+    def test_maxsize(self):
+        cache = SegmentCache(':memory:', maxsize=2)
+        for i in range(3):
+            cache.set_many('nl', 'en', {f'Zin {i}.': f'Sentence {i}.'})
+
+        self.assertDictEqual(cache.get_many('nl', 'en', [f'Zin {i}.' for i in range(3)]),
+                             {'Zin 1.': 'Sentence 1.', 'Zin 2.': 'Sentence 2.'},
+                             'The oldest segment should be evicted.')
+
+    def test_ttl(self):
+        cache = SegmentCache(':memory:', ttl=0.01)
+        cache.set_many('nl', 'en', {'Dit is een test.': 'This is a test.'})
+        time.sleep(0.02)
+
+        self.assertDictEqual(cache.get_many('nl', 'en', ['Dit is een test.']), {}, 'Should be expired.')
@@ -1,9 +1,11 @@
 import io
 import os
 import unittest
+from unittest import mock
 
 from xml_orm.orm import PageXML, XLIFFPageXML
 
+from translation import translate_xml
 from translation.translate_xml import translate_list, SentenceParser
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
@@ -130,3 +132,65 @@ class TestGroupSentencesPerRegion(unittest.TestCase):
         region_sentences_reverse = self.parser.group_sentences_per_region(sentences)
 
         self.assertEqual(region_sentences_reverse, region_sentences, 'Should reconstruct the same content.')
+
+
+class TestSentenceParserMemoization(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.xml_orm = PageXML(FILENAME_CLARIAH_XML)
+
+    def test_sentences_only_once(self):
+        parser = SentenceParser(self.xml_orm)
+
+        with mock.patch.object(translate_xml, '_get_sentences', wraps=translate_xml._get_sentences) as m:
+            sentences = parser.get_sentences()
+            parser.reconstruct_lines(sentences)
+
+        self.assertEqual(m.call_count, len(self.xml_orm.get_regions_text()),
+                         'Each region should only be split into sentences once.')
+
+    def test_copy(self):
+        parser = SentenceParser(self.xml_orm)
+
+        region_sentences = parser.get_region_sentences()
+        region_sentences[0].append('Extra sentence.')
+
+        self.assertNotEqual(parser.get_region_sentences(), region_sentences,
+                            'Memoized sentences should not be changed by the caller.')
+
+
+class TestGetIBeginEnd(unittest.TestCase):
+
+    def test_offsets(self):
+        list_n = [5, 0, 3, 7]
+
+        i_begin, i_end = translate_xml._get_i_begin_end(list_n)
+
+        for j in range(len(list_n)):
+            with self.subTest(j):
+                self.assertEqual(i_begin[j], sum(list_n[:j]) + len(list_n[:max(0, j - 1)]))
+                self.assertEqual(i_end[j], sum(list_n[:j + 1]) + len(list_n[:max(0, j)]))
+
+    def test_empty(self):
+        i_begin, i_end = translate_xml._get_i_begin_end([])
+
+        self.assertEqual(len(i_begin), 0)
+        self.assertEqual(len(i_end), 0)
+
+
+class TestTranslateListDeduplication(unittest.TestCase):
+
+    def test_repeated_segments_sent_once(self):
+        l_text = ['Advertentie', 'Dit is een test.', 'Advertentie ', '', 'Advertentie']
+
+        def trans_doc_blocking(source, target, document):
+            return {'content': document.upper()}
+
+        with mock.patch.object(translate_xml, 'CONNECTOR') as connector:
+            connector.trans_doc_blocking.side_effect = trans_doc_blocking
+
+            l_trans_text = translate_list(l_text, 'nl', 'en')
+
+        self.assertEqual(connector.trans_doc_blocking.call_args[0][2], b'Advertentie\nDit is een test.\n',
+                         'Repeated and empty segments should not be sent to MT.')
+        self.assertListEqual(l_trans_text, ['ADVERTENTIE', 'DIT IS EEN TEST.', 'ADVERTENTIE', '', 'ADVERTENTIE'])
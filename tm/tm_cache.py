@@ -0,0 +1,332 @@
+import asyncio
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from .tm_connector import TmConnector
+
+# Maximum number of lookups kept in memory.
+TM_CACHE_SIZE = int(os.environ.get('TM_CACHE_SIZE', 100000))
+# Time to live of a cached lookup in seconds.
+TM_CACHE_TTL = float(os.environ.get('TM_CACHE_TTL', 24 * 60 * 60))
+# Path to the SQLite file of the persistent tier. Leave empty to only cache in memory.
+TM_CACHE_PATH = os.environ.get('TM_CACHE_PATH') or None
+
+# Segments per SELECT of the persistent tier, below the limit of SQLite on the amount of parameters.
+_SELECT_SIZE = 500
+
+
+class TmCache:
+    """
+    Cache of TM lookups, keyed by TM key, langpair and segment.
+    A bounded in-memory LRU tier is backed by an optional persistent SQLite tier.
+    Both hits and misses of the TM (an empty list of matches) are cached.
+    """
+
+    def __init__(self,
+                 maxsize: int = TM_CACHE_SIZE,
+                 ttl: float = TM_CACHE_TTL,
+                 path: Optional[str] = TM_CACHE_PATH):
+        """
+        maxsize: maximum number of entries in memory
+        ttl: time to live of an entry in seconds
+        path: path to the SQLite file of the persistent tier, None to disable it
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._disk = None
+        if path is not None:
+            self._disk = sqlite3.connect(path, check_same_thread=False)
+            self._disk.execute('CREATE TABLE IF NOT EXISTS tm_cache '
+                               '(key TEXT, langpair TEXT, segment TEXT, matches TEXT, created REAL, '
+                               'PRIMARY KEY (key, langpair, segment))')
+            self._disk.commit()
+
+    def get(self, key: str, langpair: str, segment: str) -> Tuple[bool, Optional[list]]:
+        """
+        returns:
+            (True, matches) if the lookup is cached, else (False, None)
+        """
+        found = self.get_many(key, langpair, [segment])
+        return segment in found, found.get(segment)
+
+    def get_many(self, key: str, langpair: str, segments: List[str]) -> Dict[str, list]:
+        """
+        The segments that aren't in memory are looked up in the persistent tier with a single query.
+
+        returns:
+            the matches of the cached segments, by segment
+        """
+        now = time.time()
+        segments_unique = list(dict.fromkeys(segments))
+        found = {}
+
+        with self._lock:
+            segments_disk = []
+            for q in segments_unique:
+                k = (key, langpair, q)
+                entry = self._memory.get(k)
+                if entry is not None:
+                    created, matches = entry
+                    if now - created < self.ttl:
+                        self._memory.move_to_end(k)
+                        found[q] = matches
+                        continue
+
+                    del self._memory[k]
+                    self.evictions += 1
+
+                segments_disk.append(q)
+
+            if self._disk is not None and segments_disk:
+                expired = []
+                for i in range(0, len(segments_disk), _SELECT_SIZE):
+                    segments_select = segments_disk[i:i + _SELECT_SIZE]
+                    rows = self._disk.execute('SELECT segment, matches, created FROM tm_cache '
+                                              'WHERE key = ? AND langpair = ? '
+                                              f'AND segment IN ({", ".join("?" * len(segments_select))})',
+                                              [key, langpair, *segments_select]).fetchall()
+                    for q, matches, created in rows:
+                        if now - created < self.ttl:
+                            matches = json.loads(matches)
+                            self._set_memory((key, langpair, q), created, matches)
+                            found[q] = matches
+                        else:
+                            expired.append((key, langpair, q))
+
+                if expired:
+                    self._disk.executemany('DELETE FROM tm_cache WHERE key = ? AND langpair = ? AND segment = ?',
+                                           expired)
+                    self._disk.commit()
+
+            self.hits += len(found)
+            self.misses += len(segments_unique) - len(found)
+
+        return found
+
+    def set(self, key: str, langpair: str, segment: str, matches: list):
+        self.set_many(key, langpair, {segment: matches})
+
+    def set_many(self, key: str, langpair: str, l_matches: Dict[str, list]):
+        """
+        Saves the matches by segment, in a single transaction of the persistent tier.
+        """
+        created = time.time()
+
+        with self._lock:
+            for q, matches in l_matches.items():
+                self._set_memory((key, langpair, q), created, matches)
+
+            if self._disk is not None and l_matches:
+                self._disk.executemany('INSERT OR REPLACE INTO tm_cache (key, langpair, segment, matches, created) '
+                                       'VALUES (?, ?, ?, ?, ?)',
+                                       [(key, langpair, q, json.dumps(matches), created)
+                                        for q, matches in l_matches.items()])
+                self._disk.commit()
+
+    def invalidate(self, key: str, langpair: str, segment: str):
+        k = (key, langpair, segment)
+
+        with self._lock:
+            self._memory.pop(k, None)
+
+            if self._disk is not None:
+                self._delete_disk(k)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+            if self._disk is not None:
+                self._disk.execute('DELETE FROM tm_cache')
+                self._disk.commit()
+
+    def stats(self) -> dict:
+        """
+        returns:
+            hit, miss and eviction counters and the current amount of entries in memory
+        """
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'size': len(self._memory),
+                    'maxsize': self.maxsize}
+
+    def _set_memory(self, k, created, matches):
+        self._memory[k] = (created, matches)
+        self._memory.move_to_end(k)
+
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _delete_disk(self, k):
+        self._disk.execute('DELETE FROM tm_cache WHERE key = ? AND langpair = ? AND segment = ?', k)
+        self._disk.commit()
+
+
+class _CachedTmConnector(TmConnector):
+    """
+    Merging of the cached and looked up matches, shared by the sync and async connector.
+    """
+
+    def __init__(self, connector: TmConnector, cache: TmCache = None):
+        self.connector = connector
+        self.cache = cache if cache is not None else TmCache()
+
+    @staticmethod
+    def _get_misses(segments: List[str], cached: Dict[str, list]) -> List[str]:
+        """
+        returns:
+            the unique segments that aren't cached, to look up in the TM
+        """
+        return [q for q in dict.fromkeys(segments) if q not in cached]
+
+    @staticmethod
+    def _merge(segments: List[str],
+               cached: Dict[str, list],
+               segments_miss: List[str],
+               l_matches_miss: List[list]) -> Tuple[Dict[str, list], List[list]]:
+        """
+        returns:
+            the looked up matches by segment, to cache, and the matches of every segment in order
+        """
+        looked_up = dict(zip(segments_miss, l_matches_miss))
+        return looked_up, [cached[q] if q in cached else looked_up[q] for q in segments]
+
+
+class CachedTmConnector(_CachedTmConnector):
+    """
+    Wraps a TmConnector with a TmCache in front of the exact (non-concordance) lookups.
+    Adding or deleting a TU invalidates the cached lookup of its segment.
+    """
+
+    def health_check(self):
+        return self.connector.health_check()
+
+    def lookup_tu(self, concordance: bool, key: str, langpair: str, q: str):
+        if concordance:
+            return self.connector.lookup_tu(concordance, key, langpair, q)
+
+        hit, matches = self.cache.get(key, langpair, q)
+        if hit:
+            return matches
+
+        matches = self.connector.lookup_tu(concordance, key, langpair, q)
+        self.cache.set(key, langpair, q, matches)
+        return matches
+
+    def lookup_tu_many(self, concordance: bool, key: str, langpair: str, segments: List[str]) -> List[list]:
+        if concordance:
+            return self.connector.lookup_tu_many(concordance, key, langpair, segments)
+
+        cached = self.cache.get_many(key, langpair, segments)
+        segments_miss = self._get_misses(segments, cached)
+        l_matches_miss = self.connector.lookup_tu_many(concordance, key, langpair, segments_miss) \
+            if segments_miss else []
+
+        looked_up, l_matches = self._merge(segments, cached, segments_miss, l_matches_miss)
+        if looked_up:
+            self.cache.set_many(key, langpair, looked_up)
+        return l_matches
+
+    def add_tu(self, key: str, langpair: str, seg: str, tra: str):
+        response = self.connector.add_tu(key, langpair, seg, tra)
+        self.cache.invalidate(key, langpair, seg)
+        return response
+
+    def delete_tu(self, key: str, langpair: str, seg: str, tra: str):
+        response = self.connector.delete_tu(key, langpair, seg, tra)
+        self.cache.invalidate(key, langpair, seg)
+        return response
+
+    def import_tmx(self, key: str, name: str, tmx):
+        response = self.connector.import_tmx(key, name, tmx)
+        # The imported TUs are unknown at this point.
+        self.cache.clear()
+        return response
+
+    def get_tu_amount(self, key: str, langpair: str) -> int:
+        return self.connector.get_tu_amount(key, langpair)
+
+    def get_available_langpairs(self, key: str):
+        return self.connector.get_available_langpairs(key)
+
+
+class AsyncCachedTmConnector(_CachedTmConnector):
+    """
+    Asynchronous counterpart of CachedTmConnector, to wrap an AsyncMouseTmConnector.
+    The cache is used in the default executor of the event loop, to not block it on the persistent tier.
+    """
+
+    async def health_check(self):
+        return await self.connector.health_check()
+
+    async def lookup_tu(self, concordance: bool, key: str, langpair: str, q: str):
+        if concordance:
+            return await self.connector.lookup_tu(concordance, key, langpair, q)
+
+        hit, matches = await _run_in_executor(self.cache.get, key, langpair, q)
+        if hit:
+            return matches
+
+        matches = await self.connector.lookup_tu(concordance, key, langpair, q)
+        await _run_in_executor(self.cache.set, key, langpair, q, matches)
+        return matches
+
+    async def lookup_tu_many(self, concordance: bool, key: str, langpair: str, segments: List[str]) -> List[list]:
+        if concordance:
+            return await self.connector.lookup_tu_many(concordance, key, langpair, segments)
+
+        cached = await _run_in_executor(self.cache.get_many, key, langpair, segments)
+        segments_miss = self._get_misses(segments, cached)
+        l_matches_miss = await self.connector.lookup_tu_many(concordance, key, langpair, segments_miss) \
+            if segments_miss else []
+
+        looked_up, l_matches = self._merge(segments, cached, segments_miss, l_matches_miss)
+        if looked_up:
+            await _run_in_executor(self.cache.set_many, key, langpair, looked_up)
+        return l_matches
+
+    async def add_tu(self, key: str, langpair: str, seg: str, tra: str):
+        response = await self.connector.add_tu(key, langpair, seg, tra)
+        await _run_in_executor(self.cache.invalidate, key, langpair, seg)
+        return response
+
+    async def delete_tu(self, key: str, langpair: str, seg: str, tra: str):
+        response = await self.connector.delete_tu(key, langpair, seg, tra)
+        await _run_in_executor(self.cache.invalidate, key, langpair, seg)
+        return response
+
+    async def import_tmx(self, key: str, name: str, tmx):
+        response = await self.connector.import_tmx(key, name, tmx)
+        # The imported TUs are unknown at this point.
+        await _run_in_executor(self.cache.clear)
+        return response
+
+    async def get_tu_amount(self, key: str, langpair: str) -> int:
+        return await self.connector.get_tu_amount(key, langpair)
+
+    async def get_available_langpairs(self, key: str):
+        return await self.connector.get_available_langpairs(key)
+
+    async def aclose(self):
+        await self.connector.aclose()
+
+
+async def _run_in_executor(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args))
@@ -1,9 +1,24 @@
 import abc
+import asyncio
 import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from urllib.parse import urlparse
 
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+
+from translation.connector.request_metrics import RequestMetrics
 
 URL_BASE = os.environ['MOUSE']
+# Maximum number of concurrent lookups in a batch.
+MOUSE_MAX_WORKERS = int(os.environ.get('MOUSE_MAX_WORKERS', 8))
+# Timeout of the asynchronous requests in seconds.
+MOUSE_TIMEOUT = float(os.environ.get('MOUSE_TIMEOUT', 60))
+
+# Requests of the asynchronous connector.
+MOUSE_METRICS = RequestMetrics('mouse', 'Mouse')
 
 
 class TmConnector(abc.ABC):
@@ -26,6 +41,19 @@ class TmConnector(abc.ABC):
         """
         pass
 
+    def lookup_tu_many(self, concordance: bool, key: str, langpair: str, segments: List[str]) -> List[list]:
+        """
+        concordance: if true, include partial matches
+        key: TM key, leave empty for public
+        langpair: e.g.: en-nl
+        segments: the terms/phrases for which to look for in the TM
+        returns:
+            list with the found TM matches for each segment, in the same order as segments.
+            Each distinct segment is only looked up once.
+        """
+        matches_unique = {q: self.lookup_tu(concordance, key, langpair, q) for q in dict.fromkeys(segments)}
+        return [matches_unique[q] for q in segments]
+
     def add_tu(self, key: str, langpair: str, seg: str, tra: str):
         """
         key: TM key, leave empty for public
@@ -65,7 +93,7 @@ class TmConnector(abc.ABC):
         """
 
 
-class MouseTmConnector(TmConnector):
+class _BaseMouseTmConnector(TmConnector):
     URL_HEALTH = URL_BASE + '/admin/tminfo'
     URL_GET = URL_BASE + '/get'
     URL_SET = URL_BASE + '/set'
@@ -73,8 +101,23 @@ class MouseTmConnector(TmConnector):
     URL_IMPORT_TMX = URL_BASE + '/tmx/import'
     URL_TU_AMOUNT = URL_BASE + '/tu/amount'
 
+
+class MouseTmConnector(_BaseMouseTmConnector):
+
+    def __init__(self, max_workers: int = MOUSE_MAX_WORKERS):
+        """
+        max_workers: maximum number of concurrent requests in lookup_tu_many
+        """
+        self.max_workers = max_workers
+
+        # Shared session to reuse keep-alive connections.
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
     def health_check(self):
-        response = requests.get(self.URL_HEALTH)
+        response = self._session.get(self.URL_HEALTH)
         response.raise_for_status()
         return response
 
@@ -85,12 +128,21 @@ class MouseTmConnector(TmConnector):
             'langpair': langpair,
             'q': q
         }
-        response = requests.get(self.URL_GET, params=params)
+        response = self._session.get(self.URL_GET, params=params)
         response.raise_for_status()
         json_response = response.json()
         matches = json_response["matches"]
         return matches
 
+    def lookup_tu_many(self, concordance: bool, key: str, langpair: str, segments: List[str]) -> List[list]:
+        segments_unique = list(dict.fromkeys(segments))
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(segments_unique)))) as executor:
+            l_matches = executor.map(lambda q: self.lookup_tu(concordance, key, langpair, q), segments_unique)
+            matches_unique = dict(zip(segments_unique, l_matches))
+
+        return [matches_unique[q] for q in segments]
+
     def add_tu(self, key: str, langpair: str, seg: str, tra: str):
         payload = {
             'key': key,
@@ -98,7 +150,7 @@ class MouseTmConnector(TmConnector):
             'seg': seg,
             'tra': tra
         }
-        response = requests.post(self.URL_SET, data=payload)
+        response = self._session.post(self.URL_SET, data=payload)
         response.raise_for_status()
         return response
 
@@ -109,7 +161,7 @@ class MouseTmConnector(TmConnector):
             'seg': seg,
             'tra': tra
         }
-        response = requests.post(self.URL_DELETE, data=payload)
+        response = self._session.post(self.URL_DELETE, data=payload)
         response.raise_for_status()
         return response
 
@@ -121,7 +173,7 @@ class MouseTmConnector(TmConnector):
         files = {
             'tmx': tmx
         }
-        response = requests.post(self.URL_IMPORT_TMX, data=data, files=files)
+        response = self._session.post(self.URL_IMPORT_TMX, data=data, files=files)
         response.raise_for_status()
         return response
 
@@ -130,7 +182,7 @@ class MouseTmConnector(TmConnector):
             'key': key,
             'langpair': langpair
         }
-        response = requests.get(self.URL_TU_AMOUNT, params=params)
+        response = self._session.get(self.URL_TU_AMOUNT, params=params)
         response.raise_for_status()
         return int(response.content.decode('utf-8'))
 
@@ -138,7 +190,113 @@ class MouseTmConnector(TmConnector):
         params = {
             'key': key
         }
-        response = requests.get(self.URL_HEALTH, params=params)
+        response = self._session.get(self.URL_HEALTH, params=params)
+        response.raise_for_status()
+        try:
+            json_response = response.json()
+            langpairs = json_response["langPairs"]
+        except ValueError:
+            return {}
+        return langpairs
+
+
+class AsyncMouseTmConnector(_BaseMouseTmConnector):
+    """
+    Asynchronous counterpart of MouseTmConnector, with the same methods as coroutines.
+    """
+
+    def __init__(self, max_workers: int = MOUSE_MAX_WORKERS, timeout: float = MOUSE_TIMEOUT):
+        """
+        max_workers: maximum number of concurrent requests in lookup_tu_many
+        timeout: timeout of the requests in seconds
+        """
+        self.max_workers = max_workers
+        self.timeout = timeout
+
+        self._client = None
+        self._client_loop = None
+
+    async def health_check(self):
+        response = await self._request('GET', self.URL_HEALTH)
+        response.raise_for_status()
+        return response
+
+    async def lookup_tu(self, concordance: bool, key: str, langpair: str, q: str):
+        params = {
+            # Same formatting of booleans as requests
+            'conc': str(concordance),
+            'key': key,
+            'langpair': langpair,
+            'q': q
+        }
+        response = await self._request('GET', self.URL_GET, params=params)
+        response.raise_for_status()
+        json_response = response.json()
+        matches = json_response["matches"]
+        return matches
+
+    async def lookup_tu_many(self, concordance: bool, key: str, langpair: str, segments: List[str]) -> List[list]:
+        segments_unique = list(dict.fromkeys(segments))
+
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def lookup_tu(q):
+            async with semaphore:
+                return await self.lookup_tu(concordance, key, langpair, q)
+
+        l_matches = await asyncio.gather(*map(lookup_tu, segments_unique))
+        matches_unique = dict(zip(segments_unique, l_matches))
+
+        return [matches_unique[q] for q in segments]
+
+    async def add_tu(self, key: str, langpair: str, seg: str, tra: str):
+        payload = {
+            'key': key,
+            'langpair': langpair,
+            'seg': seg,
+            'tra': tra
+        }
+        response = await self._request('POST', self.URL_SET, data=payload)
+        response.raise_for_status()
+        return response
+
+    async def delete_tu(self, key: str, langpair: str, seg: str, tra: str):
+        payload = {
+            'key': key,
+            'langpair': langpair,
+            'seg': seg,
+            'tra': tra
+        }
+        response = await self._request('POST', self.URL_DELETE, data=payload)
+        response.raise_for_status()
+        return response
+
+    async def import_tmx(self, key: str, name: str, tmx):
+        data = {
+            'key': key,
+            'name': name,
+        }
+        files = {
+            'tmx': tmx
+        }
+        response = await self._request('POST', self.URL_IMPORT_TMX, data=data, files=files)
+        response.raise_for_status()
+        return response
+
+    async def get_tu_amount(self, key: str, langpair: str) -> int:
+        params = {
+            'key': key,
+            'langpair': langpair
+        }
+        response = await self._request('GET', self.URL_TU_AMOUNT, params=params)
+        response.raise_for_status()
+        return int(response.content.decode('utf-8'))
+
+    async def get_available_langpairs(self, key: str):
+        params = {
+            'key': key
+        }
+        response = await self._request('GET', self.URL_HEALTH, params=params)
         response.raise_for_status()
         try:
             json_response = response.json()
@@ -146,3 +304,26 @@ class MouseTmConnector(TmConnector):
         except ValueError:
             return {}
         return langpairs
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """
+        A single client per event loop, such that connections are reused.
+        """
+        loop = asyncio.get_event_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(limits=httpx.Limits(max_connections=self.max_workers,
+                                                                 max_keepalive_connections=self.max_workers),
+                                             timeout=self.timeout)
+            self._client_loop = loop
+
+        return self._client
+
+    async def _request(self, method, url, **kwargs) -> httpx.Response:
+        return await MOUSE_METRICS.request(self._get_client(), method, url, urlparse(url).path, **kwargs)
+
+
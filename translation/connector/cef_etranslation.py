@@ -1,13 +1,45 @@
+import asyncio
 import os
-import tempfile
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Union
-from urllib.parse import urljoin
+from typing import BinaryIO, List, Tuple, Union
+from urllib.parse import urljoin, urlparse
 
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .request_metrics import RequestMetrics
 
 BASE_URL = os.environ['ETRANSLATION']
 
+# Maximum number of connections kept alive to eTranslation.
+ETRANSLATION_POOL_SIZE = int(os.environ.get('ETRANSLATION_POOL_SIZE', 10))
+# Timeouts in seconds. The read timeout has to cover the blocking calls.
+ETRANSLATION_CONNECT_TIMEOUT = float(os.environ.get('ETRANSLATION_CONNECT_TIMEOUT', 10))
+ETRANSLATION_READ_TIMEOUT = float(os.environ.get('ETRANSLATION_READ_TIMEOUT', 600))
+# Retries with exponential backoff on connection errors, 429 and 5xx.
+# A POST is only retried when it wasn't received, on connection errors and 429, see POST_RETRY_STATUS.
+ETRANSLATION_RETRIES = int(os.environ.get('ETRANSLATION_RETRIES', 3))
+ETRANSLATION_BACKOFF = float(os.environ.get('ETRANSLATION_BACKOFF', 0.5))
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# Once a document is submitted, eTranslation may have accepted it even if the response is an error or never arrives.
+# Submitting it again would translate (and bill) it twice.
+POST_RETRY_STATUS = (429,)
+# Status of a document that isn't translated yet, any other error status is raised.
+PENDING_STATUS = (423,)
+
+# Filename of the upload when the document is not read from a file.
+DOCUMENT_FILENAME = 'text_lines.txt'
+
+# Path to a document, or its content.
+Document = Union[str, Path, bytes, BinaryIO]
+
+# Every attempt of the asynchronous connector is counted, retries included.
+ETRANSLATION_METRICS = RequestMetrics('etranslation', 'eTranslation')
+
 
 # class ETranslationConnector:
 #     url_info = urljoin(BASE_URL + '/', 'info')
@@ -127,7 +159,7 @@ BASE_URL = os.environ['ETRANSLATION']
 #                     'filename': filename_trans}
 
 
-class ETranslationConnector:
+class _BaseETranslationConnector:
     url_info = urljoin(BASE_URL + '/', 'info')
     url_trans_snippet = urljoin(BASE_URL + '/', 'translate/snippet')
     url_trans_snippet_id = urljoin(url_trans_snippet + '/', '{id}')
@@ -138,11 +170,40 @@ class ETranslationConnector:
 
     url_docs = urljoin(url_trans_doc, "docs")
 
-    def __init__(self, username: str = None, password: str = None):
+
+class ETranslationConnector(_BaseETranslationConnector):
+
+    def __init__(self, username: str = None, password: str = None,
+                 pool_size: int = ETRANSLATION_POOL_SIZE,
+                 timeout=(ETRANSLATION_CONNECT_TIMEOUT, ETRANSLATION_READ_TIMEOUT),
+                 retries: int = ETRANSLATION_RETRIES,
+                 backoff_factor: float = ETRANSLATION_BACKOFF):
+        """
+        Args:
+            username: eTranslation login
+            password: eTranslation password
+            pool_size: Maximum number of connections kept alive.
+            timeout: (connect, read) timeout in seconds.
+            retries: Number of retries on connection errors, 429 and 5xx responses (POST: connection errors and 429).
+            backoff_factor: Backoff between the retries: {backoff factor} * (2 ** ({number of retries} - 1)) seconds.
+        """
 
         self._username = username
         self._password = password
 
+        self.timeout = timeout
+
+        # A single session, such that connections are reused.
+        retry = _Retry(total=retries,
+                       backoff_factor=backoff_factor,
+                       status_forcelist=RETRY_STATUS,
+                       allowed_methods=frozenset(['GET']),
+                       raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self._session = requests.Session()
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
     def info(self):
         r = self._get(self.url_info)
         return r.json()
@@ -196,14 +257,20 @@ class ETranslationConnector:
 
     def trans_doc(self, source: str,
                   target: str,
-                  filename: Path):
-        with open(filename, 'rb') as f:
+                  filename: Document,
+                  upload_name: str = None):
+        """
+        Args:
+            filename: Path to the document, or its content as bytes or a binary file-like object.
+            upload_name: (Optional) filename of the upload, the extension tells the document type.
+        """
+        with _open_document(filename, upload_name) as file:
             data = {'source': str(source),
                     'target': str(target),
                     # 'file': f
                     }
 
-            files = {'file': f}
+            files = {'file': file}
 
             r = self._post(self.url_trans_doc,
                            data=data,
@@ -218,12 +285,17 @@ class ETranslationConnector:
         Args:
             request_id:
         Returns:
-            raw bytestring
+            raw bytestring, None if not translated yet.
+        Raises:
+            Exception: on any other error status, e.g. an unknown request_id.
         """
 
         with self._get(self.url_trans_doc_id.format(id=request_id)) as r:
             # Magic filename
 
+            if r.status_code >= 400 and r.status_code not in PENDING_STATUS:
+                raise Exception(f'{r}\n{r.text}')
+
             if r.status_code > 200:
                 return None
 
@@ -235,13 +307,19 @@ class ETranslationConnector:
 
     def trans_doc_blocking(self, source: str,
                            target: str,
-                           filename: Path):
-        with open(filename, 'rb') as f:
+                           filename: Document,
+                           upload_name: str = None):
+        """
+        Args:
+            filename: Path to the document, or its content as bytes or a binary file-like object.
+            upload_name: (Optional) filename of the upload, the extension tells the document type.
+        """
+        with _open_document(filename, upload_name) as file:
             data = {'source': str(source),
                     'target': str(target),
                     }
 
-            files = {'file': f}
+            files = {'file': file}
 
             r = self._post(self.url_trans_doc_blocking,
                            data=data,
@@ -273,47 +351,353 @@ class ETranslationConnector:
             List with translated text segments.
         """
 
-        l_n = []
-        l_text_split: List[str] = []
-        for text in l_text:
-            text_split = text.splitlines()
+        l_n, l_text_split = _split_text_list(l_text)
 
-            l_n.append(len(text_split))
-            l_text_split.extend(text_split)
+        # send to MT
+        j = self.trans_doc_blocking(source, target, text_lines_to_document(l_text_split))
 
-        s_tmp = ''.join(text_i + '\n' for text_i in l_text_split)
+        l_trans_text_split = document_to_text_lines(j['content'])
 
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            tmp_file = os.path.join(tmp_dir, 'tmp_text_lines.txt')
-            with open(tmp_file, 'w') as f:
-                f.write(s_tmp)
-            # send to MT
-            j = self.trans_doc_blocking(source, target, Path(tmp_file))
-
-            l_trans_text_split = list(map(str.strip, j['content'].decode('UTF-8').splitlines()))
-
-        # In case some sentences had newlines in them.
-        l_text_trans = []
-        it = iter(l_trans_text_split)
-        for size in l_n:
-            text_split_translated = [next(it) for _ in range(size)]
-
-            text_translated = "\n".join(text_split_translated)
-
-            l_text_trans.append(text_translated)
-
-        return l_text_trans
+        return _join_text_list(l_trans_text_split, l_n)
 
     def _get(self, url, auth=None, *args, **kwargs) -> requests.Response:
         if auth is None:
             auth = (self._username, self._password)
-        r = requests.get(url=url, auth=auth, *args, **kwargs)
+        kwargs.setdefault('timeout', self.timeout)
+        r = self._session.get(url=url, auth=auth, *args, **kwargs)
 
         return r
 
     def _post(self, url, auth=None, *args, **kwargs) -> requests.Response:
         if auth is None:
             auth = (self._username, self._password)
-        r = requests.post(url=url, auth=auth, *args, **kwargs)
+        kwargs.setdefault('timeout', self.timeout)
+        r = self._session.post(url=url, auth=auth, *args, **kwargs)
 
         return r
+
+
+class AsyncETranslationConnector(_BaseETranslationConnector):
+    """
+    Asynchronous counterpart of ETranslationConnector, with the same methods as coroutines.
+    """
+
+    def __init__(self, username: str = None, password: str = None,
+                 pool_size: int = ETRANSLATION_POOL_SIZE,
+                 timeout=(ETRANSLATION_CONNECT_TIMEOUT, ETRANSLATION_READ_TIMEOUT),
+                 retries: int = ETRANSLATION_RETRIES,
+                 backoff_factor: float = ETRANSLATION_BACKOFF):
+        """
+        Args:
+            username: eTranslation login
+            password: eTranslation password
+            pool_size: Maximum number of connections.
+            timeout: (connect, read) timeout in seconds.
+            retries: Number of retries on connection errors, 429 and 5xx responses (POST: connection errors and 429).
+            backoff_factor: Backoff between the retries: {backoff factor} * (2 ** ({number of retries} - 1)) seconds.
+        """
+
+        self._username = username
+        self._password = password
+
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+
+        self._client = None
+        self._client_loop = None
+
+    async def info(self):
+        r = await self._get(self.url_info)
+        return r.json()
+
+    async def trans_snippet(self,
+                            source: str,
+                            target: str,
+                            snippet: str):
+        """
+        Args:
+            source:
+            target:
+            snippet:
+        Returns:
+            the request id
+        """
+        data = {'source': str(source),
+                'target': str(target),
+                'snippet': str(snippet)}
+
+        r = await self._post(self.url_trans_snippet,
+                             data=data)
+
+        return r.json()
+
+    async def trans_snippet_id(self, request_id) -> Union[str, None]:
+        r = await self._get(self.url_trans_snippet_id.format(id=request_id), endpoint=self.url_trans_snippet_id)
+
+        snippet_trans = r.json().get('content')
+        return snippet_trans
+
+    async def trans_snippet_blocking(self, source: str,
+                                     target: str,
+                                     snippet: str) -> str:
+        # Catch empty snippets
+        if not bool(snippet):
+            return snippet
+
+        data = {'source': str(source),
+                'target': str(target),
+                'snippet': str(snippet)}
+
+        r = await self._post(self.url_trans_snippet_blocking,
+                             data=data)
+
+        r.raise_for_status()
+
+        snippet_trans = r.json().strip()
+
+        return snippet_trans
+
+    async def trans_doc(self, source: str,
+                        target: str,
+                        filename: Document,
+                        upload_name: str = None):
+        """
+        Args:
+            filename: Path to the document, or its content as bytes or a binary file-like object.
+            upload_name: (Optional) filename of the upload, the extension tells the document type.
+        """
+        with _open_document(filename, upload_name) as (name, file):
+            # Read in memory, such that the upload can be retried.
+            files = {'file': (name, file if isinstance(file, bytes) else file.read())}
+
+        data = {'source': str(source),
+                'target': str(target),
+                }
+
+        r = await self._post(self.url_trans_doc,
+                             data=data,
+                             files=files)
+        if r.status_code < 400:
+            return r.json()
+        else:
+            return None
+
+    async def trans_doc_id(self, request_id):
+        """
+        Args:
+            request_id:
+        Returns:
+            raw bytestring, None if not translated yet.
+        Raises:
+            Exception: on any other error status, e.g. an unknown request_id.
+        """
+
+        r = await self._get(self.url_trans_doc_id.format(id=request_id), endpoint=self.url_trans_doc_id)
+
+        if r.status_code >= 400 and r.status_code not in PENDING_STATUS:
+            raise Exception(f'{r}\n{r.text}')
+
+        if r.status_code > 200:
+            # Not translated yet.
+            return None
+
+        # Magic filename
+        filename = r.headers.get('Content-Disposition').split('filename=')[1]
+
+        return {'content': r.content,
+                'filename': filename}
+
+    async def trans_doc_blocking(self, source: str,
+                                 target: str,
+                                 filename: Document,
+                                 upload_name: str = None):
+        """
+        Args:
+            filename: Path to the document, or its content as bytes or a binary file-like object.
+            upload_name: (Optional) filename of the upload, the extension tells the document type.
+        """
+        with _open_document(filename, upload_name) as (name, file):
+            # Read in memory, such that the upload can be retried.
+            files = {'file': (name, file if isinstance(file, bytes) else file.read())}
+
+        data = {'source': str(source),
+                'target': str(target),
+                }
+
+        r = await self._post(self.url_trans_doc_blocking,
+                             data=data,
+                             files=files,
+                             )
+
+        if r.status_code > 300:
+            raise Exception(f'{r}\n{r.text}')
+
+        # Magic filename
+        filename_trans = r.headers.get('Content-Disposition').split('filename=')[1]
+
+        return {'content': r.content,
+                'filename': filename_trans}
+
+    async def trans_list_blocking(self,
+                                  l_text: List[str],
+                                  target: str,
+                                  source: str,
+                                  ) -> List[str]:
+        """
+
+        Args:
+            l_text: List of sentences. May contain newlines.
+            target: Target langauge
+            source: Source langauge
+
+        Returns:
+            List with translated text segments.
+        """
+
+        l_n, l_text_split = _split_text_list(l_text)
+
+        # send to MT
+        j = await self.trans_doc_blocking(source, target, text_lines_to_document(l_text_split))
+
+        l_trans_text_split = document_to_text_lines(j['content'])
+
+        return _join_text_list(l_trans_text_split, l_n)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """
+        A single client per event loop, such that connections are reused.
+        """
+        loop = asyncio.get_event_loop()
+        if self._client is None or self._client_loop is not loop:
+            connect_timeout, read_timeout = self.timeout
+            self._client = httpx.AsyncClient(auth=(self._username, self._password),
+                                             limits=httpx.Limits(max_connections=self.pool_size,
+                                                                 max_keepalive_connections=self.pool_size),
+                                             timeout=httpx.Timeout(read_timeout, connect=connect_timeout))
+            self._client_loop = loop
+
+        return self._client
+
+    async def _request(self, method, url, endpoint: str = None, **kwargs) -> httpx.Response:
+        """
+        Request with retries and exponential backoff on connection errors, 429 and 5xx responses.
+        Other methods than GET are only retried when they weren't received: on connection errors and 429.
+
+        Args:
+            endpoint: (Optional) url template to label the metrics with, instead of the url with the request id.
+        """
+
+        endpoint = urlparse(endpoint or url).path
+        idempotent = method == 'GET'
+        retry_status = RETRY_STATUS if idempotent else POST_RETRY_STATUS
+
+        for i_retry in range(self.retries + 1):
+            try:
+                r = await ETRANSLATION_METRICS.request(self._get_client(), method, url, endpoint, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                if i_retry == self.retries:
+                    raise
+            except httpx.TransportError:
+                if not idempotent or i_retry == self.retries:
+                    raise
+            else:
+                if r.status_code not in retry_status or i_retry == self.retries:
+                    return r
+
+            await asyncio.sleep(self.backoff_factor * 2 ** i_retry)
+
+    async def _get(self, url, **kwargs) -> httpx.Response:
+        return await self._request('GET', url, **kwargs)
+
+    async def _post(self, url, **kwargs) -> httpx.Response:
+        return await self._request('POST', url, **kwargs)
+
+
+class _Retry(Retry):
+    """
+    Retries the allowed methods on connection errors, read errors and the status forcelist,
+    the other methods only on connection errors (by urllib3) and POST_RETRY_STATUS.
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method.upper() not in self.allowed_methods:
+            return status_code in POST_RETRY_STATUS and bool(self.total)
+
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def _split_text_list(l_text: List[str]):
+    """
+    Split up the text segments in single lines.
+
+    Returns:
+        The amount of lines per text segment and the list of all lines.
+    """
+
+    l_n = []
+    l_text_split: List[str] = []
+    for text in l_text:
+        text_split = text.splitlines()
+
+        l_n.append(len(text_split))
+        l_text_split.extend(text_split)
+
+    return l_n, l_text_split
+
+
+def _join_text_list(l_text_split: List[str], l_n: List[int]) -> List[str]:
+    """
+    Reverse operation of _split_text_list.
+    """
+
+    # In case some sentences had newlines in them.
+    l_text = []
+    it = iter(l_text_split)
+    for size in l_n:
+        text_split = [next(it) for _ in range(size)]
+
+        text = "\n".join(text_split)
+
+        l_text.append(text)
+
+    return l_text
+
+
+@contextmanager
+def _open_document(document: Document, upload_name: str = None) -> Tuple[str, Union[bytes, BinaryIO]]:
+    """
+    Opens the document if it's a path, otherwise the content is uploaded as is.
+
+    Returns:
+        Filename and content of the upload.
+    """
+
+    if isinstance(document, (str, Path)):
+        with open(document, 'rb') as f:
+            yield upload_name or os.path.basename(document), f
+    else:
+        yield upload_name or DOCUMENT_FILENAME, document
+
+
+def text_lines_to_document(l_text: List[str]) -> bytes:
+    """
+    Text document with a line per text segment, to send to eTranslation.
+    The segments shouldn't contain newlines, such that the translation has a line per segment as well.
+    """
+
+    return ''.join(text_i + '\n' for text_i in l_text).encode('utf-8')
+
+
+def document_to_text_lines(content: bytes) -> List[str]:
+    """
+    Text segments of a (translated) document, one per line.
+    """
+
+    return list(map(str.strip, content.decode('UTF-8').splitlines()))
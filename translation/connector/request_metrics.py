@@ -0,0 +1,76 @@
+"""
+Prometheus metrics of the requests of the asynchronous connectors, to eTranslation and Mouse.
+"""
+
+import time
+
+import httpx
+from prometheus_client import Counter, Histogram
+
+
+class RequestMetrics:
+    """
+    Requests to a service by method, endpoint and status code, their errors, bytes and duration.
+    """
+
+    def __init__(self, prefix: str, service: str):
+        """
+        Args:
+            prefix: of the metric names, e.g. 'mouse' for mouse_requests_total.
+            service: name of the service in the descriptions.
+        """
+
+        self.requests = Counter(f'{prefix}_requests_total',
+                                f'Requests to {service}, by status code.',
+                                ['method', 'endpoint', 'status'])
+        self.errors = Counter(f'{prefix}_request_errors_total',
+                              f'Requests to {service} that failed to connect or got a 5xx response.',
+                              ['method', 'endpoint'])
+        self.sent_bytes = Counter(f'{prefix}_sent_bytes_total',
+                                  f'Bytes of the request bodies sent to {service}.',
+                                  ['endpoint'])
+        self.received_bytes = Counter(f'{prefix}_received_bytes_total',
+                                      f'Bytes of the response bodies received from {service}.',
+                                      ['endpoint'])
+        self.seconds = Histogram(f'{prefix}_request_seconds',
+                                 f'Duration of the requests to {service}.',
+                                 ['method', 'endpoint'])
+
+    async def request(self, client: httpx.AsyncClient, method: str, url: str, endpoint: str,
+                      **kwargs) -> httpx.Response:
+        """
+        Sends the request with the client and observes it, also when it fails to connect.
+
+        Args:
+            endpoint: path to label the metrics with.
+        """
+
+        t0 = time.perf_counter()
+        try:
+            r = await client.request(method, url, **kwargs)
+        except httpx.TransportError:
+            self.observe(method, endpoint, None, time.perf_counter() - t0)
+            raise
+
+        self.observe(method, endpoint, r, time.perf_counter() - t0)
+        return r
+
+    def observe(self, method: str, endpoint: str, r: httpx.Response = None, seconds: float = 0.):
+        """
+        Args:
+            r: the response, None if the request failed to connect.
+        """
+
+        self.seconds.labels(method, endpoint).observe(seconds)
+
+        if r is None:
+            self.requests.labels(method, endpoint, 'error').inc()
+            self.errors.labels(method, endpoint).inc()
+            return
+
+        self.requests.labels(method, endpoint, str(r.status_code)).inc()
+        if r.status_code >= 500:
+            self.errors.labels(method, endpoint).inc()
+
+        self.sent_bytes.labels(endpoint).inc(int(r.request.headers.get('Content-Length', 0)))
+        self.received_bytes.labels(endpoint).inc(len(r.content))
@@ -0,0 +1,95 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable
+
+# Path to the SQLite file that holds the machine translated segments, e.g. next to sql_app.db.
+# Leave empty to only cache in memory, per worker process.
+MT_CACHE_PATH = os.environ.get('MT_CACHE_PATH') or ':memory:'
+# Maximum number of cached segments, the oldest are evicted first.
+MT_CACHE_SIZE = int(os.environ.get('MT_CACHE_SIZE', 100000))
+# Time to live of a cached segment in seconds, such that improvements of the MT engine are picked up.
+MT_CACHE_TTL = float(os.environ.get('MT_CACHE_TTL', 30 * 24 * 60 * 60))
+
+# SQLite limits the amount of variables in a single query.
+_MAX_VARIABLES = 500
+
+
+class SegmentCache:
+    """
+    Persistent cache of machine translated segments, keyed by (source, target, segment).
+    The cache is bounded, expired and the oldest segments are evicted when new ones are added.
+    """
+
+    def __init__(self,
+                 path: str = MT_CACHE_PATH,
+                 maxsize: int = MT_CACHE_SIZE,
+                 ttl: float = MT_CACHE_TTL):
+        """
+        Args:
+            path: Path to the SQLite file, ':memory:' to not persist the cache.
+            maxsize: Maximum number of cached segments.
+            ttl: Time to live of a cached segment in seconds.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS segment_translation '
+                         '(source TEXT, target TEXT, segment TEXT, translation TEXT, created REAL, '
+                         'PRIMARY KEY (source, target, segment))')
+        self._db.execute('CREATE INDEX IF NOT EXISTS segment_translation_created ON segment_translation (created)')
+        self._db.commit()
+
+    def get_many(self, source: str, target: str, segments: Iterable[str]) -> Dict[str, str]:
+        """
+        Args:
+            source: Source language
+            target: Target language
+            segments: Source segments.
+
+        Returns:
+            Dictionary with the translation of every segment that is in the cache.
+        """
+        segments = [segment for segment in dict.fromkeys(segments) if segment]
+        created_min = time.time() - self.ttl
+
+        translations = {}
+        with self._lock:
+            for i in range(0, len(segments), _MAX_VARIABLES):
+                segments_i = segments[i:i + _MAX_VARIABLES]
+                rows = self._db.execute('SELECT segment, translation FROM segment_translation '
+                                        'WHERE source = ? AND target = ? AND created > ? '
+                                        f'AND segment IN ({", ".join("?" * len(segments_i))})',
+                                        [source.lower(), target.lower(), created_min] + segments_i)
+                translations.update(rows)
+
+        return translations
+
+    def set_many(self, source: str, target: str, translations: Dict[str, str]):
+        """
+        Args:
+            source: Source language
+            target: Target language
+            translations: Dictionary with the translation of each source segment.
+                Empty segments or translations are not cached.
+        """
+        created = time.time()
+        rows = [(source.lower(), target.lower(), segment, translation, created)
+                for segment, translation in translations.items() if segment and translation]
+
+        with self._lock:
+            self._db.executemany('INSERT OR REPLACE INTO segment_translation '
+                                 '(source, target, segment, translation, created) VALUES (?, ?, ?, ?, ?)', rows)
+            self._evict(created)
+            self._db.commit()
+
+    def _evict(self, now: float):
+        self._db.execute('DELETE FROM segment_translation WHERE created <= ?', [now - self.ttl])
+
+        n_over = self._db.execute('SELECT COUNT(*) FROM segment_translation').fetchone()[0] - self.maxsize
+        if n_over > 0:
+            self._db.execute('DELETE FROM segment_translation WHERE rowid IN '
+                             '(SELECT rowid FROM segment_translation ORDER BY created, rowid LIMIT ?)', [n_over])
@@ -1,17 +1,21 @@
 import os
-import tempfile
 import warnings
+from functools import cached_property
 from typing import List
 
 import numpy as np
 from nltk.tokenize import sent_tokenize
 from xml_orm.orm import OverlayXML
 
-from .connector.cef_etranslation import ETranslationConnector
+from .connector.cef_etranslation import ETranslationConnector, document_to_text_lines, text_lines_to_document
+from .segment_cache import SegmentCache
 
 CEF_LOGIN = os.environ.get("CEF_LOGIN")
 CEF_PASSW = os.environ.get("CEF_PASSW")
 
+# Shared connector, such that keep-alive connections are reused.
+CONNECTOR = ETranslationConnector(CEF_LOGIN, CEF_PASSW)
+
 
 # class XMLTranslator(object):
 #     def __init__(self, filepath, source):
@@ -93,23 +97,35 @@ CEF_PASSW = os.environ.get("CEF_PASSW")
 
 class SentenceParser:
     def __init__(self, xml: OverlayXML):
+        """
+        The text of the XML is only extracted and split into sentences once per parser,
+        so the XML should not be changed while using the parser.
+        """
 
         self.xml = xml
 
+    @cached_property
+    def _regions_text(self) -> List[str]:
+        return self.xml.get_regions_text()
+
+    @cached_property
+    def _regions_lines_text(self) -> List[List[str]]:
+        return self.xml.get_regions_lines_text()
+
+    @cached_property
+    def _region_sentences(self) -> List[List[str]]:
+        return [_get_sentences(region) for region in self._regions_text]
+
     def get_region_sentences(self,
                              b_assert=False):
 
-        regions = self.xml.get_regions_text()
-
-        l_region_sentences = []
-        for region in regions:
-            region_sentences = _get_sentences(region)
-            l_region_sentences.append(region_sentences)
+        # Copy
+        l_region_sentences = [region_sentences[:] for region_sentences in self._region_sentences]
 
         if b_assert:  # Testing
             n_char_sentence = [[len(sent) for sent in region] for region in l_region_sentences]
 
-            region_lines = self.xml.get_regions_lines_text()
+            region_lines = self._regions_lines_text
             n_region_lines = [[len(l) for l in lines] for lines in region_lines]
 
             for i_region, (n_char, n_lines) in enumerate(zip(n_char_sentence, n_region_lines)):
@@ -135,78 +151,55 @@ class SentenceParser:
         Reverse operation: going from get_sentences() to get_region_sentences() again.
         """
 
-        # Copy
-        sentences = sentences[:]
-
-        region_sentences_orig = self.get_region_sentences()
-        assert len(sentences) == sum(len(sent_reg_orig) for sent_reg_orig in self.get_region_sentences()), \
+        region_sentences_orig = self._region_sentences
+        assert len(sentences) == sum(len(sent_reg_orig) for sent_reg_orig in region_sentences_orig), \
             'Sentences should be matched'
 
-        region_sentences = [[] for _ in region_sentences_orig]
-
-        for i, sent_orig_i in enumerate(region_sentences_orig):
-            region_sentences[i] = [sentences.pop(0) for _ in sent_orig_i]
+        it_sentences = iter(sentences)
+        region_sentences = [[next(it_sentences) for _ in sent_orig_i] for sent_orig_i in region_sentences_orig]
 
         return region_sentences
 
     def reconstruct_lines(self, sentences: List[str]):
         """
         Tries to construct the sentences back as close to the original structure of the text lines.
+        Each sentence is spread over the lines in proportion to how much the original sentence overlapped with them.
         """
 
-        region_sentences_orig = self.get_region_sentences()
+        region_sentences_orig = self._region_sentences
         region_sentences = self.group_sentences_per_region(sentences)
 
-        region_lines = self.xml.get_regions_lines_text()
+        region_lines = self._regions_lines_text
 
         region_lines_new = [[]] * len(region_lines)
 
         for i_region, (sentences_region, sentences_region_orig, lines_region) in enumerate(
                 zip(region_sentences, region_sentences_orig, region_lines)):
 
-            sentences_region_copy = sentences_region[:]
-            n_sent_reg_orig = list(map(len, sentences_region_orig))
-            n_sent_reg_new = list(map(len, sentences_region_copy))
-            n_lines_region = list(map(len, lines_region))
+            # Character offsets of the original sentences and lines within the region.
+            i_begin_sent, i_end_sent = _get_i_begin_end(list(map(len, sentences_region_orig)))
+            i_begin_line, i_end_line = _get_i_begin_end(list(map(len, lines_region)))
 
             lines_region_new = [[] for _ in range(len(lines_region))]
 
-            i_c_begin_line = 0
-            i_c_begin_sent = 0
-
-            # l_i_line = [0] +
-            # l_i_sent = [0] +
-
-            def get_i_begin_end(list_n, j):
-
-                i_begin = sum(list_n[:j]) + len(list_n[:max(0, j - 1)])
-                i_end = sum(list_n[:j + 1]) + len(list_n[:max(0, j)])
-
-                return i_begin, i_end
-
             # Per sentence
-            for j, (n_sent_reg_orig_j, sentences_region_j) in enumerate(zip(n_sent_reg_orig, sentences_region_copy)):
-
-                i_begin, i_end = get_i_begin_end(n_sent_reg_orig, j)
-
-                n_sent_i_over_lines = []
-                for k in range(len(n_lines_region)):
-                    i_begin_k, i_end_k = get_i_begin_end(n_lines_region, k)
+            for sentences_region_j, i_begin, i_end in zip(sentences_region, i_begin_sent, i_end_sent):
 
-                    # overlap
-                    i_begin_max = max(i_begin, i_begin_k)
-                    i_end_min = min(i_end, i_end_k)
-                    n_k = max(i_end_min - i_begin_max, 0)
-                    n_sent_i_over_lines.append(n_k)
+                # Both the begin and end offsets of the lines are sorted,
+                # so only the lines in [k_0, k_1) can overlap with the sentence.
+                k_0 = np.searchsorted(i_end_line, i_begin, side='right')
+                k_1 = np.searchsorted(i_begin_line, i_end, side='left')
 
-                p_sent_i_over_lines = np.array(n_sent_i_over_lines) / np.sum(n_sent_i_over_lines)
+                n_sent_i_over_lines = _get_overlap(i_begin, i_end, i_begin_line[k_0:k_1], i_end_line[k_0:k_1])
+                p_sent_i_over_lines = n_sent_i_over_lines / np.sum(n_sent_i_over_lines)
 
-                n_sent_i_over_lines_new = p_sent_i_over_lines * n_sent_reg_new[j]
+                n_sent_i_over_lines_new = p_sent_i_over_lines * len(sentences_region_j)
 
                 i_sent_i_over_lines_new = np.concatenate([[0.], np.cumsum(n_sent_i_over_lines_new)])
 
                 for i_line, (i_0, i_1) in enumerate(zip(i_sent_i_over_lines_new[:-1],
-                                                        i_sent_i_over_lines_new[1:])):
+                                                        i_sent_i_over_lines_new[1:]),
+                                                    start=k_0):
 
                     if i_0 == i_1:
                         continue  # length = 0
@@ -224,56 +217,53 @@ class SentenceParser:
 
                     lines_region_new[i_line].append(s_crop)
 
-                    # print(i_0, i_1)
-
-                # i_0
-                # i_1
-
-                # sentences_region_copy[j]
-
-                # lines_region_new = None # TODO
-
-            # n_sent_i_over_lines = []
-            # p_sent_i_over_lines = [] # Percentage that sentence is spread over each line.
+            region_lines_new[i_region] = [' '.join(lines) for lines in lines_region_new]
 
-            if 0:
-                for i_line, n_line in enumerate(n_lines_region):
-                    i_c_begin_line_next = i_c_begin_line + n_line + 1
+        return region_lines_new
 
-                    while i_c_begin_line <= i_c_begin_sent < i_c_begin_line_next:
-                        if len(sentences_region_copy) == 0:
-                            break
 
-                        lines_region_new[i_line].append(sentences_region_copy.pop(0))
-                        i_c_begin_sent_next = i_c_begin_sent + n_sent_reg_orig.pop(0) + 1
-                        i_c_begin_sent = i_c_begin_sent_next
+def translate_list(l_text, source, target, cache: SegmentCache = None):
+    """
+    Args:
+        l_text: List of sentences.
+        source: Source language
+        target: Target language
+        cache: (Optional) cache of machine translated segments.
+            Cached sentences are not sent to MT, new translations are added to the cache.
 
-                    i_c_begin_line = i_c_begin_line_next
+    Returns:
+        List with the translated sentences.
+    """
 
-            region_lines_new[i_region] = [' '.join(lines) for lines in lines_region_new]
+    cached = cache.get_many(source, target, l_text) if cache is not None else {}
+    # Repeated segments are only sent once.
+    l_segment_mt = [normalize_segment(text_i) for text_i in l_text if text_i not in cached]
+    l_segment_mt = [segment for segment in dict.fromkeys(l_segment_mt) if segment]
 
-            # TODO Cut a single sentence over multiple lines at the right place!
+    trans_segment_mt = {}
+    if l_segment_mt:
+        # send to MT
+        j = CONNECTOR.trans_doc_blocking(source, target, text_lines_to_document(l_segment_mt))
 
-            pass
+        trans_segment_mt = dict(zip(l_segment_mt, document_to_text_lines(j['content'])))
 
-        return region_lines_new
+    l_trans_text = [cached[text_i] if text_i in cached else trans_segment_mt.get(normalize_segment(text_i), '')
+                    for text_i in l_text]
 
+    if cache is not None:
+        cache.set_many(source, target, {text_i: trans_text_i for text_i, trans_text_i in zip(l_text, l_trans_text)
+                                        if text_i not in cached})
 
-def translate_list(l_text, source, target):
-    # translation
-    connector = ETranslationConnector(CEF_LOGIN, CEF_PASSW)
+    return l_trans_text
 
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        tmp_file = os.path.join(tmp_dir, 'tmp_text_lines.txt')
-        s_tmp = ''.join(text_i + '\n' for text_i in l_text)
-        with open(tmp_file, 'w') as f:
-            f.write(s_tmp)
-        # send to MT
-        j = connector.trans_doc_blocking(source, target, tmp_file)
 
-    l_trans_text = list(map(str.strip, j['content'].decode('UTF-8').splitlines()))
+def normalize_segment(text: str) -> str:
+    """
+    Collapses whitespace, such that segments that only differ in whitespace are translated once.
+    This also makes sure a segment fits on a single line of the document sent to MT.
+    """
 
-    return l_trans_text
+    return ' '.join(text.split())
 
 
 def tree_transunit_source_text_translation_iter(tree, source, target):
@@ -283,18 +273,38 @@ def tree_transunit_source_text_translation_iter(tree, source, target):
 
     """
 
-    connector = ETranslationConnector(CEF_LOGIN, CEF_PASSW)
-
     warnings.warn('No need to work with text when you can send in xliff for translation',
                   DeprecationWarning)
 
     for node_source in tree.xpath('''//*trans-unit/*[name()='source']'''):
         text = node_source.text
 
-        translated_text = connector.trans_snippet_blocking(text, source, target)
+        translated_text = CONNECTOR.trans_snippet_blocking(text, source, target)
 
         yield translated_text
 
 
 def _get_sentences(text):
     return sent_tokenize(text)
+
+
+def _get_i_begin_end(list_n):
+    """
+    Begin and end character offset of each text segment, with list_n the length of each segment.
+    """
+
+    i_cum = np.concatenate([[0], np.cumsum(list_n, dtype=int)])
+    j = np.arange(len(list_n))
+
+    i_begin = i_cum[:-1] + np.maximum(j - 1, 0)
+    i_end = i_cum[1:] + j
+
+    return i_begin, i_end
+
+
+def _get_overlap(i_begin, i_end, i_begin_k, i_end_k):
+    """
+    Amount of characters that [i_begin, i_end) overlaps with each of the segments [i_begin_k, i_end_k).
+    """
+
+    return np.maximum(np.minimum(i_end, i_end_k) - np.maximum(i_begin, i_begin_k), 0)